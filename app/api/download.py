@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+from functools import partial
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.core.config import get_settings
+from app.core.executor import run_blocking
+from app.core.session_status import session_status_manager
+from app.services.gcs import get_storage_client
+from app.services.zip_export import ZipEntry, ZipLayout, iter_live_zip
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+settings = get_settings()
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _read_file_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _read_blob_range(blob, start: int, end: int) -> bytes:
+    # GCSの範囲指定は end を含む
+    return blob.download_as_bytes(start=start, end=end - 1)
+
+
+def _list_local_images(session_id: str) -> List[ZipEntry]:
+    """ローカルのセッションの画像を一覧する（書き込み途中の一時ファイルは除く）"""
+    images_dir = os.path.join(settings.get_session_dirpath(session_id), "images")
+    if not os.path.isdir(images_dir):
+        return []
+    entries = []
+    with os.scandir(images_dir) as it:
+        for item in it:
+            if item.name.startswith(".") or not item.is_file():
+                continue
+            stat = item.stat()
+            entries.append(ZipEntry(
+                name=item.name,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                key=(item.path, stat.st_size, stat.st_mtime_ns),
+                read=partial(_read_file_range, item.path),
+            ))
+    return sorted(entries, key=lambda entry: entry.name)
+
+
+def _list_gcs_images(session_id: str) -> List[ZipEntry]:
+    """
+    GCS_BUCKET_IMAGE からセッションの画像を一覧する
+
+    画像名はセッションIDを含まない連番のため、セッションに割り当てた番号の範囲で絞り込む
+    （7桁ゼロ埋めなので名前の辞書順と番号順が一致する）
+    """
+    image_range = session_status_manager.get_image_range(session_id)
+    if image_range is None or image_range[0] >= image_range[1]:
+        return []
+    start, end = image_range
+    bucket = get_storage_client().bucket(settings.gcs_bucket_image)
+    entries = []
+    for blob in bucket.list_blobs(start_offset=f"{start:07d}", end_offset=f"{end:07d}"):
+        updated = blob.updated.timestamp() if blob.updated else 0.0
+        entries.append(ZipEntry(
+            name=blob.name,
+            size=blob.size,
+            mtime=updated,
+            key=(settings.gcs_bucket_image, blob.name, blob.generation),
+            read=partial(_read_blob_range, blob),
+        ))
+    return sorted(entries, key=lambda entry: entry.name)
+
+
+async def _list_session_images(session_id: str) -> List[ZipEntry]:
+    if settings.gcp_region == "local":
+        return await run_blocking(_list_local_images, session_id)
+    return await run_blocking(_list_gcs_images, session_id)
+
+
+def _is_finished(session_id: str) -> bool:
+    status = session_status_manager.get_status(session_id)
+    return status is None or status.status in ["completed", "error"]
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Rangeヘッダーを解析する（単一の範囲のみ対応、複数範囲の場合は全体を返すためNone）
+
+    Returns:
+        Optional[Tuple[int, int]]: (開始位置, 終了位置(含まない))
+
+    Raises:
+        ValueError: 範囲がファイル外の場合
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # 末尾から last バイト
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise ValueError(header)
+    return start, end
+
+
+@router.get("/download/{session_id}")
+async def download_session_images(session_id: str, request: Request):
+    """
+    セッションの変換済み画像を無圧縮のZIPとしてストリーミングする
+
+    変換中のセッションは、生成された画像から順に送信し、変換が終わった時点でZIPを閉じる（範囲指定不可）。
+    変換が終わったセッションは Content-Length・ETag を返し、Range / If-Range による途中からの再開に対応する。
+    いずれもアーカイブをディスク・メモリ上に作らず、画像を読みながら送信する
+    """
+    if session_status_manager.get_status(session_id) is None:
+        raise HTTPException(status_code=404, detail="セッションが見つかりません")
+    headers = {"Content-Disposition": f'attachment; filename="{session_id}.zip"'}
+
+    if not _is_finished(session_id):
+        async def wait_for_more() -> bool:
+            version = session_status_manager.get_version(session_id)
+            if _is_finished(session_id):
+                return False
+            await session_status_manager.wait_for_change(session_id, version, settings.sse_heartbeat_interval)
+            return True
+
+        logger.info(f"Streaming images of session {session_id} while converting")
+        headers["Accept-Ranges"] = "none"
+        return StreamingResponse(
+            iter_live_zip(partial(_list_session_images, session_id), wait_for_more, settings.upload_chunk_size),
+            media_type="application/zip",
+            headers=headers,
+        )
+
+    layout = ZipLayout(await _list_session_images(session_id))
+    headers["Accept-Ranges"] = "bytes"
+    headers["ETag"] = layout.etag
+    start, end = 0, layout.size
+    status_code = 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range が現在のZIPと一致しない場合（画像が変わった場合）は全体を返す
+    if range_header and (if_range is None or if_range == layout.etag):
+        try:
+            requested = _parse_range(range_header, layout.size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{layout.size}", **headers})
+        if requested is not None:
+            start, end = requested
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{layout.size}"
+    headers["Content-Length"] = str(end - start)
+    logger.info(f"Streaming ZIP of session {session_id}: {len(layout.entries)} images, bytes {start}-{end - 1}/{layout.size}")
+    return StreamingResponse(
+        layout.iter_range(start, end, settings.upload_chunk_size),
+        status_code=status_code,
+        media_type="application/zip",
+        headers=headers,
+    )
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import APIRouter, HTTPException, Request, UploadFile, File
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from app.models.schemas import UploadRequest, SessionRequest, SessionResponse, UploadResponse, SessionStatus, JobStatus, NotifyUploadCompleteRequest
 from app.services.storage import (
     generate_session_url,
@@ -8,27 +8,38 @@ from app.services.storage import (
 )
 import os
 from app.core.config import get_settings
+from app.core.executor import run_blocking
 from datetime import datetime, timedelta
 import json
 import asyncio
 from fastapi import BackgroundTasks
+from starlette.requests import ClientDisconnect
 from urllib.parse import unquote
 from app.core.job_status import job_status_manager
 from app.core.session_status import session_status_manager
-from app.services.converter import convert_pdfs_to_images
+from app.core.state_store import default_state_store
+from app.services.converter import convert_pdfs_to_images, resolve_encode_options
+from app.services.downloader import ParallelDownloader
+from app.services.archive import ZipArchive, is_archive, is_supported_upload
+from app.services.gcs import get_storage_client
+from app.services.ingest import SessionIngest, ingest_manager
+from app.services.renderer import EncodeOptions
+from app.services.local_upload import (
+    UploadOffsetMismatchError,
+    UploadTooLargeError,
+    append_stream,
+    complete_upload,
+    file_sha256,
+    iter_upload_file,
+    parse_content_range,
+    received_bytes,
+    save_stream,
+)
 import logging
 from typing import Optional, List
 import uuid
 import traceback
-
-# google-cloud-storage is optional in local mode
-gcs_client = None
-gcs_available = False
-try:
-    import google.cloud.storage
-    gcs_available = True
-except ImportError:  # pragma: no cover - optional dependency
-    pass
+from dataclasses import asdict
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -37,8 +48,47 @@ router = APIRouter()
 local_router = APIRouter()
 settings = get_settings()
 
-# 複数のファイルを処理するための辞書
-pending_files = {}
+# 一括変換で、ジョブのファイルが揃うのを待っている間のファイル情報（状態ストアに保持し、複数ワーカーで共有する）
+_PENDING_FILES_NAMESPACE = "pending_files"
+pending_file_store = default_state_store()
+
+# 逐次変換中のセッションのダウンローダー（クラウドモード）
+session_downloaders = {}
+
+def _incremental_conversion_enabled() -> bool:
+    """
+    逐次変換を使うか
+
+    逐次変換の受付状態（アップロード順の枠・到着通知）はプロセス内にしか持たないため、
+    状態ストアを複数ワーカーで共有する構成（STATE_BACKEND=memory 以外）では、別のワーカーに届いた
+    ファイルを取りこぼしたり同じセッションを二重に変換したりしないよう一括変換に切り替える
+    """
+    return settings.incremental_conversion and settings.state_backend == "memory"
+
+if settings.incremental_conversion and not _incremental_conversion_enabled():
+    logger.warning(f"INCREMENTAL_CONVERSION is not supported with STATE_BACKEND={settings.state_backend}, falling back to batch conversion")
+
+def _encode_options(format: str, quality: Optional[int], subsampling: Optional[str], progressive: Optional[bool]) -> EncodeOptions:
+    """リクエストのエンコード設定を解決して検証する（不正な場合は400）"""
+    encoding = resolve_encode_options(quality, subsampling, progressive)
+    try:
+        encoding.validate(format)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return encoding
+
+def _get_pending_files(job_id: str) -> Optional[List[dict]]:
+    """ジョブのファイルが揃うのを待っているファイル情報を取得（待っていない場合はNone）"""
+    value = pending_file_store.get(_PENDING_FILES_NAMESPACE, job_id)
+    return json.loads(value) if value is not None else None
+
+def _add_pending_file(job_id: str, file_info: dict):
+    """待っているファイル情報を追加する（複数ワーカーから同時に追加しても取りこぼさないようアトミックに更新する）"""
+    pending_file_store.update(
+        _PENDING_FILES_NAMESPACE,
+        job_id,
+        lambda value: json.dumps((json.loads(value) if value is not None else []) + [file_info]),
+    )
 
 def get_session_image_num(session_id: str) -> int:
     """
@@ -48,7 +98,43 @@ def get_session_image_num(session_id: str) -> int:
     current_session_status = session_status_manager.get_status(session_id)
     return current_session_status.image_num if current_session_status else 0
 
-async def convert_and_notify(session_id: str, job_ids: List[str], dpi: int = 300, format: str = "jpeg", max_retries: int = 3):
+def _list_blobs(bucket, prefix: Optional[str] = None, max_results: Optional[int] = None) -> list:
+    """バケット内のBlob一覧を取得（ブロッキング）"""
+    return list(bucket.list_blobs(prefix=prefix, max_results=max_results))
+
+async def _list_job_blobs(bucket, session_id: str, job_id: str, max_retries: int) -> list:
+    """
+    ジョブのアップロード済みファイルを取得する（見つからない場合は指数バックオフで再試行）
+    
+    Returns:
+        list: 見つかったBlobのリスト（最大回数まで再試行しても見つからない場合は空）
+    """
+    prefix = f"{session_id}/{job_id}/"
+    for retry_count in range(max_retries + 1):
+        try:
+            blobs = await run_blocking(_list_blobs, bucket, prefix=prefix)
+            if blobs:
+                return blobs
+            logger.warning(f"No files found in GCS at {prefix}")
+            all_blobs = await run_blocking(_list_blobs, bucket, max_results=10)
+            for b in all_blobs:  # Show first 10 blobs
+                logger.info(f"Found blob: {b.name}")
+        except Exception as e:
+            logger.error(f"Error listing files in GCS: {str(e)}")
+        if retry_count < max_retries:
+            logger.info(f"Retrying ({retry_count + 1}/{max_retries})...")
+            await asyncio.sleep(2 ** (retry_count + 1))  # 指数バックオフ
+    logger.error(f"Max retries reached for {job_id}, skipping")
+    return []
+
+async def convert_and_notify(
+    session_id: str,
+    job_ids: List[str],
+    dpi: int = 300,
+    format: str = "jpeg",
+    max_retries: int = 3,
+    encoding: Optional[EncodeOptions] = None,
+):
     """
     PDFファイルを変換し、進捗状況を通知する
     
@@ -58,78 +144,45 @@ async def convert_and_notify(session_id: str, job_ids: List[str], dpi: int = 300
         dpi: 出力画像のDPI
         format: 出力画像のフォーマット
         max_retries: リトライ回数の最大値
+        encoding: 画像のエンコード設定（未指定の場合は設定値）
     """
     try:
         logger.info(f"Starting PDF conversion for session: {session_id}, job_ids: {job_ids}")
         
-        local_pdf_paths = []
+        pdf_sources = []  # PDFファイルのパス・ZIPアーカイブ、またはダウンロード中のタスク
+        downloads = []  # ダウンロード中のタスク
+        on_pdf_done = None  # 変換が終わったPDFの解放処理
         
         # Check if we're in cloud mode or local mode
         logger.info(f"Current GCP region: {settings.gcp_region}")
         
         if settings.gcp_region != "local":
             logger.info("Running in cloud mode, attempting to download files from GCS")
-            if not gcs_available:
-                logger.warning("Google Cloud Storage module is not available, cannot access GCS")
-            else:
+            # 共有クライアントを使い回す（ジョブ・リトライごとに認証・接続をやり直さない）
+            client = await run_blocking(get_storage_client)
+            bucket = client.bucket(settings.gcs_bucket_works)
+            job_blobs = await asyncio.gather(
+                *(_list_job_blobs(bucket, session_id, job_id, max_retries) for job_id in job_ids)
+            )
+            blobs = [blob for blobs_of_job in job_blobs for blob in blobs_of_job]
+            
+            if blobs:
+                local_dir = os.path.join(settings.get_session_dirpath(session_id), "pdfs")
+                os.makedirs(local_dir, exist_ok=True)
+                local_paths = [os.path.join(local_dir, blob.name.split("/")[-1]) for blob in blobs]
                 
-                for job_id in job_ids:
-                    retry_count = 0
-                    success = False
-                    
-                    while not success and retry_count <= max_retries:
-                        try:
-                            with open(settings.gcp_keypath, "r") as f:
-                                credentials_info = json.load(f)
-                            if not gcs_available:
-                                logger.error("Google Cloud Storage module is not available, cannot initialize client")
-                                raise RuntimeError("Google Cloud Storage module is not available, cannot initialize client")
-                                
-                            client = google.cloud.storage.Client.from_service_account_info(credentials_info)
-                            logger.info(f"GCS client initialized for project: {client.project}")
-                            
-                            bucket = client.bucket(settings.gcs_bucket_works)
-                            blobs = list(bucket.list_blobs(prefix=f"{session_id}/{job_id}/"))
-                            
-                            if not blobs:
-                                logger.warning(f"No files found in GCS at {session_id}/{job_id}/")
-                                all_blobs = list(bucket.list_blobs())
-                                logger.info(f"Total blobs in bucket: {len(all_blobs)}")
-                                for b in all_blobs[:10]:  # Show first 10 blobs
-                                    logger.info(f"Found blob: {b.name}")
-                                    
-                                retry_count += 1
-                                if retry_count <= max_retries:
-                                    logger.info(f"Retrying ({retry_count}/{max_retries})...")
-                                    await asyncio.sleep(2 ** retry_count)  # 指数バックオフ
-                                    continue
-                                else:
-                                    logger.error(f"Max retries reached for {job_id}, skipping")
-                                    break
-                            
-                            for blob in blobs:
-                                filename = blob.name.split("/")[-1]
-                                local_dir = os.path.join(settings.get_session_dirpath(session_id), "pdfs")
-                                os.makedirs(local_dir, exist_ok=True)
-                                local_path = os.path.join(local_dir, filename)
-                                
-                                logger.info(f"Downloading {blob.name} from GCS to {local_path}")
-                                blob.download_to_filename(local_path)
-                                local_pdf_paths.append(local_path)
-                            
-                            success = True
-                            
-                        except FileNotFoundError as exc:
-                            logger.error(f"GCP key file not found: {settings.gcp_keypath}")
-                            raise FileNotFoundError(f"GCP key file not found: {settings.gcp_keypath}") from exc
-                        except Exception as e:
-                            logger.error(f"Error downloading file from GCS: {str(e)}")
-                            retry_count += 1
-                            if retry_count <= max_retries:
-                                logger.info(f"Retrying ({retry_count}/{max_retries})...")
-                                await asyncio.sleep(2 ** retry_count)  # 指数バックオフ
-                            else:
-                                logger.error(f"Max retries reached for {job_id}, skipping")
+                # 全ファイルのダウンロードを並行して開始し、届いたPDFから順に変換を始める
+                # （変換が終わったPDFはすぐに削除し、手元に保持するPDFは PDF_CONCURRENCY + DOWNLOAD_AHEAD 個までに抑える）
+                downloader = _create_downloader(max_retries)
+                logger.info(f"Downloading {len(blobs)} files from GCS with {settings.download_workers} workers")
+                downloads = downloader.start(blobs, local_paths)
+                on_pdf_done = downloader.release
+                # ZIPアーカイブは格納されたPDFを1つずつ展開して変換する（展開し終えたらアーカイブを削除）
+                pdf_sources = [
+                    ZipArchive(download, os.path.basename(local_path), on_done=downloader.release)
+                    if is_archive(local_path) else download
+                    for download, local_path in zip(downloads, local_paths)
+                ]
         else:
             local_dir = os.path.join(settings.get_session_dirpath(session_id), "pdfs")
             if not os.path.exists(local_dir):
@@ -141,13 +194,13 @@ async def convert_and_notify(session_id: str, job_ids: List[str], dpi: int = 300
                 for job_id in job_ids:
                     for filename in os.listdir(local_dir):
                         local_path = os.path.join(local_dir, filename)
-                        if os.path.isfile(local_path) and filename.lower().endswith('.pdf'):
+                        if os.path.isfile(local_path) and is_supported_upload(filename):
                             logger.info(f"Found PDF file: {local_path}")
-                            local_pdf_paths.append(local_path)
+                            pdf_sources.append(_as_source(local_path))
             else:
                 logger.warning(f"Local directory {local_dir} does not exist or is empty")
         
-        if not local_pdf_paths:
+        if not pdf_sources:
             error_message = "変換するPDFファイルが見つかりませんでした"
             logger.error(error_message)
             
@@ -169,7 +222,13 @@ async def convert_and_notify(session_id: str, job_ids: List[str], dpi: int = 300
             return
         
         conversion_job_id = str(uuid.uuid4())
-        await convert_pdfs_to_images(session_id, conversion_job_id, local_pdf_paths, dpi)
+        try:
+            await convert_pdfs_to_images(session_id, conversion_job_id, pdf_sources, dpi, format, on_pdf_done=on_pdf_done, encoding=encoding)
+        finally:
+            # 変換が中断された場合は残りのダウンロードも止める
+            for download in downloads:
+                download.cancel()
+            await asyncio.gather(*downloads, return_exceptions=True)
         
         logger.info(f"PDF conversion completed for session: {session_id}")
     except Exception as e:
@@ -192,7 +251,14 @@ async def convert_and_notify(session_id: str, job_ids: List[str], dpi: int = 300
             )
         )
 
-async def convert_and_notify_single(session_id: str, job_id: str, pdf_paths: List[str], dpi: int, format: str = "jpg"):
+async def convert_and_notify_single(
+    session_id: str,
+    job_id: str,
+    pdf_paths: List[str],
+    dpi: int,
+    format: str = "jpeg",
+    encoding: Optional[EncodeOptions] = None,
+):
     """PDFを変換し、進捗を通知するバックグラウンドタスク（エラーハンドリング付き）"""
     try:
         logger.info(f"Starting background task to convert PDFs for session_id: {session_id}, job_id: {job_id}")
@@ -214,7 +280,8 @@ async def convert_and_notify_single(session_id: str, job_id: str, pdf_paths: Lis
             job_id=job_id,
             pdf_paths=pdf_paths,
             dpi=dpi,
-            format=format
+            format=format,
+            encoding=encoding,
         )
         
         logger.info(f"PDF conversion completed for job_id: {job_id}")
@@ -262,6 +329,111 @@ async def convert_and_notify_single(session_id: str, job_id: str, pdf_paths: Lis
             )
         )
 
+def _as_source(path: str):
+    """ローカルのファイルを変換の入力にする（ZIPアーカイブは格納されたPDFを1つずつ展開する）"""
+    return ZipArchive(path, os.path.basename(path)) if is_archive(path) else path
+
+def _create_downloader(max_retries: int) -> ParallelDownloader:
+    """アップロード済みPDFをGCSから取得するダウンローダーを作成する"""
+    return ParallelDownloader(
+        workers=settings.download_workers,
+        chunk_size=settings.download_chunk_size,
+        max_retries=max_retries,
+        memory_threshold=settings.pdf_memory_threshold,
+        max_pending=max(1, settings.pdf_concurrency) + settings.download_ahead,
+    )
+
+def _get_or_start_ingest(session_id: str, dpi: int, format: str, encoding: EncodeOptions) -> SessionIngest:
+    """
+    セッションの逐次変換を取得する（未開始の場合は開始する）
+
+    変換タスクはアップロードの受付と並行して動き、PDFが届くたびにアップロード順で変換を進める
+    """
+    ingest = ingest_manager.get(session_id)
+    if ingest is not None and not ingest.closed:
+        return ingest
+    on_pdf_done = None
+    if settings.gcp_region != "local":
+        downloader = _create_downloader(settings.upload_max_retries)
+        session_downloaders[session_id] = downloader
+        on_pdf_done = downloader.release
+    # 署名付きURLの有効期限を過ぎて発行されるアップロードはないため、それを次の枠を待つ上限とする。
+    # 枠を確保したファイルの到着は、後続のファイルの変換を止めないよう短い上限で待つ
+    ingest = ingest_manager.create(session_id, settings.sign_url_exp, on_pdf_done, settings.ingest_arrival_timeout)
+    ingest.task = asyncio.create_task(convert_incrementally(session_id, ingest, dpi, format, encoding))
+    return ingest
+
+async def _notify_arrival(ingest: SessionIngest, session_id: str, job_id: str, max_retries: int) -> bool:
+    """
+    ジョブのPDFが届いたことを逐次変換へ通知する（ローカルモードは保存先、クラウドモードはダウンロードを開始）
+
+    Returns:
+        bool: 通知できた場合はTrue（通知済みの場合もTrue）
+    """
+    if ingest.has_arrived(job_id):
+        return True
+    if settings.gcp_region == "local":
+        job_dir = settings.get_storage_path(session_id, job_id)
+        pdfs = sorted(f for f in os.listdir(job_dir) if is_supported_upload(f)) if os.path.isdir(job_dir) else []
+        if not pdfs:
+            return False
+        return ingest.arrived(job_id, os.path.join(job_dir, pdfs[0]))
+    client = await run_blocking(get_storage_client)
+    bucket = client.bucket(settings.gcs_bucket_works)
+    blobs = await _list_job_blobs(bucket, session_id, job_id, max_retries)
+    if not blobs or ingest.has_arrived(job_id):
+        return ingest.has_arrived(job_id)
+    local_dir = os.path.join(settings.get_session_dirpath(session_id), "pdfs")
+    os.makedirs(local_dir, exist_ok=True)
+    # 1ジョブ1ファイルのため先頭のオブジェクトを使う
+    blob = blobs[0]
+    downloader = session_downloaders[session_id]
+    local_path = os.path.join(local_dir, blob.name.split("/")[-1])
+    # ダウンロードはアップロード順で前のファイルのダウンロードが始まってから開始する
+    return ingest.arrived(job_id, lambda: downloader.start([blob], [local_path])[0])
+
+async def convert_incrementally(
+    session_id: str,
+    ingest: SessionIngest,
+    dpi: int = 300,
+    format: str = "jpeg",
+    encoding: Optional[EncodeOptions] = None,
+):
+    """
+    アップロード中のセッションのPDFを届いたものから変換するバックグラウンドタスク
+
+    画像番号はアップロードURLを発行した順に割り当てるため、到着順に関わらず一括変換と同じ番号になる
+    """
+    try:
+        logger.info(f"Starting incremental PDF conversion for session: {session_id}")
+        conversion_job_id = str(uuid.uuid4())
+        await convert_pdfs_to_images(session_id, conversion_job_id, ingest, dpi, format, on_pdf_done=ingest.release, encoding=encoding)
+        logger.info(f"Incremental PDF conversion completed for session: {session_id}")
+    except Exception as e:
+        error_message = f"PDF変換中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        
+        # 現在のセッション状態を取得して開始番号を保持
+        start_image_num = get_session_image_num(session_id)
+        
+        session_status_manager.update_status(
+            session_id,
+            SessionStatus(
+                session_id=session_id,
+                status="error",
+                message=error_message,
+                progress=0,
+                pdf_num=0,
+                image_num=start_image_num,  # 開始番号を保持
+                created_at=datetime.now()
+            )
+        )
+    finally:
+        ingest.close()
+        if ingest_manager.get(session_id) is ingest:
+            ingest_manager.remove(session_id)
+            session_downloaders.pop(session_id, None)
+
 @router.post("/session", response_model=SessionResponse)
 def get_session_id(request: SessionRequest):
     try:
@@ -290,11 +462,21 @@ def get_session_id(request: SessionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload-url", response_model=UploadResponse)
-async def get_upload_url(request: UploadRequest):
-    """PDFアップロード用の署名付きURLを取得"""
+async def get_upload_url(request: UploadRequest, http_request: Request):
+    """PDFアップロード用の署名付きURLを取得（resumable=True の場合は再開可能アップロードのURL）"""
+    format = request.format or "jpeg"
+    encoding = _encode_options(format, request.quality, request.subsampling, request.progressive)
     try:
         session_id = request.session_id
-        upload_url, job_id = generate_upload_url(request.filename, session_id, request.content_type)
+        upload_url, job_id = await run_blocking(
+            generate_upload_url,
+            request.filename,
+            session_id,
+            request.content_type,
+            request.resumable,
+            request.size,
+            http_request.headers.get("origin"),
+        )
         # 新しいジョブのステータスを初期化
         initial_status = JobStatus(
             session_id=session_id,
@@ -306,46 +488,78 @@ async def get_upload_url(request: UploadRequest):
         )
         job_status_manager.update_status(job_id, initial_status)
         
-        # ファイル情報を保存
-        if job_id not in pending_files:
-            pending_files[job_id] = []
-        pending_files[job_id].append({
-            "filename": request.filename,
-            "content_type": request.content_type,
-            "dpi": request.dpi,
-            "format": request.format
-        })
+        if _incremental_conversion_enabled():
+            # URLを発行した順（アップロード順）に変換の枠を確保し、届いたファイルから変換を始める
+            _get_or_start_ingest(session_id, request.dpi, format, encoding).register(job_id, request.filename)
+        else:
+            # ファイル情報を保存
+            _add_pending_file(job_id, {
+                "filename": request.filename,
+                "content_type": request.content_type,
+                "dpi": request.dpi,
+                "format": format,
+                "encoding": asdict(encoding),
+            })
         
         return UploadResponse(
             upload_url=upload_url,
             session_id=session_id,
-            job_id=job_id
+            job_id=job_id,
+            resumable=request.resumable
         )
     except Exception as e:
         logger.error(f"アップロードURL生成エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _session_status_to_dict(status: SessionStatus) -> dict:
+    return {
+        "status": status.status,
+        "message": status.message,
+        "progress": status.progress,
+        "created_at": status.created_at.isoformat() if status.created_at else None
+    }
+
+def _job_status_to_dict(status: JobStatus) -> dict:
+    return {
+        "status": status.status,
+        "message": status.message,
+        "progress": status.progress,
+        "created_at": status.created_at.isoformat() if status.created_at else None,
+        "stage_timings": status.stage_timings,
+        "error": status.error,
+        "failed_uploads": status.failed_uploads
+    }
+
+async def _status_event_stream(manager, key: str, to_dict):
+    """
+    ステータスが更新された時だけ、前回送信分からの差分をSSEで送信する
+    
+    最初のイベントは全項目を送信し、以降は変化した項目のみを送信する。
+    変化がないまま SSE_HEARTBEAT_INTERVAL 秒経過した場合はコメント行をハートビートとして送信する
+    """
+    version = manager.get_version(key)
+    last_sent = {}
+    while True:
+        status = manager.get_status(key)
+        if status is None:
+            break
+        current = to_dict(status)
+        delta = {k: v for k, v in current.items() if k not in last_sent or last_sent[k] != v}
+        if delta:
+            yield f"data: {json.dumps(delta)}\n\n"
+            last_sent = current
+        if status.status in ["completed", "error"]:
+            break
+        new_version = await manager.wait_for_change(key, version, settings.sse_heartbeat_interval)
+        if new_version == version:
+            yield ": heartbeat\n\n"
+        version = new_version
+
 @router.get("/session-status/{session_id}")
 async def get_session_status(session_id: str):
     """セッションのステータスを取得（SSE）"""
-    async def event_generator():
-        while True:
-            status = session_status_manager.get_status(session_id)
-            if status is None:
-                break
-            status_dict = {
-                "status": status.status,
-                "message": status.message,
-                "progress": status.progress,
-                "created_at": status.created_at.isoformat() if status.created_at else None
-            }
-            yield f"data: {json.dumps(status_dict)}\n\n"
-            if status.status in ["completed", "error"]:
-                break
-            await asyncio.sleep(1)
-    
     return StreamingResponse(
-        event_generator(),
+        _status_event_stream(session_status_manager, session_id, _session_status_to_dict),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -356,24 +570,8 @@ async def get_session_status(session_id: str):
 @router.get("/job-status/{job_id}")
 async def get_job_status(job_id: str):
     """ジョブのステータスを取得（SSE）"""
-    async def event_generator():
-        while True:
-            status = job_status_manager.get_status(job_id)
-            if status is None:
-                break
-            status_dict = {
-                "status": status.status,
-                "message": status.message,
-                "progress": status.progress,
-                "created_at": status.created_at.isoformat() if status.created_at else None
-            }
-            yield f"data: {json.dumps(status_dict)}\n\n"
-            if status.status in ["completed", "error"]:
-                break
-            await asyncio.sleep(1)
-    
     return StreamingResponse(
-        event_generator(),
+        _status_event_stream(job_status_manager, job_id, _job_status_to_dict),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -381,7 +579,7 @@ async def get_job_status(job_id: str):
         }
     )
 
-@local_router.post("/local-upload/{session_id}/{job_id}/{filename}")
+@local_router.post("/local-upload/{session_id}/{job_id}/{filename}", deprecated=True)
 async def local_upload(
     session_id: str,
     job_id: str,
@@ -389,76 +587,208 @@ async def local_upload(
     file: UploadFile = File(...),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
-    """ローカルファイルアップロードエンドポイント"""
-    try:
-        # URLデコードされたファイル名を取得
-        decoded_filename = unquote(filename)
-        logger.info(f"ファイルアップロード開始: {decoded_filename}")
-        
-        # ファイルの保存先パスを設定
-        upload_path = os.path.join(settings.get_storage_path(session_id, job_id), decoded_filename)
-        os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-        
-        # ファイルを保存
-        with open(upload_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        # ジョブステータスを更新
-        job_status = JobStatus(
-            session_id=session_id,
-            job_id=job_id,
-            status="processing",
-            message="ファイルをアップロードしました。変換を開始します。",
-            progress=0,
-            created_at=datetime.now()
-        )
-        job_status_manager.update_status(job_id, job_status)
+    """
+    ローカルファイルアップロードエンドポイント（multipart/form-data、旧クライアント向け）
+
+    multipart/form-data はStarletteがファイル全体を一時ファイルへ書き出してから呼ばれるため、
+    サイズの上限はその後にしか確認できない。アップロードURL（/api/upload-url）はPUTのエンドポイントを返し、
+    フロントエンドもPUTで送信する
+    """
+    return await _save_local_upload(
+        session_id, job_id, filename, iter_upload_file(file, settings.upload_chunk_size), background_tasks
+    )
+
+@local_router.put("/local-upload/{session_id}/{job_id}/{filename}")
+async def local_upload_raw(
+    session_id: str,
+    job_id: str,
+    filename: str,
+    request: Request,
+    background_tasks: BackgroundTasks
+):
+    """ローカルファイルアップロードエンドポイント（リクエストボディにファイルをそのまま送る、署名付きURLへのPUTと同じ形式）"""
+    content_length = request.headers.get("content-length")
+    if settings.max_upload_size and content_length and content_length.isdigit() and int(content_length) > settings.max_upload_size:
+        raise HTTPException(status_code=413, detail=f"ファイルサイズが上限（{settings.max_upload_size}バイト）を超えています")
+    return await _save_local_upload(session_id, job_id, filename, request.stream(), background_tasks)
+
+def _local_upload_path(session_id: str, job_id: str, filename: str) -> str:
+    """URLエンコードされたファイル名からローカルの保存先パスを求める（ディレクトリを含む名前は400）"""
+    decoded_filename = unquote(filename)
+    if not decoded_filename or os.path.basename(decoded_filename) != decoded_filename:
+        raise HTTPException(status_code=400, detail="不正なファイル名です")
+    upload_path = os.path.join(settings.get_storage_path(session_id, job_id), decoded_filename)
+    os.makedirs(os.path.dirname(upload_path), exist_ok=True)
+    return upload_path
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"ファイルサイズが上限（{max_bytes}バイト）を超えています")
+
+def _local_upload_failed(session_id: str, job_id: str, e: Exception) -> HTTPException:
+    """アップロード失敗をジョブステータスに記録し、返すべきエラーを作成する"""
+    logger.error(f"アップロードエラー: {str(e)}")
+    error_status = JobStatus(
+        session_id=session_id,
+        job_id=job_id,
+        status="error",
+        message=f"アップロード中にエラーが発生しました: {str(e)}",
+        progress=0,
+        created_at=datetime.now()
+    )
+    job_status_manager.update_status(job_id, error_status)
+    return HTTPException(
+        status_code=500,
+        detail=f"ファイルのアップロード中にエラーが発生しました: {str(e)}"
+    )
+
+def _on_local_upload_saved(session_id: str, job_id: str, upload_path: str, background_tasks: BackgroundTasks) -> None:
+    """ファイルの保存完了をジョブステータスに反映し、ジョブのファイルが揃ったら変換を開始する"""
+    job_status = JobStatus(
+        session_id=session_id,
+        job_id=job_id,
+        status="processing",
+        message="ファイルをアップロードしました。変換を開始します。",
+        progress=0,
+        created_at=datetime.now()
+    )
+    job_status_manager.update_status(job_id, job_status)
+    
+    # 逐次変換中のセッションでは、届いたファイルをアップロード順の枠へ渡す
+    ingest = ingest_manager.get(session_id)
+    if ingest is not None and job_id in ingest.job_ids:
+        ingest.arrived(job_id, upload_path)
+        return
+    
+    # このジョブのすべてのファイルがアップロードされたかチェック
+    pending = _get_pending_files(job_id)
+    if pending is not None:
+        # アップロード済みのファイル数をカウント（受信途中の .part は含まない）
+        uploaded_files = [f for f in os.listdir(settings.get_storage_path(session_id, job_id)) 
+                        if is_supported_upload(f)]
         
-        # このジョブのすべてのファイルがアップロードされたかチェック
-        if job_id in pending_files:
-            # アップロード済みのファイル数をカウント
-            uploaded_files = [f for f in os.listdir(settings.get_storage_path(session_id, job_id)) 
-                            if f.lower().endswith('.pdf')]
+        # すべてのファイルがアップロードされた場合、変換処理を開始
+        # （ファイル情報を削除できたワーカーだけが変換を開始する）
+        if len(uploaded_files) == len(pending) and pending_file_store.delete(_PENDING_FILES_NAMESPACE, job_id):
+            # 保存されたファイルのパスを取得
+            file_paths = [os.path.join(settings.get_storage_path(session_id, job_id), f) for f in uploaded_files]
             
-            # すべてのファイルがアップロードされた場合、変換処理を開始
-            if len(uploaded_files) == len(pending_files[job_id]):
-                # 保存されたファイルのパスを取得
-                file_paths = [os.path.join(settings.get_storage_path(session_id, job_id), f) for f in uploaded_files]
-                
-                # PDFファイルを処理
-                pdf_files = [f for f in file_paths if f.lower().endswith('.pdf')]
-                
-                if pdf_files:
-                    background_tasks.add_task(
-                        convert_and_notify_single,
-                        session_id=session_id,
-                        job_id=job_id,
-                        pdf_paths=pdf_files,
-                        dpi=pending_files[job_id][0].get('dpi', 300),
-                        format=pending_files[job_id][0].get('format', 'jpg')
-                    )
-                
-                # 処理済みのファイル情報を削除
-                del pending_files[job_id]
+            # PDFファイル・ZIPアーカイブを処理
+            pdf_files = [_as_source(f) for f in file_paths if is_supported_upload(f)]
+            
+            if pdf_files:
+                background_tasks.add_task(
+                    convert_and_notify_single,
+                    session_id=session_id,
+                    job_id=job_id,
+                    pdf_paths=pdf_files,
+                    dpi=pending[0].get('dpi', 300),
+                    format=pending[0].get('format', 'jpeg'),
+                    encoding=EncodeOptions(**pending[0]['encoding']) if 'encoding' in pending[0] else None,
+                )
+
+async def _save_local_upload(session_id: str, job_id: str, filename: str, chunks, background_tasks: BackgroundTasks) -> dict:
+    """
+    アップロードされたファイルをチャンク単位で保存し、ジョブのファイルが揃ったら変換を開始する
+    
+    Args:
+        session_id: セッションID
+        job_id: ジョブID
+        filename: URLエンコードされたファイル名
+        chunks: 受信データのチャンク
+        background_tasks: 変換処理を登録するバックグラウンドタスク
+    """
+    try:
+        upload_path = _local_upload_path(session_id, job_id, filename)
+        logger.info(f"ファイルアップロード開始: {os.path.basename(upload_path)}")
+        
+        # ファイルを保存（受信しながら書き込み、全体をメモリに載せない）
+        try:
+            size, sha256 = await save_stream(chunks, upload_path, settings.max_upload_size, settings.upload_chunk_size)
+        except UploadTooLargeError as exc:
+            raise _too_large(exc.max_bytes) from exc
         
-        return {"message": "ファイルのアップロードが完了しました"}
+        _on_local_upload_saved(session_id, job_id, upload_path, background_tasks)
+        return {"message": "ファイルのアップロードが完了しました", "size": size, "sha256": sha256}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"アップロードエラー: {str(e)}")
-        # エラーが発生した場合、ジョブステータスを更新
-        error_status = JobStatus(
-            session_id=session_id,
-            job_id=job_id,
-            status="error",
-            message=f"アップロード中にエラーが発生しました: {str(e)}",
-            progress=0,
-            created_at=datetime.now()
-        )
-        job_status_manager.update_status(job_id, error_status)
-        raise HTTPException(
-            status_code=500,
-            detail=f"ファイルのアップロード中にエラーが発生しました: {str(e)}"
-        )
+        raise _local_upload_failed(session_id, job_id, e)
+
+def _resume_incomplete(offset: int) -> Response:
+    """再開アップロードが未完了であることを返す（GCSと同じく308と受信済みのRange）"""
+    headers = {"Range": f"bytes=0-{offset - 1}"} if offset else {}
+    return Response(status_code=308, headers=headers)
+
+@local_router.put("/local-upload/resumable/{session_id}/{job_id}/{filename}")
+async def local_upload_resumable(
+    session_id: str,
+    job_id: str,
+    filename: str,
+    request: Request,
+    background_tasks: BackgroundTasks
+):
+    """
+    再開可能アップロードエンドポイント（ローカル用、GCSの再開可能アップロードと同じプロトコル）
+
+    - チャンクの送信: Content-Range: bytes {開始}-{終了}/{総サイズ} を付けてPUTする
+    - 受信済みの位置の問い合わせ: 本文なしで Content-Range: bytes */{総サイズ} を付けてPUTする
+      （総サイズ不明（/*）のチャンクで送り終えた場合は、この問い合わせで受信済みのデータが総サイズに達していれば完了する）
+
+    未完了の間は308と受信済みの範囲（Range: bytes=0-{受信済み-1}）を返し、総サイズに達した時点で200を返す
+    """
+    try:
+        upload_path = _local_upload_path(session_id, job_id, filename)
+        content_range = request.headers.get("content-range")
+        if content_range is None:
+            raise HTTPException(status_code=400, detail="Content-Rangeヘッダーが必要です")
+        try:
+            start, _, total = parse_content_range(content_range)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        if settings.max_upload_size and total is not None and total > settings.max_upload_size:
+            raise _too_large(settings.max_upload_size)
+
+        # 完了済み（完了の応答を受け取れずに再送された場合など）は変換を重複して開始しない
+        if os.path.exists(upload_path) and not os.path.exists(f"{upload_path}.part"):
+            size = os.path.getsize(upload_path)
+            if total is None or size == total:
+                return {"message": "ファイルのアップロードが完了しました", "size": size, "sha256": await file_sha256(upload_path)}
+
+        if start is None:
+            # 総サイズ不明のチャンクで送り終えた場合は、総サイズ付きの問い合わせで完了させる
+            try:
+                offset = await complete_upload(upload_path, total)
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc)) from exc
+            if offset < total:
+                return _resume_incomplete(offset)
+            _on_local_upload_saved(session_id, job_id, upload_path, background_tasks)
+            return {"message": "ファイルのアップロードが完了しました", "size": offset, "sha256": await file_sha256(upload_path)}
+
+        try:
+            offset = await append_stream(
+                request.stream(), upload_path, start, total, settings.max_upload_size, settings.upload_chunk_size
+            )
+        except ClientDisconnect:
+            # 受信済みのデータは残っているため、クライアントは位置を問い合わせて続きから再送できる
+            logger.info(f"Resumable upload interrupted: {upload_path} ({received_bytes(upload_path)} bytes received)")
+            return _resume_incomplete(received_bytes(upload_path))
+        except UploadOffsetMismatchError as exc:
+            # 受信済みの位置より後ろのチャンクは受け付けず、続きの位置を返して再送させる
+            return _resume_incomplete(exc.offset)
+        except UploadTooLargeError as exc:
+            raise _too_large(exc.max_bytes) from exc
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        if total is None or offset < total:
+            return _resume_incomplete(offset)
+
+        _on_local_upload_saved(session_id, job_id, upload_path, background_tasks)
+        return {"message": "ファイルのアップロードが完了しました", "size": offset, "sha256": await file_sha256(upload_path)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _local_upload_failed(session_id, job_id, e)
 
 @router.post("/notify-upload-complete/{session_id}")
 async def notify_upload_complete(
@@ -473,6 +803,7 @@ async def notify_upload_complete(
         session_id: セッションID
         request: アップロード完了通知リクエスト（ジョブIDのリスト、DPI設定など）
     """
+    encoding = _encode_options(request.format, request.quality, request.subsampling, request.progressive)
     try:
         logger.info(f"Upload complete notification received for session: {session_id}")
         
@@ -492,13 +823,23 @@ async def notify_upload_complete(
             )
         )
         
+        ingest = ingest_manager.get(session_id)
+        if ingest is not None and not ingest.closed:
+            # 逐次変換中: 届いていないファイルがあれば通知し（ファイルごとの通知をしないクライアント向け）、受付を終了する
+            for job_id in ingest.job_ids:
+                if not ingest.has_arrived(job_id) and not await _notify_arrival(ingest, session_id, job_id, request.max_retries):
+                    ingest.failed(job_id, FileNotFoundError(f"PDF for job {job_id} was not uploaded"))
+            ingest.close()
+            return {"status": "processing", "message": "PDFファイルの変換を開始します"}
+        
         background_tasks.add_task(
             convert_and_notify,
             session_id=session_id,
             job_ids=request.job_ids,
             dpi=request.dpi,
             format=request.format,
-            max_retries=request.max_retries
+            max_retries=request.max_retries,
+            encoding=encoding,
         )
         
         return {"status": "processing", "message": "PDFファイルの変換を開始します"}
@@ -507,6 +848,33 @@ async def notify_upload_complete(
         logger.error(error_message)
         raise HTTPException(status_code=500, detail=error_message)
 
+@router.post("/notify-file-uploaded/{session_id}/{job_id}")
+async def notify_file_uploaded(session_id: str, job_id: str, max_retries: int = 3):
+    """
+    1ファイルのアップロード完了を通知し、そのファイルの変換を開始するエンドポイント（逐次変換）
+
+    画像番号はアップロードURLを発行した順に割り当てるため、通知の順序は問わない。
+    ローカルモードではアップロードの受信時に変換が始まるため、通知しなくてもよい
+    
+    Args:
+        session_id: セッションID
+        job_id: アップロードしたファイルのジョブID
+        max_retries: アップロード済みファイルの一覧取得を再試行する最大回数
+    """
+    ingest = ingest_manager.get(session_id)
+    if ingest is None or job_id not in ingest.job_ids:
+        raise HTTPException(status_code=404, detail="逐次変換中のジョブが見つかりません")
+    try:
+        if not await _notify_arrival(ingest, session_id, job_id, max_retries):
+            raise HTTPException(status_code=404, detail="アップロードされたファイルが見つかりません")
+        return {"status": "processing", "message": "ファイルの変換を開始します"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_message = f"アップロード完了通知の処理中にエラーが発生しました: {str(e)}"
+        logger.error(error_message)
+        raise HTTPException(status_code=500, detail=error_message)
+
 @router.put("/session-update/{session_id}")
 async def update_session_status(session_id: str, status_update: dict):
     """セッションのステータスを更新"""
@@ -17,9 +17,65 @@ class Settings(BaseSettings):
     # 作業用スペース設定
     workspace_path: str = "tmp_workspace"  # デフォルト値（__init__で上書き可能）
     
+    # GCSクライアント設定
+    gcs_backend: str = "google"  # "google"（Cloud Storage） / "fake"（テスト・ベンチマーク用のローカル代替）
+    gcs_fake_root: str = ""      # fake使用時の保存先ディレクトリ（未指定の場合はメモリ上に保持）
+    gcs_pool_size: int = 0       # HTTPコネクションプールのサイズ（0の場合はIO_WORKERS + UPLOAD_WORKERS）
+    
     # 署名付きURL設定
     sign_url_exp: int = 3600
     
+    # ローカルアップロード設定
+    upload_chunk_size: int = 1024 * 1024          # 受信データをファイルへ書き込む単位（バイト）
+    max_upload_size: int = 2 * 1024 * 1024 * 1024  # 1ファイルの最大サイズ（バイト、0の場合は無制限）
+    
+    # 逐次変換設定
+    incremental_conversion: bool = True  # 届いたファイルから変換を始める（Falseの場合、またはSTATE_BACKENDがmemory以外の場合は全ファイルのアップロード完了後に一括変換）
+    ingest_arrival_timeout: int = 900    # 逐次変換でアップロードURLを発行したファイルの到着を待つ最大秒数（超えた場合は0ページとして続行）
+
+    # 進捗通知(SSE)設定
+    sse_heartbeat_interval: float = 15.0  # 変化がない場合にハートビートを送る間隔（秒）
+    progress_min_interval: float = 0.5    # ページ進捗をステータスへ反映する最小間隔（秒）
+    progress_min_delta: float = 1.0       # ページ進捗をステータスへ反映する最小変化量（%ポイント）
+    
+    # 変換処理設定
+    render_workers: int = 0          # ページ描画プロセス数（0の場合はCPUコア数）
+    render_pages_per_task: int = 8   # 1ワーカーに割り当てるページ数
+    io_workers: int = 8              # ブロッキングI/O（fitz・GCS）用スレッド数
+    upload_workers: int = 4          # 画像アップロードの並列数
+    upload_max_retries: int = 3      # 画像1枚のアップロードを再試行する最大回数
+    upload_retry_delay: float = 0.5  # アップロード再試行までの初回待ち時間（秒、以降は指数的に伸ばす）
+    pipeline_queue_size: int = 4     # 描画・エンコード→アップロード間のキュー上限（ページ数）
+    pdf_concurrency: int = 4         # 1ジョブ内で同時に変換するPDF数
+    upload_from_memory: bool = True  # クラウドモードでエンコード結果をディスクを経由せずアップロード
+    download_workers: int = 8        # アップロード済みPDFをGCSから取得する並列数（チャンク単位）
+    download_chunk_size: int = 32 * 1024 * 1024  # これより大きいPDFは範囲指定で分割して並行取得（バイト）
+    download_ahead: int = 2          # 変換中のPDFに加えて先読みしておくPDF数（変換済みのPDFは即削除）
+    pdf_memory_threshold: int = 0    # これ以下のサイズのPDFは/tmpに書き出さずメモリ上で開く（バイト、0で無効）
+    max_page_pixels: int = 100_000_000  # 1ページの最大画素数（RGBで約300MB、0で無制限）
+    image_quality: int = 95  # JPEG・WebPの画質（1-100、リクエストで上書き可能）
+    jpeg_subsampling: str = "4:2:0"  # JPEGの色差サブサンプリング: "4:4:4" / "4:2:2" / "4:2:0"
+    jpeg_progressive: bool = False  # プログレッシブJPEGで出力する
+    auto_grayscale: bool = False  # 無彩色のページをグレースケール（1チャンネル）で描画する
+    grayscale_tolerance: int = 12  # 無彩色とみなすRGBの差の最大値（0-255）
+    render_memory_budget: int = 1024 * 1024 * 1024  # 同時に描画するページのラスタの合計（見積もり）の上限バイト数（0で無制限）
+    
+    # 変換画像キャッシュ設定（同じPDFを同じ設定で再変換する場合は描画せずキャッシュから配置する）
+    render_cache: bool = True
+    render_cache_dir: str = ""       # ローカルキャッシュの保存先（未指定の場合はworkspace_path配下）
+    render_cache_max_bytes: int = 2 * 1024 * 1024 * 1024  # ローカルキャッシュの最大サイズ（バイト、0でローカルキャッシュを使わない）
+    render_cache_gcs_prefix: str = ""  # GCSキャッシュのプレフィックス（GCS_BUCKET_WORKS内、空の場合は使わない、クラウドモードのみ）
+    
+    # 画像連番カウンタ設定
+    image_counter_backend: str = "memory"  # "memory"（単一プロセス） / "sqlite"（複数ワーカーで共有）
+    image_counter_path: str = ""           # sqlite使用時のDBファイル（未指定の場合はworkspace_path配下）
+    image_index_blob: str = "_index/image_high_water_mark"  # 出力済み最大画像番号を保持するオブジェクト（GCS_BUCKET_WORKS内）
+    
+    # 状態ストア設定（ジョブ・セッションのステータス）
+    state_backend: str = "memory"    # "memory"（単一プロセス） / "sqlite"（同一ホストの複数ワーカーで共有）
+    state_path: str = ""             # sqlite使用時のDBファイル（未指定の場合はworkspace_path配下）
+    state_poll_interval: float = 0.2 # sqlite使用時に他のワーカーの更新を確認する間隔（秒）
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,48 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """ブロッキングI/O（fitz・GCS・ファイル操作）用のスレッドプールを取得"""
+    global _io_executor
+    if _io_executor is None:
+        max_workers = get_settings().io_workers
+        _io_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blocking-io")
+        logger.info(f"Blocking I/O thread pool started with {max_workers} workers")
+    return _io_executor
+
+
+def shutdown_io_executor() -> None:
+    """ブロッキングI/O用のスレッドプールを停止する"""
+    global _io_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True, cancel_futures=True)
+        _io_executor = None
+        logger.info("Blocking I/O thread pool stopped")
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    ブロッキング関数をスレッドプールで実行し、イベントループを止めずに結果を待つ
+
+    Args:
+        func: 実行する関数
+        *args: 関数の位置引数
+        **kwargs: 関数のキーワード引数
+
+    Returns:
+        関数の戻り値
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
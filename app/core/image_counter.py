@@ -0,0 +1,136 @@
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCounter(ABC):
+    """セッションごとの画像連番カウンタ（次に払い出す番号を保持する）"""
+
+    @abstractmethod
+    def initialize(self, session_id: str, image_num: int) -> None:
+        """カウンタが未登録の場合のみ初期値を登録する"""
+
+    @abstractmethod
+    def set(self, session_id: str, image_num: int) -> None:
+        """カウンタの値を上書きする"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[int]:
+        """カウンタの現在値を取得する（未登録の場合はNone）"""
+
+    @abstractmethod
+    def reserve(self, session_id: str, count: int) -> Tuple[int, int]:
+        """
+        count個の連続した番号をアトミックに確保する
+
+        Returns:
+            Tuple[int, int]: (開始番号, 終了番号) 終了番号は含まない（range(start, end)で確保した番号になる）
+        """
+
+
+class InMemoryImageCounter(ImageCounter):
+    """単一プロセス用のカウンタ（スレッド・asyncioタスク間はロックで排他）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+
+    def initialize(self, session_id: str, image_num: int) -> None:
+        with self._lock:
+            self._counters.setdefault(session_id, image_num)
+
+    def set(self, session_id: str, image_num: int) -> None:
+        with self._lock:
+            self._counters[session_id] = image_num
+
+    def get(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            return self._counters.get(session_id)
+
+    def reserve(self, session_id: str, count: int) -> Tuple[int, int]:
+        with self._lock:
+            start = self._counters.get(session_id, 0)
+            self._counters[session_id] = start + count
+            return start, start + count
+
+
+class SQLiteImageCounter(ImageCounter):
+    """
+    複数プロセス（uvicornワーカー）で共有するカウンタ
+
+    確保処理はBEGIN IMMEDIATEで書き込みロックを取得してから読み出し・更新するため、
+    同じデータベースファイルを開いているすべてのプロセス間で番号が重複しない
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS image_counters (session_id TEXT PRIMARY KEY, next_num INTEGER NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（sqlite3の接続はスレッド間で共有しない）"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def initialize(self, session_id: str, image_num: int) -> None:
+        self._connection().execute(
+            "INSERT OR IGNORE INTO image_counters (session_id, next_num) VALUES (?, ?)",
+            (session_id, image_num),
+        )
+
+    def set(self, session_id: str, image_num: int) -> None:
+        self._connection().execute(
+            "INSERT INTO image_counters (session_id, next_num) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET next_num = excluded.next_num",
+            (session_id, image_num),
+        )
+
+    def get(self, session_id: str) -> Optional[int]:
+        row = self._connection().execute(
+            "SELECT next_num FROM image_counters WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def reserve(self, session_id: str, count: int) -> Tuple[int, int]:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT next_num FROM image_counters WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            start = row[0] if row else 0
+            connection.execute(
+                "INSERT INTO image_counters (session_id, next_num) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET next_num = excluded.next_num",
+                (session_id, start + count),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return start, start + count
+
+
+def create_image_counter(backend: str, path: str) -> ImageCounter:
+    """設定値に応じたカウンタを生成する"""
+    if backend == "memory":
+        return InMemoryImageCounter()
+    if backend == "sqlite":
+        logger.info(f"Using SQLite image counter: {path}")
+        return SQLiteImageCounter(path)
+    raise ValueError(f"Unknown image counter backend: {backend}")
@@ -1,37 +1,100 @@
-from typing import Dict, Optional
-from datetime import datetime
-from pydantic import BaseModel
+from typing import Callable, Dict, Optional
 import logging
+from app.core.state_store import StateStore, default_state_store
 from app.models.schemas import JobStatus
 
 logger = logging.getLogger(__name__)
 
+_NAMESPACE = "job"
+
 class JobStatusManager:
-    def __init__(self):
-        self._statuses: Dict[str, JobStatus] = {}
+    def __init__(self, store: Optional[StateStore] = None):
+        # ステータスは状態ストアに保持する（複数ワーカーで共有する場合はsqliteストアを使う）
+        self._store = store or default_state_store()
+        # 共有しないストアではJobStatusをプロセス内に保持し、JSONへの変換を省く（ストアは変更通知のみに使う）
+        self._statuses: Optional[Dict[str, JobStatus]] = None if self._store.shared else {}
     
     def update_status(self, job_id: str, status: JobStatus):
         """ジョブのステータスを更新"""
-        self._statuses[job_id] = status
+        if self._statuses is not None:
+            self._statuses[job_id] = status.model_copy()
+            self._store.touch(_NAMESPACE, job_id)
+        else:
+            self._store.put(_NAMESPACE, job_id, status.model_dump_json())
         logger.info(f"ジョブ {job_id} のステータスを更新: {status.status} ({status.progress:.2f}%)")
     
     def get_status(self, job_id: str) -> Optional[JobStatus]:
-        """ジョブのステータスを取得"""
-        return self._statuses.get(job_id)
+        """ジョブのステータスを取得（呼び出し側で変更しても保持している値には影響しない）"""
+        if self._statuses is not None:
+            status = self._statuses.get(job_id)
+            return status.model_copy() if status is not None else None
+        value = self._store.get(_NAMESPACE, job_id)
+        return JobStatus.model_validate_json(value) if value is not None else None
     
     def delete_status(self, job_id: str):
         """ジョブのステータスを削除"""
-        if job_id in self._statuses:
-            del self._statuses[job_id]
+        if self._statuses is not None:
+            if self._statuses.pop(job_id, None) is not None:
+                self._store.touch(_NAMESPACE, job_id)
+            return
+        self._store.delete(_NAMESPACE, job_id)
+    
+    def modify(self, job_id: str, change: Callable[[JobStatus], None]) -> Optional[JobStatus]:
+        """
+        ジョブのステータスを読み出して change で変更し、書き戻す
+
+        共有するストアでは読み出しから書き戻しまでをアトミックに行い、他のワーカーの更新を上書きしない
+
+        Returns:
+            Optional[JobStatus]: 変更後のステータス（ステータスがない場合はNone、変更しない）
+        """
+        if self._statuses is not None:
+            status = self._statuses.get(job_id)
+            if status is None:
+                return None
+            status = status.model_copy()
+            change(status)
+            self._statuses[job_id] = status
+            self._store.touch(_NAMESPACE, job_id)
+            return status.model_copy()
+        changed: Optional[JobStatus] = None
+
+        def apply(value: Optional[str]) -> Optional[str]:
+            nonlocal changed
+            if value is None:
+                return None
+            changed = JobStatus.model_validate_json(value)
+            change(changed)
+            return changed.model_dump_json()
+
+        self._store.update(_NAMESPACE, job_id, apply)
+        return changed
     
     def update_progress(self, job_id: str, progress: float, message: Optional[str] = None):
-        if job_id in self._statuses:
-            status = self._statuses[job_id]
+        def apply(status: JobStatus):
             status.progress = progress
             if message:
                 status.message = message
-            self._statuses[job_id] = status
-            logger.info(f"ジョブ {job_id} の進捗を更新: {progress:.2f}%")
+
+        if self._statuses is not None:
+            # ページ単位で頻繁に呼ばれるため、プロセス内のステータスをそのまま更新する
+            status = self._statuses.get(job_id)
+            if status is None:
+                return
+            apply(status)
+            self._store.touch(_NAMESPACE, job_id)
+        else:
+            self.modify(job_id, apply)
+        # ページ単位で頻繁に呼ばれるためDEBUGで出力する
+        logger.debug(f"ジョブ {job_id} の進捗を更新: {progress:.2f}%")
+    
+    def get_version(self, job_id: str) -> int:
+        """ジョブのステータスの更新回数（変更検知用）を取得"""
+        return self._store.version(_NAMESPACE, job_id)
+    
+    async def wait_for_change(self, job_id: str, version: int, timeout: float) -> int:
+        """ジョブのステータスが version から更新されるまで待つ（タイムアウトあり）"""
+        return await self._store.wait(_NAMESPACE, job_id, version, timeout)
 
 # シングルトンインスタンスを作成
-job_status_manager = JobStatusManager() 
\ No newline at end of file
+job_status_manager = JobStatusManager() 
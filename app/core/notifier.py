@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class StatusNotifier:
+    """
+    キー（セッションID・ジョブID）ごとのステータス変更通知
+
+    更新のたびにキーのバージョン番号を進め、そのキーを待っているタスクだけを起こす。
+    通知はスレッドセーフなので、スレッドプール上の処理から呼び出してもよい
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+
+    def version(self, key: str) -> int:
+        """キーの現在のバージョン番号を取得"""
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def notify(self, key: str) -> None:
+        """キーの変更を通知し、待機中のタスクを起こす"""
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            waiters = self._waiters.pop(key, [])
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # 待機側のイベントループが既に終了している
+                pass
+
+    async def wait(self, key: str, version: int, timeout: float) -> int:
+        """
+        キーのバージョン番号が version から変わるまで待つ
+
+        Args:
+            key: セッションIDまたはジョブID
+            version: 呼び出し側が最後に確認したバージョン番号
+            timeout: 最大待機秒数
+
+        Returns:
+            int: 現在のバージョン番号（タイムアウトした場合は version のまま）
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            current = self._versions.get(key, 0)
+            if current != version:
+                return current
+            waiter = loop.create_future()
+            self._waiters.setdefault(key, []).append((loop, waiter))
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(key)
+                if waiters and (loop, waiter) in waiters:
+                    waiters.remove((loop, waiter))
+                    if not waiters:
+                        del self._waiters[key]
+        return self.version(key)
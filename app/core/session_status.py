@@ -1,55 +1,128 @@
-from typing import Dict, Optional
+import os
+from typing import Optional, Tuple
 from datetime import datetime
 from pydantic import BaseModel
+from app.core.config import get_settings
+from app.core.image_counter import ImageCounter, create_image_counter
+from app.core.state_store import StateStore, default_state_store
 from app.models.schemas import SessionStatus
 
 import logging
 logger = logging.getLogger(__name__)
 
+_NAMESPACE = "session"
+# セッションの開始画像番号（セッションが出力した画像の範囲を求めるため）
+_START_NAMESPACE = "session_start"
+
+def _default_image_counter() -> ImageCounter:
+    settings = get_settings()
+    path = settings.image_counter_path or os.path.join(settings.workspace_path, "image_counter.sqlite3")
+    return create_image_counter(settings.image_counter_backend, path)
+
 class SessionStatusManager:
-    def __init__(self):
-        self._statuses: Dict[str, SessionStatus] = {}
+    def __init__(self, counter: Optional[ImageCounter] = None, store: Optional[StateStore] = None):
+        # 画像連番はステータスとは別にカウンタで管理する（並行処理・複数ワーカー間で番号を重複させないため）
+        self._counter = counter or _default_image_counter()
+        # ステータスは状態ストアに保持する（複数ワーカーで共有する場合はsqliteストアを使う）
+        self._store = store or default_state_store()
+    
+    def _load(self, session_id: str) -> Optional[SessionStatus]:
+        value = self._store.get(_NAMESPACE, session_id)
+        return SessionStatus.model_validate_json(value) if value is not None else None
+    
+    def _save(self, session_id: str, status: SessionStatus):
+        self._store.put(_NAMESPACE, session_id, status.model_dump_json())
     
     def update_status(self, session_id: str, status: SessionStatus):
         """セッションのステータスを更新"""
-        self._statuses[session_id] = status
+        # 連番はカウンタが正とする（古いimage_numを持つステータスで確保済みの番号を巻き戻さない）
+        self._counter.initialize(session_id, status.image_num)
+        status.image_num = self._counter.get(session_id)
+        self._store.put_if_absent(_START_NAMESPACE, session_id, str(status.image_num))
+        self._save(session_id, status)
         logger.info(f"セッションのステータスを更新: {status.status} ({status.progress:.2f}%)")
     
     def get_status(self, session_id: str) -> Optional[SessionStatus]:
         """セッションのステータスを取得"""
-        return self._statuses.get(session_id)
+        status = self._load(session_id)
+        if status is not None:
+            status.image_num = self._counter.get(session_id)
+        return status
     
     def update_progress(self, session_id: str, progress: float, message: Optional[str] = None):
-        if session_id in self._statuses:
-            status = self._statuses[session_id]
+        status = self._load(session_id)
+        if status is not None:
             status.progress = progress
             if message:
                 status.message = message
-            self._statuses[session_id] = status
+            self._save(session_id, status)
             logger.info(f"セッション {session_id} の進捗を更新: {progress:.2f}%")
+    
+    def get_version(self, session_id: str) -> int:
+        """セッションのステータスの更新回数（変更検知用）を取得"""
+        return self._store.version(_NAMESPACE, session_id)
+    
+    async def wait_for_change(self, session_id: str, version: int, timeout: float) -> int:
+        """セッションのステータスが version から更新されるまで待つ（タイムアウトあり）"""
+        return await self._store.wait(_NAMESPACE, session_id, version, timeout)
+
+    def reserve_range(self, session_id: str, count: int) -> Tuple[int, int]:
+        """
+        セッションの画像連番からcount個の連続した番号をアトミックに確保する
+        
+        Args:
+            session_id: セッションID
+            count: 確保する番号の数
+            
+        Returns:
+            Tuple[int, int]: (開始番号, 終了番号) 終了番号は含まない
+        """
+        if self._counter.get(session_id) is None:
+            logger.error("Session %s not found when reserving image numbers", session_id)
+        start, end = self._counter.reserve(session_id, count)
+        status = self._load(session_id)
+        if status is not None:
+            status.image_num = end
+            self._save(session_id, status)
+        logger.info("画像連番を予約: %07d - %07d", start, end - 1)
+        return start, end
 
     def add_imagenum(self, session_id: str, image_cnt: int):
-        status = self._statuses.get(session_id)
-        if status is None:
+        if self._counter.get(session_id) is None:
             logger.error("Session %s not found when adding image number", session_id)
             return
-        status.image_num += image_cnt
-        logger.info("画像連番を更新: %07d", status.image_num)
+        _, end = self.reserve_range(session_id, image_cnt)
+        logger.info("画像連番を更新: %07d", end)
 
     def set_imagenum(self, session_id: str, image_num: int):
-        status = self._statuses.get(session_id)
+        status = self._load(session_id)
         if status is None:
             logger.error("Session %s not found when setting image number", session_id)
             return
+        self._counter.set(session_id, image_num)
         status.image_num = image_num
+        self._save(session_id, status)
         logger.info("画像連番を更新: %07d", status.image_num)
 
+    def get_image_range(self, session_id: str) -> Optional[Tuple[int, int]]:
+        """
+        セッションに割り当てた画像番号の範囲を取得
+
+        Returns:
+            Optional[Tuple[int, int]]: (開始番号, 終了番号) 終了番号は含まない。セッションが存在しない場合はNone
+        """
+        start = self._store.get(_START_NAMESPACE, session_id)
+        end = self._counter.get(session_id)
+        if start is None or end is None:
+            return None
+        return int(start), end
+
     def get_imagenum(self, session_id: str) -> int:
-        status = self._statuses.get(session_id)
-        if status is None:
+        image_num = self._counter.get(session_id)
+        if image_num is None:
             logger.error("Session %s not found when getting image number", session_id)
             return 0
-        return status.image_num
+        return image_num
 
 # シングルトンインスタンスを作成
 session_status_manager = SessionStatusManager() 
\ No newline at end of file
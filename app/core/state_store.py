@@ -0,0 +1,305 @@
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from app.core.config import get_settings
+from app.core.notifier import StatusNotifier
+
+logger = logging.getLogger(__name__)
+
+
+def _watch_key(namespace: str, key: str) -> str:
+    return f"{namespace}/{key}"
+
+
+class StateStore(ABC):
+    """
+    ジョブ・セッションのステータスなどを保持するキー・バリューストア（値はJSON文字列）
+
+    値は名前空間（"job"・"session" など）とキーで識別する。更新・削除のたびにキーのバージョンが進み、
+    wait() で待っているタスクを起こす（他のプロセスでの更新も含む）
+    """
+
+    # 複数のプロセスで値を共有するか（Falseの場合、利用者はプロセス内に値を保持して touch() で通知してよい）
+    shared = False
+
+    def __init__(self):
+        self._notifier = StatusNotifier()
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """値を取得する（未登録・削除済みの場合はNone）"""
+
+    @abstractmethod
+    def put(self, namespace: str, key: str, value: str) -> None:
+        """値を登録・上書きする"""
+
+    @abstractmethod
+    def put_if_absent(self, namespace: str, key: str, value: str) -> bool:
+        """
+        値が未登録の場合のみ登録する
+
+        Returns:
+            bool: 登録した場合はTrue
+        """
+
+    @abstractmethod
+    def update(self, namespace: str, key: str, change: Callable[[Optional[str]], Optional[str]]) -> Optional[str]:
+        """
+        値を読み出して変更し、書き戻す（読み出しから書き戻しまでの間に他の更新が入らない）
+
+        Args:
+            change: 現在の値（未登録の場合はNone）から新しい値を返す関数。Noneを返した場合は書き込まない
+
+        Returns:
+            Optional[str]: 更新後の値（書き込まなかった場合は現在の値）
+        """
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> bool:
+        """
+        値を削除する
+
+        Returns:
+            bool: 削除した場合はTrue（複数のプロセスが同時に削除した場合もTrueを返すのは1つだけ）
+        """
+
+    def touch(self, namespace: str, key: str) -> None:
+        """値を書き込まずにキーのバージョンを進め、待機中のタスクを起こす（shared=False のストアのみ）"""
+        self._changed(namespace, key)
+
+    def version(self, namespace: str, key: str) -> int:
+        """キーの現在のバージョン番号（変更検知用）を取得"""
+        return self._notifier.version(_watch_key(namespace, key))
+
+    async def wait(self, namespace: str, key: str, version: int, timeout: float) -> int:
+        """キーのバージョン番号が version から変わるまで待つ（タイムアウトした場合は version のまま返す）"""
+        return await self._notifier.wait(_watch_key(namespace, key), version, timeout)
+
+    def close(self) -> None:
+        """ストアを閉じる"""
+
+    def _changed(self, namespace: str, key: str) -> None:
+        self._notifier.notify(_watch_key(namespace, key))
+
+
+class InMemoryStateStore(StateStore):
+    """単一プロセス用のストア"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, str], str] = {}
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._lock:
+            return self._values.get((namespace, key))
+
+    def put(self, namespace: str, key: str, value: str) -> None:
+        with self._lock:
+            self._values[(namespace, key)] = value
+        self._changed(namespace, key)
+
+    def put_if_absent(self, namespace: str, key: str, value: str) -> bool:
+        with self._lock:
+            if (namespace, key) in self._values:
+                return False
+            self._values[(namespace, key)] = value
+        self._changed(namespace, key)
+        return True
+
+    def update(self, namespace: str, key: str, change: Callable[[Optional[str]], Optional[str]]) -> Optional[str]:
+        with self._lock:
+            current = self._values.get((namespace, key))
+            value = change(current)
+            if value is None:
+                return current
+            self._values[(namespace, key)] = value
+        self._changed(namespace, key)
+        return value
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            removed = self._values.pop((namespace, key), None) is not None
+        if removed:
+            self._changed(namespace, key)
+        return removed
+
+
+class SQLiteStateStore(StateStore):
+    """
+    複数プロセス（uvicornワーカー）で共有するストア（WALモード）
+
+    更新ごとにデータベース全体で単調増加する seq を振り、削除は値をNULLにした行として残す。
+    各プロセスは1本の監視スレッドで PRAGMA data_version を確認し、他の接続からコミットがあった場合のみ
+    前回以降の seq の行を読み出して、そのキーを待っているタスクを起こす（待機中のタスク数に関わらず問い合わせは1本）
+    """
+
+    shared = True
+
+    def __init__(self, path: str, poll_interval: float = 0.2):
+        super().__init__()
+        self._path = path
+        self._poll_interval = poll_interval
+        self._local = threading.local()
+        # このプロセスで書き込んだseq（自身の更新は書き込み時に通知済みのため、監視スレッドでは読み飛ばす）
+        self._own_seqs: Set[int] = set()
+        self._own_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_lock = threading.Lock()
+        self._stopped = threading.Event()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS states ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT, seq INTEGER NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS states_seq ON states (seq)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得（sqlite3の接続はスレッド間で共有しない）"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _write(self, namespace: str, key: str, value: Optional[str], only_if_absent: bool = False) -> bool:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value IS NOT NULL FROM states WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            exists = bool(row and row[0])
+            if (only_if_absent and exists) or (value is None and not exists):
+                connection.execute("COMMIT")
+                return False
+            self._store_row(connection, namespace, key, value)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._changed(namespace, key)
+        return True
+
+    def _store_row(self, connection: sqlite3.Connection, namespace: str, key: str, value: Optional[str]) -> None:
+        """新しい seq を振って行を書き込む（トランザクション内で呼ぶ）"""
+        seq = connection.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM states").fetchone()[0]
+        connection.execute(
+            "INSERT INTO states (namespace, key, value, seq) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, seq = excluded.seq",
+            (namespace, key, value, seq),
+        )
+        if self._watcher is not None:
+            with self._own_lock:
+                self._own_seqs.add(seq)
+
+    def update(self, namespace: str, key: str, change: Callable[[Optional[str]], Optional[str]]) -> Optional[str]:
+        connection = self._connection()
+        # 読み出す前に書き込みロックを取り、他のプロセスの更新と読み出し・書き戻しが交差しないようにする
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT value FROM states WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            current = row[0] if row else None
+            value = change(current)
+            if value is None:
+                connection.execute("COMMIT")
+                return current
+            self._store_row(connection, namespace, key, value)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._changed(namespace, key)
+        return value
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM states WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, namespace: str, key: str, value: str) -> None:
+        self._write(namespace, key, value)
+
+    def put_if_absent(self, namespace: str, key: str, value: str) -> bool:
+        return self._write(namespace, key, value, only_if_absent=True)
+
+    def delete(self, namespace: str, key: str) -> bool:
+        return self._write(namespace, key, None)
+
+    async def wait(self, namespace: str, key: str, version: int, timeout: float) -> int:
+        self._start_watcher()
+        return await super().wait(namespace, key, version, timeout)
+
+    def close(self) -> None:
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+    def _start_watcher(self) -> None:
+        if self._watcher is not None:
+            return
+        with self._watcher_lock:
+            if self._watcher is None:
+                # 監視開始時点までの更新は読み込み済みとみなす
+                last_seq = self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM states").fetchone()[0]
+                self._watcher = threading.Thread(
+                    target=self._watch, args=(last_seq,), name="state-store-watcher", daemon=True
+                )
+                self._watcher.start()
+
+    def _watch(self, last_seq: int) -> None:
+        """他のプロセスでの更新を検知し、該当するキーの待機中タスクを起こす（監視スレッド）"""
+        connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+        data_version = None
+        try:
+            while not self._stopped.wait(self._poll_interval):
+                try:
+                    current = connection.execute("PRAGMA data_version").fetchone()[0]
+                    if current == data_version:
+                        continue
+                    data_version = current
+                    rows = connection.execute(
+                        "SELECT namespace, key, seq FROM states WHERE seq > ? ORDER BY seq", (last_seq,)
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to poll state store: {str(e)}")
+                    continue
+                for namespace, key, seq in rows:
+                    last_seq = max(last_seq, seq)
+                    with self._own_lock:
+                        own = seq in self._own_seqs
+                        self._own_seqs.discard(seq)
+                    if not own:
+                        self._changed(namespace, key)
+        finally:
+            connection.close()
+
+
+def create_state_store(backend: str, path: str, poll_interval: float = 0.2) -> StateStore:
+    """設定値に応じたストアを生成する"""
+    if backend == "memory":
+        return InMemoryStateStore()
+    if backend == "sqlite":
+        logger.info(f"Using SQLite state store: {path}")
+        return SQLiteStateStore(path, poll_interval)
+    raise ValueError(f"Unknown state store backend: {backend}")
+
+
+def default_state_store() -> StateStore:
+    """設定に従ってストアを生成する"""
+    settings = get_settings()
+    path = settings.state_path or os.path.join(settings.workspace_path, "state.sqlite3")
+    return create_state_store(settings.state_backend, path, settings.state_poll_interval)
@@ -4,7 +4,11 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from fastapi import Request
-from app.api import upload
+from app.api import download, upload
+from app.core.config import get_settings
+from app.core.executor import run_blocking, shutdown_io_executor
+from app.services.gcs import get_storage_client
+from app.services.renderer import shutdown_render_pool
 import logging
 
 # ロギングの設定
@@ -30,6 +34,7 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # APIルーターの登録
 app.include_router(upload.router, prefix="/api", tags=["upload"])
+app.include_router(download.router, prefix="/api", tags=["download"])
 # ローカルアップロード用のルーターを登録（プレフィックスなし）
 app.include_router(upload.local_router, tags=["local-upload"])
 
@@ -39,4 +44,15 @@ async def root(request: Request):
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.on_event("startup")
+async def init_storage_client():
+    # クラウドモードでは起動時に共有GCSクライアントを生成し、認証情報の不備をここで検出する
+    if get_settings().gcp_region != "local":
+        await run_blocking(get_storage_client)
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    shutdown_render_pool()
+    shutdown_io_executor()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 class SessionRequest(BaseModel):
@@ -10,7 +10,12 @@ class UploadRequest(BaseModel):
     filename: str
     content_type: str
     dpi: Optional[int] = 300
-    format: Optional[str] = "jpeg"
+    format: Optional[str] = "jpeg"  # 出力形式: "jpeg" / "jpg" / "png" / "webp"
+    quality: Optional[int] = None  # JPEG・WebPの画質 1-100（未指定の場合は IMAGE_QUALITY）
+    subsampling: Optional[str] = None  # JPEGの色差サブサンプリング "4:4:4" / "4:2:2" / "4:2:0"（未指定の場合は JPEG_SUBSAMPLING）
+    progressive: Optional[bool] = None  # プログレッシブJPEGで出力するか（未指定の場合は JPEG_PROGRESSIVE）
+    resumable: bool = False  # 再開可能アップロード（チャンク単位で送信し、切断時は不足分のみ再送）のURLを発行するか
+    size: Optional[int] = None  # ファイルの総サイズ（再開可能アップロードで使用）
 
 class SessionResponse(BaseModel):
     session_id: str
@@ -19,6 +24,7 @@ class UploadResponse(BaseModel):
     upload_url: str
     session_id: str
     job_id: str
+    resumable: bool = False
 
 class SessionStatus(BaseModel):
     session_id: str
@@ -38,6 +44,8 @@ class JobStatus(BaseModel):
     completed_at: Optional[datetime] = None
     error: Optional[str] = None
     message: Optional[str] = None
+    stage_timings: Optional[Dict[str, float]] = None  # パイプライン各ステージの処理時間（秒）
+    failed_uploads: Optional[List[str]] = None  # 再試行してもアップロードできなかった画像ファイル名
 
 class SessionStatusUpdateRequest(BaseModel):
     status: str
@@ -49,5 +57,8 @@ class NotifyUploadCompleteRequest(BaseModel):
     session_id: str
     job_ids: List[str]  # 各ファイルに対応するジョブID
     dpi: int = 300
-    format: str = "jpeg"
+    format: str = "jpeg"  # 出力形式: "jpeg" / "jpg" / "png" / "webp"
+    quality: Optional[int] = None  # JPEG・WebPの画質 1-100（未指定の場合は IMAGE_QUALITY）
+    subsampling: Optional[str] = None  # JPEGの色差サブサンプリング（未指定の場合は JPEG_SUBSAMPLING）
+    progressive: Optional[bool] = None  # プログレッシブJPEGで出力するか（未指定の場合は JPEG_PROGRESSIVE）
     max_retries: int = 3  # リトライ回数の最大値    
\ No newline at end of file
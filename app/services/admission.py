@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    プロセス全体で同時に描画するページのメモリ量（見積もり）の上限
+
+    すべてのセッション・ジョブの描画はこの予算から見積もり量を確保してから始め、終わったら返す。
+    確保できない場合は到着順に待たせる（先頭が待っている間は後続の小さいページも追い越さない）。
+    上限より大きいページは、他の描画がなくなった時点で単独で実行する（同じイベントループから使うこと）
+    """
+
+    def __init__(self, limit: int):
+        """
+        Args:
+            limit: 同時に確保できる最大バイト数（0以下の場合は無制限）
+        """
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    def _clamp(self, nbytes: int) -> int:
+        return min(nbytes, self.limit) if self.limit > 0 else 0
+
+    async def acquire(self, nbytes: int) -> int:
+        """
+        見積もり量を確保する（確保できるまで待つ）
+
+        Returns:
+            int: 実際に確保した量（release() に渡す）
+        """
+        nbytes = self._clamp(nbytes)
+        if not self._waiters and self.in_flight + nbytes <= self.limit:
+            self.in_flight += nbytes
+            return nbytes
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, waiter))
+        logger.debug(f"Waiting for render memory: {nbytes} bytes ({self.in_flight}/{self.limit} in flight)")
+        try:
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # 確保済みになった直後にキャンセルされた場合は返却する
+                self.release(nbytes)
+            else:
+                self._waiters.remove((nbytes, waiter))
+                self._wake()
+            raise
+        return nbytes
+
+    def release(self, nbytes: int) -> None:
+        """確保した量を返却し、待っている描画を到着順に開始する"""
+        self.in_flight -= nbytes
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            nbytes, waiter = self._waiters[0]
+            if self.in_flight + nbytes > self.limit:
+                return
+            self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += nbytes
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int) -> AsyncIterator[int]:
+        """見積もり量を確保し、ブロックを抜けたら返却する"""
+        acquired = await self.acquire(nbytes)
+        try:
+            yield acquired
+        finally:
+            self.release(acquired)
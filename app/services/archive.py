@@ -0,0 +1,182 @@
+import asyncio
+import inspect
+import io
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Set, Union
+
+from app.core.executor import run_blocking
+from app.services.renderer import PdfBuffer, PdfSource
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = (".zip",)
+
+
+def is_archive(filename: str) -> bool:
+    """ファイル名がZIPアーカイブか"""
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def is_supported_upload(filename: str) -> bool:
+    """変換対象としてアップロードできるファイル（PDFまたはZIPアーカイブ）か"""
+    return filename.lower().endswith(".pdf") or is_archive(filename)
+
+
+class ArchiveMemberTooLargeError(Exception):
+    """アーカイブ内のファイルの展開後サイズが上限を超えた"""
+
+    def __init__(self, name: str, max_bytes: int):
+        super().__init__(f"{name} exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+def _open_zip(source: PdfSource) -> zipfile.ZipFile:
+    if isinstance(source, PdfBuffer):
+        return zipfile.ZipFile(io.BytesIO(source.data))
+    return zipfile.ZipFile(source)
+
+
+def _pdf_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """アーカイブ内のPDFを格納順に列挙する（ディレクトリ・macOSのメタデータは除く）"""
+    members = []
+    for info in archive.infolist():
+        basename = os.path.basename(info.filename)
+        if info.is_dir() or not basename.lower().endswith(".pdf"):
+            continue
+        if info.filename.startswith("__MACOSX/") or basename.startswith("._"):
+            continue
+        members.append(info)
+    return members
+
+
+def _extract_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo, dest_dir: str, index: int, max_bytes: int, chunk_size: int) -> str:
+    """
+    アーカイブ内の1ファイルをチャンク単位で展開する（ブロッキング）
+
+    アーカイブ内のパスはそのまま使わず、格納順の番号を付けたファイル名で dest_dir 直下に書き出す
+    （ディレクトリ外への書き出しと同名ファイルの衝突を防ぐ）
+    """
+    path = os.path.join(dest_dir, f"{index:06d}-{os.path.basename(info.filename)}")
+    size = 0
+    try:
+        with archive.open(info) as src, open(path, "wb") as dst:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                size += len(chunk)
+                # 申告サイズは偽装できるため、実際に展開したサイズで上限を確認する
+                if max_bytes and size > max_bytes:
+                    raise ArchiveMemberTooLargeError(info.filename, max_bytes)
+                dst.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return path
+
+
+class ZipArchive:
+    """
+    アップロードされたZIPアーカイブ
+
+    格納されたPDFを格納順に1つずつ展開して変換へ渡す。アーカイブ全体を展開せず、
+    展開済みで変換が終わっていないPDFは max_pending 個までに抑える（変換が終わったPDFはすぐに削除する）
+    """
+
+    def __init__(
+        self,
+        source: Union[PdfSource, Awaitable[PdfSource]],
+        name: str,
+        on_done: Optional[Callable[[PdfSource], None]] = None,
+    ):
+        """
+        Args:
+            source: アーカイブのパス・メモリ上のデータ、またはそれを返すAwaitable（ダウンロード中のタスクなど）
+            name: アーカイブのファイル名（ログ用）
+            on_done: すべてのPDFを展開し終えた時点でアーカイブ自体を解放する処理
+        """
+        self.name = name
+        self._source = source
+        self._on_done = on_done
+        self._members: Set[str] = set()
+        self._window: Optional[asyncio.Semaphore] = None
+        self._dest_dir: Optional[str] = None
+        self._finished = False
+
+    def __repr__(self) -> str:
+        return f"<archive:{self.name}>"
+
+    async def iter_members(
+        self,
+        extract_dir: str,
+        max_pending: int,
+        max_member_size: int = 0,
+        chunk_size: int = 1024 * 1024,
+    ) -> AsyncIterator[str]:
+        """
+        アーカイブ内のPDFを格納順に展開し、展開したファイルのパスを返す
+
+        展開済みのPDFが max_pending 個に達した場合は、release() で解放されるまで次の展開を待つ。
+        展開できなかったPDF（破損・サイズ超過）はログに残して読み飛ばす
+
+        Args:
+            extract_dir: 展開先のディレクトリ
+            max_pending: 同時に展開しておくPDFの最大数
+            max_member_size: 展開後の1ファイルの最大サイズ（バイト、0の場合は無制限）
+            chunk_size: 展開時にファイルへ書き込む単位（バイト）
+
+        Yields:
+            str: 展開したPDFのパス
+
+        Raises:
+            zipfile.BadZipFile: アーカイブが壊れている場合
+        """
+        source = await self._source if inspect.isawaitable(self._source) else self._source
+        self._window = asyncio.Semaphore(max(1, max_pending))
+        os.makedirs(extract_dir, exist_ok=True)
+        self._dest_dir = tempfile.mkdtemp(prefix="archive-", dir=extract_dir)
+        archive = None
+        try:
+            archive = await run_blocking(_open_zip, source)
+            members = _pdf_members(archive)
+            logger.info(f"Extracting {len(members)} PDFs from {self.name}")
+            for index, info in enumerate(members):
+                await self._window.acquire()
+                try:
+                    path = await run_blocking(_extract_member, archive, info, self._dest_dir, index, max_member_size, chunk_size)
+                except Exception as e:
+                    self._window.release()
+                    logger.error(f"Failed to extract {info.filename} from {self.name}: {str(e)}")
+                    continue
+                self._members.add(path)
+                yield path
+        finally:
+            if archive is not None:
+                archive.close()
+            self._finished = True
+            if self._on_done is not None:
+                self._on_done(source)
+            self._cleanup()
+
+    def release(self, path: str) -> bool:
+        """
+        変換が終わった（または失敗した）PDFを削除し、次のPDFを展開できるようにする
+
+        Returns:
+            bool: このアーカイブから展開したPDFの場合はTrue
+        """
+        if path not in self._members:
+            return False
+        self._members.discard(path)
+        if os.path.exists(path):
+            os.remove(path)
+        self._window.release()
+        self._cleanup()
+        return True
+
+    def _cleanup(self) -> None:
+        if self._finished and not self._members and self._dest_dir is not None:
+            shutil.rmtree(self._dest_dir, ignore_errors=True)
+            self._dest_dir = None
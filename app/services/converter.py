@@ -1,53 +1,260 @@
+import io
+import mimetypes
 import os
 import tempfile
 import shutil
 from pathlib import Path
-from typing import List, Tuple
-import fitz
+from typing import AsyncIterable, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+from dataclasses import asdict
 from app.core.job_status import JobStatus, job_status_manager
 from app.core.session_status import SessionStatus, session_status_manager
 from datetime import datetime
 import logging
 from app.core.config import get_settings
-try:  # google-cloud-storage is optional in local mode
-    from google.cloud import storage
-except ImportError:  # pragma: no cover - optional dependency
-    storage = None
-import json
+from app.core.executor import run_blocking
+from app.services.admission import MemoryBudget
+from app.services.archive import ZipArchive
+from app.services.pipeline import run_page_pipeline
+from app.services.progress import ProgressReporter
+from app.services.render_cache import GcsRenderCache, LocalRenderCache, pdf_sha256, place_file, render_cache_key
+from app.services.renderer import EncodeOptions, PdfBuffer, PdfSource, RenderOptions, estimate_raster_bytes, iter_rendered_pages, open_pdf, pdf_source_name, resolve_worker_count
+from app.services.gcs import get_storage_client
+from app.services.storage import commit_image_number
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
-if settings.gcp_region != "local":
-    if storage is None:
-        raise RuntimeError("google-cloud-storage package is required for cloud mode")
+# 変換の入力: PDF・ZIPアーカイブ、またはダウンロード中のPDFを待つAwaitable
+ConversionSource = Union[PdfSource, ZipArchive, Awaitable[PdfSource]]
+
+def _render_options() -> RenderOptions:
+    return RenderOptions(
+        max_pixels=settings.max_page_pixels,
+        auto_grayscale=settings.auto_grayscale,
+        gray_tolerance=settings.grayscale_tolerance,
+    )
+
+def resolve_encode_options(
+    quality: Optional[int] = None,
+    subsampling: Optional[str] = None,
+    progressive: Optional[bool] = None,
+) -> EncodeOptions:
+    """リクエストで指定されたエンコード設定に、未指定の項目の設定値を補う"""
+    return EncodeOptions(
+        quality=settings.image_quality if quality is None else quality,
+        subsampling=subsampling or settings.jpeg_subsampling,
+        progressive=settings.jpeg_progressive if progressive is None else progressive,
+    )
+
+# プロセス全体で同時に描画するページのメモリ量の上限（すべてのセッション・ジョブで共有）
+memory_budget = MemoryBudget(settings.render_memory_budget)
+
+# ローカルの変換画像キャッシュ（初回の使用時に設定から生成する）
+_local_render_cache: Optional[LocalRenderCache] = None
+
+def get_local_render_cache() -> Optional[LocalRenderCache]:
+    """
+    ローカルディスク層のキャッシュを取得する（無効な場合はNone）
+
+    クラウドモードでは画像をGCSへアップロードするためディスク上の画像を登録できず、ローカル層は使わない
+    """
+    global _local_render_cache
+    if not settings.render_cache or settings.render_cache_max_bytes <= 0 or settings.gcp_region != "local":
+        return None
+    if _local_render_cache is None:
+        _local_render_cache = LocalRenderCache(
+            settings.render_cache_dir or os.path.join(settings.workspace_path, "render_cache"),
+            settings.render_cache_max_bytes,
+        )
+    return _local_render_cache
+
+def get_gcs_render_cache() -> Optional[GcsRenderCache]:
+    """GCS層のキャッシュを取得する（無効な場合・ローカルモードではNone）"""
+    if not settings.render_cache or not settings.render_cache_gcs_prefix or settings.gcp_region == "local":
+        return None
+    return GcsRenderCache(settings.gcs_bucket_works, settings.render_cache_gcs_prefix)
+
+def _upload_image(image_filename: str, payload: Union[str, bytes]) -> str:
+    """
+    変換した画像をGCS_BUCKET_IMAGEへアップロードする（ブロッキング）
+    
+    失敗した場合は例外を送出する（再試行と失敗の記録は呼び出し側のパイプラインで行う）
+    
+    Args:
+        image_filename: 画像ファイル名
+        payload: 画像ファイルのパス、またはエンコード済みの画像データ
+        
+    Returns:
+        str: 画像の保存先（ローカルファイルの場合はそのパス、メモリから送った場合はgs://URI）
+    """
+    location = payload if isinstance(payload, str) else f"gs://{settings.gcs_bucket_image}/{image_filename}"
+    logger.info(f"Uploading image to GCS_BUCKET_IMAGE: {settings.gcs_bucket_image}/{image_filename}")
+    
+    bucket = get_storage_client().bucket(settings.gcs_bucket_image)
+    blob = bucket.blob(f"{image_filename}")  # セッションIDとジョブIDを含めない
+    
+    if isinstance(payload, bytes):
+        # ディスクを経由せず、エンコード済みデータをそのままアップロード
+        blob.upload_from_file(io.BytesIO(payload), size=len(payload), content_type=_content_type(image_filename))
+    else:
+        blob.upload_from_filename(payload)
+    logger.info(f"Successfully uploaded image to GCS: {settings.gcs_bucket_image}/{image_filename}")
+    return location
+
+def _content_type(image_filename: str) -> str:
+    """画像ファイル名からContent-Typeを決定する"""
+    return mimetypes.guess_type(image_filename)[0] or "application/octet-stream"
+
+def _current_stage_timings(job_id: str) -> Optional[Dict[str, float]]:
+    """ジョブに記録済みのステージ別処理時間を取得（ステータス更新時に引き継ぐため）"""
+    status = job_status_manager.get_status(job_id)
+    return status.stage_timings if status else None
+
+def _current_failed_uploads(job_id: str) -> Optional[List[str]]:
+    """ジョブに記録済みのアップロード失敗画像を取得（ステータス更新時に引き継ぐため）"""
+    status = job_status_manager.get_status(job_id)
+    return status.failed_uploads if status else None
+
+def _record_upload_failure(job_id: str, image_filename: str):
+    """再試行してもアップロードできなかった画像をジョブのステータスへ記録する"""
+    def record(status: JobStatus):
+        status.failed_uploads = (status.failed_uploads or []) + [image_filename]
+        status.error = _upload_error_message(status.failed_uploads)
+
+    job_status_manager.modify(job_id, record)
+
+def _upload_error_message(failed_uploads: Optional[List[str]]) -> Optional[str]:
+    """アップロード失敗画像の件数からエラーメッセージを生成（失敗がない場合はNone）"""
+    if not failed_uploads:
+        return None
+    return f"{len(failed_uploads)}枚の画像のアップロードに失敗しました"
+
+def _merge_stage_timings(job_id: str, stage_timings: Dict[str, float]):
+    """ステージ別処理時間をジョブのステータスへ加算する（複数PDFのジョブは合計値）"""
+    def merge(status: JobStatus):
+        merged = dict(status.stage_timings or {})
+        for stage, seconds in stage_timings.items():
+            merged[stage] = round(merged.get(stage, 0.0) + seconds, 3)
+        status.stage_timings = merged
+
+    status = job_status_manager.modify(job_id, merge)
+    if status is not None:
+        logger.info(f"ジョブ {job_id} のステージ別処理時間: {status.stage_timings}")
+
+async def _reserve_image_ranges(session_id: str, page_counts: List[int]) -> List[int]:
+    """
+    セッションの画像番号から、各PDFのページ数分の連続した範囲を確保する
+    
+    全PDF分をまとめて1回で予約するため、並行する他のジョブ・ワーカーと番号が重複しない。
+    確保した範囲の末尾は画像を書き出す前に出力済み画像番号のインデックスへ記録し、
+    変換中に作成された別のセッションがこの範囲と重なる番号から始めないようにする
+    
+    Returns:
+        List[int]: 各PDFの開始画像番号
+    """
+    next_imagenum, end = session_status_manager.reserve_range(session_id, sum(page_counts))
+    if end > next_imagenum:
+        await run_blocking(commit_image_number, end - 1)
+    starts = []
+    for page_count in page_counts:
+        starts.append(next_imagenum)
+        next_imagenum += page_count
+    return starts
+
+def _image_filenames(imagenum_start: int, total_pages: int, format: str) -> List[str]:
+    return [f"{imagenum_start + page_num:07d}.{format}" for page_num in range(total_pages)]
+
+async def _restore_cached_pages(cache_key: str, total_pages: int, format: str, images_dir: str, imagenum_start: int) -> List[Tuple[int, str]]:
+    """
+    キャッシュ済みの画像をセッションの画像番号で配置する（描画しない）
+    
+    クラウドモードではGCSキャッシュからサーバー側でコピーし、ローカルモードではローカルキャッシュから配置する
+    
+    Returns:
+        List[Tuple[int, str]]: (ページ番号, 保存先) のリスト。キャッシュにない・配置できなかった場合は空
+    """
+    image_filenames = _image_filenames(imagenum_start, total_pages, format)
+    gcs_render_cache = get_gcs_render_cache()
+    local_render_cache = get_local_render_cache()
     try:
-        with open(settings.gcp_keypath, "r") as f:
-            credentials_info = json.load(f)
-        gcs_client = storage.Client.from_service_account_info(credentials_info)
-        logger.info(f"GCS client initialized for project: {gcs_client.project}")
-    except FileNotFoundError as exc:
-        logger.error(f"GCP key file not found: {settings.gcp_keypath}")
-        raise FileNotFoundError(f"GCP key file not found: {settings.gcp_keypath}") from exc
+        if gcs_render_cache is not None:
+            cached_names = await gcs_render_cache.get(cache_key, total_pages, format)
+            if cached_names is not None:
+                await gcs_render_cache.restore(cached_names, settings.gcs_bucket_image, image_filenames)
+                return [(page_num, f"gs://{settings.gcs_bucket_image}/{image_filename}") for page_num, image_filename in enumerate(image_filenames)]
+        if local_render_cache is None:
+            return []
+        cached_paths = await run_blocking(local_render_cache.get, cache_key, total_pages, format)
+        if cached_paths is None:
+            return []
+        image_paths = [os.path.join(images_dir, image_filename) for image_filename in image_filenames]
+        await run_blocking(lambda: [place_file(src, dest) for src, dest in zip(cached_paths, image_paths)])
+        return list(enumerate(image_paths))
     except Exception as e:
-        logger.error(f"Failed to initialize GCS client: {str(e)}")
-        raise RuntimeError(f"Failed to initialize GCS client: {str(e)}")
-else:
-    gcs_client = None
+        # キャッシュから配置できなかった場合は通常通り描画する（描画した画像で上書きされる）
+        logger.warning(f"Failed to restore cached pages, rendering instead: {str(e)}")
+        return []
 
-async def convert_1pdf_to_images(session_id: str, job_id: str, pdf_path: str, dpi: int, format: str, images_dir: str,) -> Tuple[str, List[str]]:
+async def _cache_rendered_pages(cache_key: str, rendered: List[Tuple[int, str]], format: str, imagenum_start: int):
+    """変換した画像をキャッシュに登録する（失敗しても変換結果には影響させない）"""
+    locations = [location for _, location in sorted(rendered)]
+    gcs_render_cache = get_gcs_render_cache()
+    local_render_cache = get_local_render_cache()
+    try:
+        if local_render_cache is not None:
+            await run_blocking(local_render_cache.put, cache_key, locations, format)
+        if gcs_render_cache is not None:
+            await gcs_render_cache.put(cache_key, settings.gcs_bucket_image, _image_filenames(imagenum_start, len(locations), format), format)
+    except Exception as e:
+        logger.warning(f"Failed to cache rendered pages: {str(e)}")
+
+def _count_pages(pdf_path: PdfSource) -> int:
+    """PDFのページ数を取得する"""
+    with open_pdf(pdf_path) as pdf_document:
+        return len(pdf_document)
+
+def _page_sizes(pdf_path: PdfSource) -> List[Tuple[float, float]]:
+    """PDFの各ページのサイズ（ポイント）を取得する"""
+    with open_pdf(pdf_path) as pdf_document:
+        return [(page.rect.width, page.rect.height) for page in pdf_document]
+
+async def _estimate_page_costs(pdf_path: PdfSource, dpi: int, format: str, options: RenderOptions, encoding: EncodeOptions) -> Optional[List[int]]:
+    """各ページのラスタのメモリ量を見積もる（メモリ上限が無効な場合はNone）"""
+    if memory_budget.limit <= 0:
+        return None
+    page_sizes = await run_blocking(_page_sizes, pdf_path)
+    return [estimate_raster_bytes(width, height, dpi, options, format, encoding) for width, height in page_sizes]
+
+async def convert_1pdf_to_images(
+    session_id: str,
+    job_id: str,
+    pdf_path: PdfSource,
+    dpi: int,
+    format: str,
+    images_dir: str,
+    imagenum_start: Optional[int] = None,
+    total_pages: Optional[int] = None,
+    encoding: Optional[EncodeOptions] = None,
+    reporter: Optional[ProgressReporter] = None,
+) -> Tuple[str, List[str]]:
     """
     単一のPDFファイルを画像に変換する
     
     Args:
         session_id: セッションID
         job_id: ジョブID
-        pdf_path: PDFファイルのパス
+        pdf_path: PDFファイルのパス、またはメモリ上のPDF
         dpi: 出力画像のDPI
         format: 出力画像のフォーマット
         images_dir: 出力ディレクトリ
+        imagenum_start: 予約済みの開始画像番号（未指定の場合はセッションから連番を確保する）
+        total_pages: 取得済みのページ数（未指定の場合はPDFを開いて取得する）
+        encoding: 画像のエンコード設定（未指定の場合は設定値）
+        reporter: ジョブ全体の進捗（複数PDFのジョブで共有する。このPDFのページ数は追加済みであること）。
+            未指定の場合はこのPDFのページ数で作成する
         
     Returns:
         Tuple[str, List[str]]: 出力ディレクトリのパスと生成された画像ファイルのパスのリスト
@@ -56,11 +263,11 @@ async def convert_1pdf_to_images(session_id: str, job_id: str, pdf_path: str, dp
         logger.info(f"Starting conversion of PDF: {pdf_path} with job_id: {job_id}, session_id: {session_id}")
         
         # PDFファイル名を取得（拡張子なし）
-        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        pdf_name = os.path.splitext(pdf_source_name(pdf_path))[0]
         logger.info(f"PDF name: {pdf_name}")
         
         # PDFを開く
-        if not os.path.exists(pdf_path):
+        if isinstance(pdf_path, str) and not os.path.exists(pdf_path):
             error_msg = f"PDF file not found: {pdf_path}"
             logger.error(error_msg)
             status = JobStatus(
@@ -69,17 +276,22 @@ async def convert_1pdf_to_images(session_id: str, job_id: str, pdf_path: str, dp
                 status="error",
                 message=error_msg,
                 progress=0,
-                created_at=datetime.now()
+                created_at=datetime.now(),
+                stage_timings=_current_stage_timings(job_id),
+                failed_uploads=_current_failed_uploads(job_id),
             )
             job_status_manager.update_status(job_id, status)
             return images_dir, []
             
         logger.info(f"Opening PDF file: {pdf_path}")
-        pdf_document = fitz.open(pdf_path)
-        total_pages = len(pdf_document)
-        image_paths = []
+        # ページ数のみ取得（描画は各ワーカーがPDFを開き直して行う）
+        if total_pages is None:
+            total_pages = await run_blocking(_count_pages, pdf_path)
+        rendered = []
 
-        imagenum_start = session_status_manager.get_imagenum(session_id)
+        if imagenum_start is None:
+            # 単独で呼ばれた場合は描画前にこのPDF分の連番を確保する
+            imagenum_start = (await _reserve_image_ranges(session_id, [total_pages]))[0]
         logger.info(f"Starting image number: {imagenum_start}, total pages: {total_pages}")
         
         # デバッグログ: セッション状態を確認
@@ -89,53 +301,99 @@ async def convert_1pdf_to_images(session_id: str, job_id: str, pdf_path: str, dp
         else:
             logger.error(f"No session status found for session_id: {session_id}")
         
-        # 各ページを画像に変換
-        for page_num in range(total_pages):
-            page = pdf_document[page_num]
-            pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
-            
-            # 画像ファイル名を生成（開始番号を考慮）
-            imagenum_current = imagenum_start + page_num
-            image_filename = f"{imagenum_current:07d}.{format}"
-            image_path = os.path.join(images_dir, image_filename)
-            
-            # デバッグログ: 連番生成を確認
-            logger.info(f"Page {page_num+1}: imagenum_start({imagenum_start}) + page_num({page_num}) = {imagenum_current} -> {image_filename}")
-            
-            logger.info(f"Rendering page {page_num+1}/{total_pages} to {image_path}")
-            
-            # 画像を保存
-            pix.save(image_path)
-            image_paths.append(image_path)
+        # ページ単位の進捗は間引いてジョブのステータスへ反映する
+        if reporter is None:
+            reporter = ProgressReporter(
+                session_id,
+                job_id,
+                total_pages,
+                min_interval=settings.progress_min_interval,
+                min_delta=settings.progress_min_delta,
+            )
+        
+        # 同じPDFを同じ設定で変換済みの場合は描画せずキャッシュから配置する
+        options = _render_options()
+        encoding = encoding or resolve_encode_options()
+        cache_key = None
+        # 登録・配置できるキャッシュがない場合はPDFのハッシュも計算しない
+        if total_pages > 0 and (get_local_render_cache() is not None or get_gcs_render_cache() is not None):
+            cache_key = render_cache_key(
+                await run_blocking(pdf_sha256, pdf_path),
+                dpi,
+                format,
+                {"render": asdict(options), "encode": asdict(encoding)},
+            )
+            rendered = await _restore_cached_pages(cache_key, total_pages, format, images_dir, imagenum_start)
+        
+        workers = resolve_worker_count(settings.render_workers)
+        # 描画中のページのメモリ量が上限を超えないよう、各ページの見積もり量を確保してから描画する
+        page_costs = None if rendered else await _estimate_page_costs(pdf_path, dpi, format, options, encoding)
+        if rendered:
+            logger.info(f"Restored {len(rendered)} pages from render cache: {pdf_path}")
+            reporter.advance(len(rendered))
+            cache_key = None
+        elif settings.gcp_region != "local":
+            # クラウドモード: 描画・エンコード・アップロードをパイプラインで並行させる
+            # （UPLOAD_FROM_MEMORYが有効な場合は/tmpに書き出さずメモリから直接アップロード）
+            def on_page_done(page_num: int, location: str):
+                logger.debug(f"Page {page_num+1}: imagenum_start({imagenum_start}) + page_num({page_num}) -> {location}")
+                reporter.advance()
             
-            if settings.gcp_region != "local" and gcs_client is not None:
-                try:
-                    logger.info(f"Uploading image to GCS_BUCKET_IMAGE: {settings.gcs_bucket_image}/{image_filename}")
-                    
-                    bucket = gcs_client.bucket(settings.gcs_bucket_image)
-                    blob = bucket.blob(f"{image_filename}")  # セッションIDとジョブIDを含めない
-                    
-                    blob.upload_from_filename(image_path)
-                    logger.info(f"Successfully uploaded image to GCS: {settings.gcs_bucket_image}/{image_filename}")
-                except Exception as e:
-                    error_msg = f"Failed to upload image to GCS: {str(e)}"
-                    logger.error(error_msg)
+            def on_upload_failed(page_num: int, image_filename: str, error: Exception):
+                # 失敗したページも処理済みとして進捗に含める（ジョブは残りのページを続行）
+                _record_upload_failure(job_id, image_filename)
+                reporter.advance()
             
-            # 進捗を更新
-            progress = (page_num + 1) / total_pages * 100
-            status = JobStatus(
-                session_id=session_id,
-                job_id=job_id,
-                status="processing",
-                message=f"ページ変換完了: {page_num + 1}/{total_pages}",
-                progress=progress,
-                created_at=datetime.now()
+            rendered, timings = await run_page_pipeline(
+                pdf_path,
+                total_pages,
+                dpi,
+                format,
+                images_dir,
+                imagenum_start,
+                upload=_upload_image,
+                on_page_done=on_page_done,
+                workers=workers,
+                upload_workers=settings.upload_workers,
+                queue_size=settings.pipeline_queue_size,
+                in_memory=settings.upload_from_memory,
+                upload_retries=settings.upload_max_retries,
+                upload_retry_delay=settings.upload_retry_delay,
+                on_upload_failed=on_upload_failed,
+                options=options,
+                page_costs=page_costs,
+                budget=memory_budget,
+                encoding=encoding,
             )
-            job_status_manager.update_status(job_id, status)
+            _merge_stage_timings(job_id, timings.as_dict())
+        else:
+            # ローカルモード: ページ範囲をプロセスプールのワーカーに分散して描画
+            async for rendered_pages in iter_rendered_pages(
+                pdf_path,
+                total_pages,
+                dpi,
+                format,
+                images_dir,
+                imagenum_start,
+                workers=workers,
+                pages_per_task=settings.render_pages_per_task,
+                options=options,
+                page_costs=page_costs,
+                budget=memory_budget,
+                encoding=encoding,
+            ):
+                for page_num, image_path in rendered_pages:
+                    logger.debug(f"Page {page_num+1}: imagenum_start({imagenum_start}) + page_num({page_num}) -> {os.path.basename(image_path)}")
+                rendered.extend(rendered_pages)
+                reporter.advance(len(rendered_pages))
+        reporter.flush()
         
-        # PDFを閉じる
-        session_status_manager.add_imagenum(session_id, total_pages)
-        pdf_document.close()
+        # すべてのページを変換できた場合のみキャッシュに登録する
+        if cache_key is not None and len(rendered) == total_pages:
+            await _cache_rendered_pages(cache_key, rendered, format, imagenum_start)
+        
+        # ページ順に並べ替え（ワーカーの完了順は不定のため）
+        image_paths = [image_path for _, image_path in sorted(rendered)]
         
         logger.info(f"PDF conversion completed: {pdf_path} -> {len(image_paths)} images")
         return images_dir, image_paths
@@ -143,70 +401,219 @@ async def convert_1pdf_to_images(session_id: str, job_id: str, pdf_path: str, dp
     except Exception as e:
         error_msg = f"Error converting PDF to images: {str(e)}"
         logger.error(error_msg)
+        # 同じジョブの先に変換したPDFが記録したアップロード失敗・処理時間は引き継ぐ
         status = JobStatus(
             session_id=session_id,
             job_id=job_id,
             status="error",
             message=error_msg,
             progress=0,
-            created_at=datetime.now()
+            created_at=datetime.now(),
+            stage_timings=_current_stage_timings(job_id),
+            failed_uploads=_current_failed_uploads(job_id),
         )
         job_status_manager.update_status(job_id, status)
         return images_dir, []
 
-async def convert_pdfs_to_images(session_id: str, job_id: str, pdf_paths: List[str], dpi: int = 300, format: str = "jpeg") -> Tuple[str, List[str]]:
+async def convert_pdfs_to_images(
+    session_id: str,
+    job_id: str,
+    pdf_paths: Union[List[ConversionSource], AsyncIterable[ConversionSource]],
+    dpi: int = 300,
+    format: str = "jpeg",
+    on_pdf_done: Optional[Callable[[PdfSource], None]] = None,
+    encoding: Optional[EncodeOptions] = None,
+) -> Tuple[str, List[str]]:
     """
     PDFファイルを画像変換する (複数対応)
     
+    pdf_paths にはダウンロード中のファイルを待つタスクを渡すこともでき、
+    その場合は各PDFが届いた時点で（それより前のPDFのページ数が分かり次第）変換を開始する。
+    アップロード中のセッションのように件数が確定していない場合は非同期イテレータを渡し、
+    PDFが追加されるたびに変換を開始する（イテレータが終了した時点で全体を完了とする）。
+    ZIPアーカイブ（ZipArchive）は格納されたPDFを1つずつ展開し、格納順に画像番号を割り当てる
+    
     Args:
         session_id: セッションID
         job_id: ジョブID
-        pdf_paths: PDFファイルのパスリスト
+        pdf_paths: PDFファイルのパス・メモリ上のPDF・ZIPアーカイブ、またはそれを返すAwaitableのリスト・非同期イテレータ（この順に画像番号を割り当てる）
         dpi: 出力画像のDPI
-        format: 出力形式（常にjpeg）
+        format: 出力形式（jpeg / jpg / png / webp）
+        on_pdf_done: 各PDFの変換が終わった（または失敗した）時点で呼ぶコールバック。PDFの解放に使う
+        encoding: 画像のエンコード設定（未指定の場合は設定値）
     
     Returns:
         Tuple[画像格納ディレクトリ, 生成された画像ファイルのパスリスト]
     """
     try:
-        # 常にJPEGとして処理
-        format = "jpeg"
-        logger.info(f"複数PDF変換開始: session_id={session_id}, job_id={job_id}, pdf_count={len(pdf_paths)}, dpi={dpi}")
+        format = format.lower()
+        encoding = encoding or resolve_encode_options()
+        # 不正な設定はPDFを読み込む前にエラーにする
+        encoding.validate(format)
+        incremental = not isinstance(pdf_paths, list)
+        pdf_count = "incremental" if incremental else len(pdf_paths)
+        logger.info(f"複数PDF変換開始: session_id={session_id}, job_id={job_id}, pdf_count={pdf_count}, dpi={dpi}, format={format}, encoding={encoding}")
         
         # 出力ディレクトリの作成
         images_dir = os.path.join(settings.get_session_dirpath(session_id), "images")
         os.makedirs(images_dir, exist_ok=True)
         
-        # すべての画像ファイルのパスを保持
-        all_image_paths = []
+        # 画像番号は入力順に連続した範囲を割り当てる。各PDFは自分より前のPDFの予約が済むまで待ち、
+        # 到着順に関わらず番号が決まるようにする（変換自体は予約後すぐに並行して始まる）
+        loop = asyncio.get_running_loop()
+        reserved: List[asyncio.Future] = []
+        
+        # 各PDFファイルを並行して処理（同時処理数はPDF_CONCURRENCYで制限）
+        conversions: List[asyncio.Task] = []
+        completed_files = 0
+        
+        # ジョブの進捗はすべてのPDFのページ数の合計に対する完了ページ数で表す。
+        # 総ページ数は各PDFの番号を予約した時点で増やし、すべてのPDFが揃って予約が済んだら確定する
+        reporter = ProgressReporter(
+            session_id,
+            job_id,
+            0,
+            min_interval=settings.progress_min_interval,
+            min_delta=settings.progress_min_delta,
+            total_known=False,
+        )
+        sources_added = False
+        
+        def update_total_known():
+            if sources_added and all(future.done() for future in reserved):
+                reporter.finish_total()
         
-        # 各PDFファイルを処理
-        total_files = len(pdf_paths)
-        for i, pdf_path in enumerate(pdf_paths, 1):
-            # PDFファイルを処理
-            _, image_paths = await convert_1pdf_to_images(session_id, job_id, pdf_path, dpi, format, images_dir)
-            all_image_paths.extend(image_paths)
+        # ZIPアーカイブから展開したPDFと展開元（変換が終わったPDFは展開元へ返して削除する）
+        member_archives: Dict[str, ZipArchive] = {}
+        archives_dir = os.path.join(settings.get_session_dirpath(session_id), "archives")
+        
+        def release(pdf_path: PdfSource):
+            archive = member_archives.pop(pdf_path, None) if isinstance(pdf_path, str) else None
+            if archive is not None:
+                archive.release(pdf_path)
+            elif on_pdf_done is not None:
+                on_pdf_done(pdf_path)
+        semaphore = asyncio.Semaphore(max(1, settings.pdf_concurrency))
+        
+        async def convert_one(index: int, source: Union[PdfSource, Awaitable[PdfSource]]) -> List[str]:
+            nonlocal completed_files
+            pdf_path = None
+            page_count = 0
+            try:
+                pdf_path = source if isinstance(source, (str, PdfBuffer)) else await source
+                page_count = await run_blocking(_count_pages, pdf_path)
+            except Exception as e:
+                # 取得できなかったPDFは0ページとして扱い、後続のPDFの番号をずらさない
+                logger.error(f"Failed to read page count: {pdf_path or f'#{index + 1}'}: {str(e)}")
+            
+            try:
+                if index > 0:
+                    await reserved[index - 1]
+                try:
+                    imagenum_start = (await _reserve_image_ranges(session_id, [page_count]))[0]
+                except Exception as e:
+                    reserved[index].set_exception(e)
+                    raise
+                reserved[index].set_result(imagenum_start)
+                reporter.add_total(page_count)
+                update_total_known()
+                logger.info(f"画像番号を予約: {pdf_source_name(pdf_path) if pdf_path else f'#{index + 1}'} start={imagenum_start}, pages={page_count}")
+                
+                image_paths = []
+                if page_count > 0:
+                    async with semaphore:
+                        _, image_paths = await convert_1pdf_to_images(
+                            session_id,
+                            job_id,
+                            pdf_path,
+                            dpi,
+                            format,
+                            images_dir,
+                            imagenum_start=imagenum_start,
+                            total_pages=page_count,
+                            encoding=encoding,
+                            reporter=reporter,
+                        )
+            finally:
+                # 変換が終わったPDFはすぐに解放し、同時に保持するPDFを変換中のものに限る
+                if pdf_path is not None:
+                    release(pdf_path)
             
-            # ジョブの進捗を更新
-            job_process = (i / total_files) * 100
+            # ジョブの進捗を更新（ファイル数は追加中のものがあるうちは確定しないため、件数のみ表示する）
+            completed_files += 1
+            if sources_added:
+                message = f"PDFファイル {completed_files}/{len(conversions)} を処理中"
+            else:
+                message = f"PDFファイル {completed_files} 件を処理済み"
+            failed_uploads = _current_failed_uploads(job_id)
             job_status = JobStatus(
                 session_id=session_id,
                 job_id=job_id,
                 status="processing",
-                message=f"PDFファイル {i}/{total_files} を処理中",
-                progress=job_process,
-                created_at=datetime.now()
+                message=message,
+                progress=reporter.progress,
+                created_at=datetime.now(),
+                stage_timings=_current_stage_timings(job_id),
+                failed_uploads=failed_uploads,
+                error=_upload_error_message(failed_uploads)
             )
             job_status_manager.update_status(job_id, job_status)
+            return image_paths
+        
+        def start(source: Union[PdfSource, Awaitable[PdfSource]]):
+            reserved.append(loop.create_future())
+            conversions.append(asyncio.create_task(convert_one(len(conversions), source)))
+        
+        async def add(source: ConversionSource):
+            if not isinstance(source, ZipArchive):
+                start(source)
+                return
+            # アーカイブは全体を展開せず、格納されたPDFを1つずつ展開して変換へ渡す
+            # （展開済みで変換待ちのPDFは PDF_CONCURRENCY + DOWNLOAD_AHEAD 個まで）
+            try:
+                async for member_path in source.iter_members(
+                    archives_dir,
+                    max(1, settings.pdf_concurrency) + settings.download_ahead,
+                    settings.max_upload_size,
+                    settings.upload_chunk_size,
+                ):
+                    member_archives[member_path] = source
+                    start(member_path)
+            except Exception as e:
+                # 読めなかったアーカイブは0件として扱い、後続のファイルの変換を続ける
+                logger.error(f"Failed to read archive {source.name}: {str(e)}")
         
-        # 完了ステータスを設定
+        try:
+            if incremental:
+                async for source in pdf_paths:
+                    await add(source)
+            else:
+                for source in pdf_paths:
+                    await add(source)
+            sources_added = True
+            update_total_known()
+            results = await asyncio.gather(*conversions)
+        except BaseException:
+            for conversion in conversions:
+                conversion.cancel()
+            await asyncio.gather(*conversions, return_exceptions=True)
+            raise
+        # 入力順に画像パスを連結
+        all_image_paths = [image_path for image_paths in results for image_path in image_paths]
+        
+        # 完了ステータスを設定（アップロードに失敗した画像があればエラー内容を残す）
+        failed_uploads = _current_failed_uploads(job_id)
+        upload_error = _upload_error_message(failed_uploads)
         job_complete_status = JobStatus(
             session_id=session_id,
             job_id=job_id,
             status="completed",
             message=f"ジョブ {job_id} のファイルの画像変換が完了しました",
             progress=100,
-            created_at=datetime.now()
+            created_at=datetime.now(),
+            stage_timings=_current_stage_timings(job_id),
+            failed_uploads=failed_uploads,
+            error=upload_error
         )
         job_status_manager.update_status(job_id, job_complete_status)
         
@@ -215,9 +622,9 @@ async def convert_pdfs_to_images(session_id: str, job_id: str, pdf_paths: List[s
             SessionStatus(
                 session_id=session_id,
                 status="completed",
-                message="PDF変換が完了しました",
+                message=f"PDF変換が完了しました（{upload_error}）" if upload_error else "PDF変換が完了しました",
                 progress=100,
-                pdf_num=len(pdf_paths),
+                pdf_num=len(conversions),
                 image_num=session_status_manager.get_imagenum(session_id),
                 created_at=datetime.now()
             )
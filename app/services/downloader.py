@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from app.core.executor import run_blocking
+from app.services.renderer import PdfBuffer, PdfSource
+
+logger = logging.getLogger(__name__)
+
+
+def plan_byte_ranges(size: int, chunk_size: int) -> List[tuple]:
+    """
+    オブジェクトを chunk_size ごとのバイト範囲に分割する
+
+    Returns:
+        List[tuple]: (開始位置, 終了位置) のリスト（GCSの範囲指定と同じく終了位置を含む）
+    """
+    return [(start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size)]
+
+
+def _download_range(blob, path: str, start: int, end: int) -> None:
+    """オブジェクトの一部を読み出し、ファイルの同じ位置に書き込む（ブロッキング）"""
+    data = blob.download_as_bytes(start=start, end=end)
+    with open(path, "r+b") as f:
+        f.seek(start)
+        f.write(data)
+
+
+def _allocate(path: str, size: int) -> None:
+    """範囲ごとに書き込めるよう、ファイルを最終サイズで作成する（ブロッキング）"""
+    with open(path, "wb") as f:
+        f.truncate(size)
+
+
+class ParallelDownloader:
+    """
+    GCSオブジェクトを並行してダウンロードする
+
+    転送単位（小さなファイル全体、または大きなファイルの1チャンク）ごとにセマフォを取得するため、
+    同時転送数は workers 以下に収まる。セマフォは取得待ちの順に解放されるので、
+    先に登録したファイルほど先に届く。
+    ダウンロード中は一時ファイル（.part）に書き込み、完了後にリネームするため、
+    変換処理が書き込み途中のファイルを読むことはない。
+
+    max_pending を指定した場合、ダウンロード済みで release() されていないファイルがその数に達すると
+    次のダウンロードを待たせる（/tmpやメモリに保持するPDFをバッチ全体ではなく一定数に抑える）
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        chunk_size: int,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        memory_threshold: int = 0,
+        max_pending: int = 0,
+    ):
+        self._semaphore = asyncio.Semaphore(max(1, workers))
+        self._chunk_size = max(1, chunk_size)
+        self._max_retries = max_retries
+        self._retry_delay = retry_delay
+        self._memory_threshold = memory_threshold
+        self._pending = asyncio.Semaphore(max_pending) if max_pending > 0 else None
+
+    async def _transfer(self, label: str, func, *args):
+        """転送単位を1つ実行する（失敗した場合は指数バックオフで再試行）"""
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                try:
+                    return await run_blocking(func, *args)
+                except Exception as e:
+                    attempt += 1
+                    if attempt > self._max_retries:
+                        raise
+                    logger.warning(f"Download failed: {label}: {str(e)} - retrying ({attempt}/{self._max_retries})")
+            await asyncio.sleep(self._retry_delay * 2 ** (attempt - 1))
+
+    async def _download_to_file(self, blob, local_path: str) -> str:
+        part_path = f"{local_path}.part"
+        size: Optional[int] = blob.size
+        try:
+            if size is None or size <= self._chunk_size:
+                await self._transfer(blob.name, blob.download_to_filename, part_path)
+            else:
+                # 大きなファイルは範囲指定で分割し、チャンクごとに並行して取得する
+                await run_blocking(_allocate, part_path, size)
+                ranges = plan_byte_ranges(size, self._chunk_size)
+                logger.info(f"Downloading {blob.name} in {len(ranges)} chunks ({size} bytes)")
+                chunks = [
+                    asyncio.create_task(self._transfer(f"{blob.name} [{start}-{end}]", _download_range, blob, part_path, start, end))
+                    for start, end in ranges
+                ]
+                try:
+                    await asyncio.gather(*chunks)
+                except BaseException:
+                    # 1チャンクでも失敗したら残りの転送を止める
+                    for chunk in chunks:
+                        chunk.cancel()
+                    await asyncio.gather(*chunks, return_exceptions=True)
+                    raise
+            os.replace(part_path, local_path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        logger.info(f"Downloaded {blob.name} to {local_path}")
+        return local_path
+
+    async def download(self, blob, local_path: str) -> PdfSource:
+        """
+        1つのオブジェクトをダウンロードする
+
+        サイズが memory_threshold 以下のオブジェクトはディスクに書き出さずメモリ上に保持する
+
+        Args:
+            blob: ダウンロードするBlob（list_blobsで取得したもの）
+            local_path: 保存先のパス
+
+        Returns:
+            PdfSource: 保存先のパス、またはメモリ上のPDF
+        """
+        if self._pending is not None:
+            await self._pending.acquire()
+        try:
+            size: Optional[int] = blob.size
+            if size is not None and size <= self._memory_threshold:
+                data = await self._transfer(blob.name, blob.download_as_bytes)
+                logger.info(f"Downloaded {blob.name} into memory ({len(data)} bytes)")
+                return PdfBuffer(name=os.path.basename(local_path), data=data)
+            return await self._download_to_file(blob, local_path)
+        except BaseException:
+            if self._pending is not None:
+                self._pending.release()
+            raise
+
+    def release(self, source: PdfSource) -> None:
+        """
+        変換が終わったPDFを解放する（ダウンロードしたファイルは削除する）
+
+        Args:
+            source: download() が返したパス、またはメモリ上のPDF
+        """
+        if isinstance(source, PdfBuffer):
+            source.release()
+        elif os.path.exists(source):
+            os.remove(source)
+        if self._pending is not None:
+            self._pending.release()
+
+    def start(self, blobs: list, local_paths: List[str]) -> List[asyncio.Task]:
+        """
+        ダウンロードを開始し、ファイルごとの完了を待てるタスクを返す
+
+        Args:
+            blobs: ダウンロードするBlobのリスト（この順に優先される）
+            local_paths: 各Blobの保存先パス
+
+        Returns:
+            List[asyncio.Task]: 各ファイルの保存先パス（またはメモリ上のPDF）を返すタスク（blobsと同じ順）
+        """
+        return [asyncio.create_task(self.download(blob, local_path)) for blob, local_path in zip(blobs, local_paths)]
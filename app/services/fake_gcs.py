@@ -0,0 +1,208 @@
+"""
+google.cloud.storage.Client の最小限のローカル代替（テスト・ベンチマーク用）
+
+本アプリが使用するAPI（bucket / blob / get_blob / list_blobs / upload_* / download_* など）のみを実装する。
+root_dir を指定した場合はオブジェクトをディスクに保存し、指定しない場合はメモリ上に保持する
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+try:  # google-cloud-storage is optional in local mode
+    from google.api_core.exceptions import NotFound, PreconditionFailed
+except ImportError:  # pragma: no cover - optional dependency
+    class NotFound(Exception):
+        pass
+
+    class PreconditionFailed(Exception):
+        pass
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def generation(self) -> Optional[int]:
+        return self.bucket._generation(self.name)
+
+    @property
+    def size(self) -> Optional[int]:
+        if not self.exists():
+            return None
+        return len(self.bucket._read(self.name))
+
+    @property
+    def updated(self) -> Optional[datetime]:
+        return self.bucket.client._updated.get((self.bucket.name, self.name))
+
+    def exists(self) -> bool:
+        return self.generation is not None
+
+    def delete(self) -> None:
+        self.bucket._delete(self.name)
+
+    def upload_from_string(self, data, content_type: Optional[str] = None, if_generation_match: Optional[int] = None, **kwargs) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket._write(self.name, bytes(data), if_generation_match)
+
+    def upload_from_file(self, file_obj, size: Optional[int] = None, content_type: Optional[str] = None, if_generation_match: Optional[int] = None, **kwargs) -> None:
+        data = file_obj.read() if size is None else file_obj.read(size)
+        self.bucket._write(self.name, data, if_generation_match)
+
+    def upload_from_filename(self, filename: str, content_type: Optional[str] = None, if_generation_match: Optional[int] = None, **kwargs) -> None:
+        with open(filename, "rb") as f:
+            self.bucket._write(self.name, f.read(), if_generation_match)
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, if_generation_match: Optional[int] = None, **kwargs) -> bytes:
+        data = self.bucket._read(self.name, if_generation_match)
+        if start is None and end is None:
+            return data
+        # GCSと同じく end は含む
+        return data[start or 0:None if end is None else end + 1]
+
+    def download_as_text(self, encoding: str = "utf-8", **kwargs) -> str:
+        return self.download_as_bytes(**kwargs).decode(encoding)
+
+    def download_to_file(self, file_obj, start: Optional[int] = None, end: Optional[int] = None, **kwargs) -> None:
+        file_obj.write(self.download_as_bytes(start=start, end=end, **kwargs))
+
+    def download_to_filename(self, filename: str, **kwargs) -> None:
+        with open(filename, "wb") as f:
+            self.download_to_file(f, **kwargs)
+
+    def reload(self, **kwargs) -> None:
+        if not self.exists():
+            raise NotFound(self.name)
+
+    def generate_signed_url(self, version: str = "v4", expiration=None, method: str = "GET", content_type: Optional[str] = None, **kwargs) -> str:
+        return f"https://storage.fake/{self.bucket.name}/{self.name}?method={method}"
+
+    def create_resumable_upload_session(self, content_type: Optional[str] = None, size: Optional[int] = None, origin: Optional[str] = None, **kwargs) -> str:
+        return f"https://storage.fake/upload/{self.bucket.name}/{self.name}?uploadType=resumable&upload_id={uuid.uuid4().hex}"
+
+
+class FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str):
+        self.client = client
+        self.name = name
+
+    def blob(self, name: str, **kwargs) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str, **kwargs) -> Optional[FakeBlob]:
+        blob = FakeBlob(self, name)
+        return blob if blob.exists() else None
+
+    def exists(self) -> bool:
+        return True
+
+    def list_blobs(
+        self,
+        prefix: Optional[str] = None,
+        max_results: Optional[int] = None,
+        start_offset: Optional[str] = None,
+        end_offset: Optional[str] = None,
+        **kwargs,
+    ) -> Iterator[FakeBlob]:
+        names = sorted(
+            name for name in self.client._names(self.name)
+            if (not prefix or name.startswith(prefix))
+            and (start_offset is None or name >= start_offset)
+            and (end_offset is None or name < end_offset)
+        )
+        if max_results is not None:
+            names = names[:max_results]
+        return iter([FakeBlob(self, name) for name in names])
+
+    def copy_blob(self, blob: FakeBlob, destination_bucket: "FakeBucket", new_name: Optional[str] = None, **kwargs) -> FakeBlob:
+        new_name = new_name or blob.name
+        destination_bucket._write(new_name, self._read(blob.name), None)
+        return FakeBlob(destination_bucket, new_name)
+
+    def _generation(self, name: str) -> Optional[int]:
+        return self.client._generations.get((self.name, name))
+
+    def _read(self, name: str, if_generation_match: Optional[int] = None) -> bytes:
+        return self.client._read(self.name, name, if_generation_match)
+
+    def _write(self, name: str, data: bytes, if_generation_match: Optional[int]) -> None:
+        self.client._write(self.name, name, data, if_generation_match)
+
+    def _delete(self, name: str) -> None:
+        self.client._delete(self.name, name)
+
+
+class FakeStorageClient:
+    """GCSクライアントのローカル代替"""
+
+    def __init__(self, root_dir: Optional[str] = None, project: str = "fake-project"):
+        self.project = project
+        self._root_dir = root_dir
+        self._lock = threading.Lock()
+        self._objects: Dict[tuple, bytes] = {}
+        self._generations: Dict[tuple, int] = {}
+        self._updated: Dict[tuple, datetime] = {}
+        self._next_generation = 1
+        # ベンチマーク用の統計
+        self.uploaded_bytes = 0
+        self.uploaded_objects = 0
+
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket(self, name)
+
+    def list_blobs(self, bucket_name: str, **kwargs) -> Iterator[FakeBlob]:
+        return self.bucket(bucket_name).list_blobs(**kwargs)
+
+    def _path(self, bucket_name: str, name: str) -> str:
+        return os.path.join(self._root_dir, bucket_name, name)
+
+    def _names(self, bucket_name: str):
+        with self._lock:
+            return [name for bucket, name in self._generations if bucket == bucket_name]
+
+    def _read(self, bucket_name: str, name: str, if_generation_match: Optional[int]) -> bytes:
+        key = (bucket_name, name)
+        with self._lock:
+            generation = self._generations.get(key)
+            if generation is None:
+                raise NotFound(f"{bucket_name}/{name}")
+            if if_generation_match is not None and if_generation_match != generation:
+                raise PreconditionFailed(f"{bucket_name}/{name}")
+            if self._root_dir is None:
+                return self._objects[key]
+        with open(self._path(bucket_name, name), "rb") as f:
+            return f.read()
+
+    def _write(self, bucket_name: str, name: str, data: bytes, if_generation_match: Optional[int]) -> None:
+        key = (bucket_name, name)
+        with self._lock:
+            if if_generation_match is not None and if_generation_match != self._generations.get(key, 0):
+                raise PreconditionFailed(f"{bucket_name}/{name}")
+            if self._root_dir is None:
+                self._objects[key] = data
+            else:
+                path = self._path(bucket_name, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+            self._generations[key] = self._next_generation
+            self._updated[key] = datetime.now(timezone.utc)
+            self._next_generation += 1
+            self.uploaded_bytes += len(data)
+            self.uploaded_objects += 1
+
+    def _delete(self, bucket_name: str, name: str) -> None:
+        key = (bucket_name, name)
+        with self._lock:
+            if self._generations.pop(key, None) is None:
+                raise NotFound(f"{bucket_name}/{name}")
+            self._updated.pop(key, None)
+            self._objects.pop(key, None)
+            if self._root_dir is not None:
+                os.remove(self._path(bucket_name, name))
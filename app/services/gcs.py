@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+
+from app.core.config import get_settings
+
+try:  # google-cloud-storage is optional in local mode
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import storage
+    from google.oauth2 import service_account
+    from requests.adapters import HTTPAdapter
+except ImportError:  # pragma: no cover - optional dependency
+    storage = None
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def resolve_pool_size(pool_size: int = 0) -> int:
+    """
+    HTTPコネクションプールのサイズを決定する
+
+    0の場合は、GCSへ同時にアクセスしうるスレッド数（I/Oスレッド数＋アップロード並列数）に合わせる
+    """
+    if pool_size > 0:
+        return pool_size
+    settings = get_settings()
+    return max(1, settings.io_workers + settings.upload_workers)
+
+
+def _create_google_client(keypath: str, pool_size: int):
+    """サービスアカウント認証情報から、コネクションプールを調整したGCSクライアントを生成"""
+    if storage is None:
+        raise RuntimeError("google-cloud-storage package is required for cloud mode")
+    with open(keypath, "r") as f:
+        credentials_info = json.load(f)
+    credentials = service_account.Credentials.from_service_account_info(credentials_info, scopes=storage.Client.SCOPE)
+
+    # requestsのデフォルト（10接続）では並列アップロード時に接続が使い回されず、
+    # 都度TLSハンドシェイクが発生するため、並列数に合わせてプールを広げる
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return storage.Client(project=credentials_info.get("project_id"), credentials=credentials, _http=session)
+
+
+def _create_client():
+    settings = get_settings()
+    if settings.gcs_backend == "fake":
+        from app.services.fake_gcs import FakeStorageClient
+
+        logger.info(f"Using fake GCS backend: {settings.gcs_fake_root or '(in-memory)'}")
+        return FakeStorageClient(root_dir=settings.gcs_fake_root or None)
+    if settings.gcs_backend != "google":
+        raise ValueError(f"Unknown GCS backend: {settings.gcs_backend}")
+
+    pool_size = resolve_pool_size(settings.gcs_pool_size)
+    try:
+        client = _create_google_client(settings.gcp_keypath, pool_size)
+    except FileNotFoundError as exc:
+        logger.error(f"GCP key file not found: {settings.gcp_keypath}")
+        raise FileNotFoundError(f"GCP key file not found: {settings.gcp_keypath}") from exc
+    except Exception as e:
+        logger.error(f"Failed to initialize GCS client: {str(e)}")
+        raise RuntimeError(f"Failed to initialize GCS client: {str(e)}")
+    logger.info(f"GCS client initialized for project: {client.project} (connection pool: {pool_size})")
+    return client
+
+
+def get_storage_client():
+    """
+    プロセス内で共有するGCSクライアントを取得（初回のみ生成）
+
+    認証情報の読み込み・トークン取得・TLS接続はクライアント単位で再利用されるため、
+    ジョブやリクエストごとにクライアントを生成しないこと
+
+    Returns:
+        google.cloud.storage.Client または FakeStorageClient
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def set_storage_client(client) -> None:
+    """共有クライアントを差し替える（テスト・ベンチマーク用）"""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def reset_storage_client() -> None:
+    """共有クライアントを破棄する（次回の取得時に再生成される）"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -0,0 +1,134 @@
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+try:  # google-cloud-storage is optional in local mode
+    from google.api_core.exceptions import NotFound, PreconditionFailed
+    _CONFLICT_ERRORS = (NotFound, PreconditionFailed)
+except ImportError:  # pragma: no cover - optional dependency
+    _CONFLICT_ERRORS = ()
+
+logger = logging.getLogger(__name__)
+
+
+class ImageNumberIndex(ABC):
+    """出力済み画像番号の最大値（ハイウォーターマーク）を保持するインデックス"""
+
+    @abstractmethod
+    def get(self) -> Optional[int]:
+        """記録済みの最大画像番号を取得（未作成の場合はNone）"""
+
+    @abstractmethod
+    def commit(self, image_num: int) -> None:
+        """画像番号を記録する（既存の値より大きい場合のみ更新）"""
+
+    @abstractmethod
+    def reset(self, image_num: int) -> None:
+        """最大画像番号を上書きする（全件走査による修復用）"""
+
+
+class LocalImageNumberIndex(ImageNumberIndex):
+    """ローカルモード用: 作業スペース内のSQLiteに1行で保持する"""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS image_index (id INTEGER PRIMARY KEY CHECK (id = 1), max_num INTEGER NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def get(self) -> Optional[int]:
+        row = self._connection().execute("SELECT max_num FROM image_index WHERE id = 1").fetchone()
+        return row[0] if row else None
+
+    def commit(self, image_num: int) -> None:
+        self._connection().execute(
+            "INSERT INTO image_index (id, max_num) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET max_num = MAX(max_num, excluded.max_num)",
+            (image_num,),
+        )
+
+    def reset(self, image_num: int) -> None:
+        self._connection().execute(
+            "INSERT INTO image_index (id, max_num) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET max_num = excluded.max_num",
+            (image_num,),
+        )
+
+
+class GCSImageNumberIndex(ImageNumberIndex):
+    """
+    クラウドモード用: バケット内の小さなオブジェクトに最大画像番号を保持する
+
+    更新は世代番号の前提条件（if_generation_match）付きで行い、
+    複数インスタンスが同時に更新しても値が巻き戻らないようにする
+    """
+
+    MAX_ATTEMPTS = 10
+
+    def __init__(self, client, bucket_name: str, blob_name: str):
+        self._client = client
+        self._bucket_name = bucket_name
+        self._blob_name = blob_name
+
+    def _bucket(self):
+        return self._client.bucket(self._bucket_name)
+
+    def get(self) -> Optional[int]:
+        blob = self._bucket().get_blob(self._blob_name)
+        if blob is None:
+            return None
+        # 値は増える方向にしか更新されないため、読み取りは世代を固定せず最新の値を読む
+        # （get_blob の後に他のインスタンスが更新しても失敗しない）
+        return int(blob.download_as_text())
+
+    def commit(self, image_num: int) -> None:
+        for _ in range(self.MAX_ATTEMPTS):
+            bucket = self._bucket()
+            blob = bucket.get_blob(self._blob_name)
+            try:
+                if blob is None:
+                    # if_generation_match=0 は「オブジェクトが存在しない場合のみ作成」を意味する
+                    bucket.blob(self._blob_name).upload_from_string(str(image_num), if_generation_match=0)
+                    return
+                current = int(blob.download_as_text(if_generation_match=blob.generation))
+                if current >= image_num:
+                    return
+                blob.upload_from_string(str(image_num), if_generation_match=blob.generation)
+                return
+            except _CONFLICT_ERRORS:
+                # 他のインスタンスが先に更新した場合は読み直して再試行
+                continue
+        raise RuntimeError(f"Failed to update image index after {self.MAX_ATTEMPTS} attempts")
+
+    def reset(self, image_num: int) -> None:
+        self._bucket().blob(self._blob_name).upload_from_string(str(image_num))
+
+
+_local_indexes: Dict[str, LocalImageNumberIndex] = {}
+_local_indexes_lock = threading.Lock()
+
+
+def get_local_image_index(path: str) -> LocalImageNumberIndex:
+    """パスごとにローカルインデックスを1つだけ生成して再利用する"""
+    with _local_indexes_lock:
+        index = _local_indexes.get(path)
+        if index is None:
+            index = LocalImageNumberIndex(path)
+            _local_indexes[path] = index
+        return index
@@ -0,0 +1,188 @@
+import asyncio
+import inspect
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from app.services.archive import ZipArchive, is_archive
+from app.services.renderer import PdfSource
+
+logger = logging.getLogger(__name__)
+
+# 受付終了をイテレータへ伝えるための番兵
+_CLOSED = None
+
+
+class SessionIngest:
+    """
+    アップロード中のセッションのPDFを、届いたものから順に変換へ渡す
+
+    アップロードURLを発行した順（アップロード順）に枠を確保し、変換側へはその順で
+    「PDFが届くのを待つAwaitable」を渡す。変換側は枠の順に画像番号の範囲を予約するため、
+    到着順に関わらず番号はアップロード順に決まり、アップロードと変換が重なって進む
+
+    ダウンロードを開始する関数として通知されたPDFは、アップロード順で自分より前の枠のダウンロードが
+    すべて開始されてから開始する。先に届いた後ろの枠がダウンローダーの保持枠（max_pending）を埋めて
+    前の枠の番号予約を待ち続け、前の枠のダウンロードが始まらなくなるのを防ぐ
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        idle_timeout: float,
+        on_pdf_done: Optional[Callable[[PdfSource], None]] = None,
+        arrival_timeout: Optional[float] = None,
+    ):
+        """
+        Args:
+            session_id: セッションID
+            idle_timeout: 次の枠の追加を待つ最大秒数（超えた場合は受付を終了する）
+            on_pdf_done: 変換が終わったPDFの解放処理
+            arrival_timeout: 枠を確保したPDFの到着を待つ最大秒数（超えた場合は未着のPDFを0ページとして扱う）。
+                未指定の場合は idle_timeout
+        """
+        self.session_id = session_id
+        self.idle_timeout = idle_timeout
+        self.arrival_timeout = arrival_timeout if arrival_timeout is not None else idle_timeout
+        self.on_pdf_done = on_pdf_done
+        self.task: Optional[asyncio.Task] = None
+        self._slots: Dict[str, asyncio.Future] = {}
+        # ジョブID -> (直前の枠のダウンロード開始, この枠のダウンロード開始)
+        self._turns: Dict[str, Tuple[Optional[asyncio.Future], asyncio.Future]] = {}
+        self._archives: Dict[str, str] = {}  # ZIPアーカイブのジョブID -> ファイル名
+        self._order: asyncio.Queue = asyncio.Queue()
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def job_ids(self) -> List[str]:
+        """枠を確保したジョブID（アップロード順）"""
+        return list(self._slots)
+
+    def register(self, job_id: str, filename: str = "") -> None:
+        """
+        ジョブ（1ファイル）の枠をアップロード順の末尾に確保する
+
+        ZIPアーカイブの場合は、格納されたPDFがこの枠の位置に格納順で並ぶ
+        """
+        if self._closed:
+            raise RuntimeError(f"Session {self.session_id} is no longer accepting uploads")
+        if job_id in self._slots:
+            return
+        loop = asyncio.get_running_loop()
+        previous = self._turns[next(reversed(self._turns))][1] if self._turns else None
+        self._slots[job_id] = loop.create_future()
+        self._turns[job_id] = (previous, loop.create_future())
+        if is_archive(filename):
+            self._archives[job_id] = filename
+        self._order.put_nowait(job_id)
+
+    def has_arrived(self, job_id: str) -> bool:
+        slot = self._slots.get(job_id)
+        return slot is not None and slot.done()
+
+    def arrived(
+        self,
+        job_id: str,
+        source: Union[PdfSource, Awaitable[PdfSource], Callable[[], Awaitable[PdfSource]]],
+    ) -> bool:
+        """
+        ジョブのPDFが届いたことを通知する
+
+        Args:
+            job_id: ジョブID
+            source: PDFファイルのパス・メモリ上のPDF、ダウンロード中のタスク、
+                またはダウンロードを開始してタスクを返す関数（アップロード順で前の枠の開始後に呼ぶ）
+
+        Returns:
+            bool: 枠に反映した場合はTrue（未登録のジョブ・通知済みの場合はFalse）
+        """
+        slot = self._slots.get(job_id)
+        if slot is None or slot.done():
+            return False
+        slot.set_result(source)
+        logger.info(f"PDF arrived for session {self.session_id}: job_id={job_id}")
+        return True
+
+    def failed(self, job_id: str, error: Exception) -> None:
+        """ジョブのPDFを受け取れなかったことを通知する（変換側では0ページとして扱う）"""
+        slot = self._slots.get(job_id)
+        if slot is not None and not slot.done():
+            slot.set_exception(error)
+
+    def close(self) -> None:
+        """受付を終了する（確保済みの枠のPDFがすべて変換された時点で変換全体が完了する）"""
+        if not self._closed:
+            self._closed = True
+            self._order.put_nowait(_CLOSED)
+
+    async def _wait_source(self, job_id: str) -> PdfSource:
+        previous, started = self._turns[job_id]
+        try:
+            try:
+                source = await asyncio.wait_for(asyncio.shield(self._slots[job_id]), self.arrival_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"PDF for job {job_id} did not arrive within {self.arrival_timeout}s")
+            finally:
+                # 届かなかった枠も、前の枠より先に後ろの枠のダウンロードを始めさせない
+                if previous is not None:
+                    await asyncio.shield(previous)
+            if callable(source):
+                source = source()
+        finally:
+            if not started.done():
+                started.set_result(None)
+        if inspect.isawaitable(source):
+            source = await source
+        return source
+
+    async def __aiter__(self) -> AsyncIterator[Union[Awaitable[PdfSource], ZipArchive]]:
+        while True:
+            try:
+                job_id = await asyncio.wait_for(self._order.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"No more uploads for session {self.session_id} within {self.idle_timeout}s, closing")
+                self._closed = True
+                return
+            if job_id is _CLOSED:
+                return
+            if job_id in self._archives:
+                # 変換が終わったらアーカイブ自体も解放する
+                yield ZipArchive(self._wait_source(job_id), self._archives[job_id], on_done=self.release)
+            else:
+                yield self._wait_source(job_id)
+
+    def release(self, source: PdfSource) -> None:
+        """変換が終わったPDFを解放する"""
+        if self.on_pdf_done is not None:
+            self.on_pdf_done(source)
+
+
+class IngestManager:
+    """セッションごとの SessionIngest を保持する"""
+
+    def __init__(self):
+        self._ingests: Dict[str, SessionIngest] = {}
+
+    def get(self, session_id: str) -> Optional[SessionIngest]:
+        return self._ingests.get(session_id)
+
+    def create(
+        self,
+        session_id: str,
+        idle_timeout: float,
+        on_pdf_done: Optional[Callable[[PdfSource], None]] = None,
+        arrival_timeout: Optional[float] = None,
+    ) -> SessionIngest:
+        ingest = SessionIngest(session_id, idle_timeout, on_pdf_done, arrival_timeout)
+        self._ingests[session_id] = ingest
+        return ingest
+
+    def remove(self, session_id: str) -> None:
+        self._ingests.pop(session_id, None)
+
+
+# シングルトンインスタンス
+ingest_manager = IngestManager()
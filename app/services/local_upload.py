@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from typing import AsyncIterator, BinaryIO, Dict, Optional, Tuple
+
+from app.core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(Exception):
+    """アップロードサイズが上限を超えた"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class UploadOffsetMismatchError(Exception):
+    """再開アップロードのチャンクが受信済みの位置より後ろから始まっている"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Chunk does not continue from the received offset {offset}")
+        self.offset = offset
+
+
+_CONTENT_RANGE = re.compile(r"^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$")
+
+# 同じファイルへの再開アップロードが並行して追記しないためのロック
+_append_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _open_for_write(path: str) -> BinaryIO:
+    return open(path, "wb")
+
+
+def _open_for_append(path: str) -> BinaryIO:
+    return open(path, "ab")
+
+
+async def save_stream(chunks: AsyncIterator[bytes], path: str, max_bytes: int = 0, chunk_size: int = 1024 * 1024) -> Tuple[int, str]:
+    """
+    受信中のデータをチャンクごとにファイルへ書き込む（全体をメモリに載せない）
+
+    受信した細かいチャンクは chunk_size までまとめてから書き込むため、
+    1アップロードあたりのメモリ使用量はファイルサイズに関わらず chunk_size 程度に収まる。
+    書き込み中は一時ファイル（.part）に保存し、完了後にリネームする。
+    上限を超えた場合や途中で切断された場合は一時ファイルを削除する
+
+    Args:
+        chunks: 受信データのチャンク（request.stream() など）
+        path: 保存先のパス
+        max_bytes: 最大サイズ（バイト、0の場合は無制限）
+        chunk_size: ファイルへ書き込む単位（バイト）
+
+    Returns:
+        Tuple[int, str]: 保存したサイズとSHA-256（16進数）
+
+    Raises:
+        UploadTooLargeError: 受信サイズが max_bytes を超えた場合
+    """
+    part_path = f"{path}.part"
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    f = await run_blocking(_open_for_write, part_path)
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise UploadTooLargeError(max_bytes)
+            digest.update(chunk)
+            buffer += chunk
+            if len(buffer) >= chunk_size:
+                await run_blocking(f.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_blocking(f.write, bytes(buffer))
+        await run_blocking(f.close)
+        os.replace(part_path, path)
+    except BaseException:
+        await run_blocking(f.close)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    logger.info(f"Saved upload to {path}: {size} bytes, sha256={digest.hexdigest()}")
+    return size, digest.hexdigest()
+
+
+async def iter_upload_file(file, chunk_size: int) -> AsyncIterator[bytes]:
+    """UploadFile（multipart）の内容を chunk_size ごとに読み出す"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_content_range(value: str) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """
+    再開アップロードの Content-Range ヘッダーを解析する（GCSの再開可能アップロードと同じ形式）
+
+    - "bytes 0-1048575/5000000": チャンクの送信（総サイズ不明の場合は "/*"）
+    - "bytes */5000000": 受信済みの位置の問い合わせ（チャンクなし）
+
+    Returns:
+        Tuple[Optional[int], Optional[int], Optional[int]]: (開始位置, 終了位置(含む), 総サイズ)。
+            問い合わせの場合は開始・終了位置が、総サイズ不明の場合は総サイズがNone
+
+    Raises:
+        ValueError: 形式が不正な場合
+    """
+    match = _CONTENT_RANGE.match(value.strip())
+    if match is None:
+        raise ValueError(f"Invalid Content-Range: {value}")
+    first, last, total = match.groups()
+    start = int(first) if first is not None else None
+    end = int(last) if last is not None else None
+    size = int(total) if total != "*" else None
+    if start is not None and (end < start or (size is not None and end >= size)):
+        raise ValueError(f"Invalid Content-Range: {value}")
+    if start is None and size is None:
+        # 総サイズを示さない問い合わせでは完了を判定できない
+        raise ValueError(f"Invalid Content-Range: {value}")
+    return start, end, size
+
+
+def received_bytes(path: str) -> int:
+    """再開アップロードで受信済みのバイト数（完了済みの場合はファイルサイズ）"""
+    part_path = f"{path}.part"
+    if os.path.exists(part_path):
+        return os.path.getsize(part_path)
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    return 0
+
+
+async def append_stream(
+    chunks: AsyncIterator[bytes],
+    path: str,
+    start: int,
+    total: Optional[int],
+    max_bytes: int = 0,
+    chunk_size: int = 1024 * 1024,
+) -> int:
+    """
+    再開アップロードのチャンクを一時ファイル（.part）に追記する
+
+    途中で切断された場合も受信済みのデータは残すため、クライアントは受信済みの位置
+    （received_bytes）を問い合わせて不足分のみを再送できる。
+    再送により受信済みの範囲と重なったデータは読み捨てる。
+    総サイズに達した時点で一時ファイルを保存先へリネームする
+
+    Args:
+        chunks: 受信データのチャンク（request.stream() など）
+        path: 保存先のパス
+        start: チャンクの開始位置
+        total: ファイルの総サイズ（不明の場合はNone）
+        max_bytes: 最大サイズ（バイト、0の場合は無制限）
+        chunk_size: ファイルへ書き込む単位（バイト）
+
+    Returns:
+        int: 追記後の受信済みバイト数
+
+    Raises:
+        UploadOffsetMismatchError: start が受信済みの位置より後ろの場合
+        UploadTooLargeError: 受信サイズが max_bytes を超えた場合（受信済みのデータは破棄する）
+        ValueError: 総サイズを超えるデータを受信した場合（受信済みのデータは破棄する）
+    """
+    part_path = f"{path}.part"
+    lock = _append_locks.setdefault(part_path, asyncio.Lock())
+    async with lock:
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if start > offset:
+            raise UploadOffsetMismatchError(offset)
+        skip = offset - start
+        buffer = bytearray()
+        discard = False
+        f = await run_blocking(_open_for_append, part_path)
+        try:
+            async for chunk in chunks:
+                if skip:
+                    # 受信済みの範囲と重なる部分は読み捨てる
+                    dropped = min(skip, len(chunk))
+                    chunk = chunk[dropped:]
+                    skip -= dropped
+                offset += len(chunk)
+                if max_bytes and offset > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                if total is not None and offset > total:
+                    raise ValueError(f"Received more than the declared size of {total} bytes")
+                buffer += chunk
+                if len(buffer) >= chunk_size:
+                    await run_blocking(f.write, bytes(buffer))
+                    buffer.clear()
+        except (UploadTooLargeError, ValueError):
+            discard = True
+            raise
+        finally:
+            # 切断された場合も受信済みのデータは書き込んでおく（次のチャンクで続きから再開できるように）
+            if buffer and not discard:
+                await run_blocking(f.write, bytes(buffer))
+            await run_blocking(f.close)
+            if discard:
+                os.remove(part_path)
+                _append_locks.pop(part_path, None)
+        if total is not None and offset == total:
+            os.replace(part_path, path)
+            _append_locks.pop(part_path, None)
+            logger.info(f"Completed resumable upload to {path}: {offset} bytes")
+    return offset
+
+
+async def complete_upload(path: str, total: int) -> int:
+    """
+    再開アップロードの受信済みのデータが総サイズに達していれば保存先へリネームする
+
+    総サイズ不明（"/*"）のチャンクだけで送り終えたアップロードを、総サイズ付きの問い合わせ
+    （"bytes */{総サイズ}"）で完了させるために使う
+
+    Returns:
+        int: 受信途中のデータのバイト数（総サイズと等しい場合は完了済み、受信途中のデータがない場合は0）
+
+    Raises:
+        ValueError: 受信済みのデータが総サイズを超えている場合（受信済みのデータは破棄する）
+    """
+    part_path = f"{path}.part"
+    lock = _append_locks.setdefault(part_path, asyncio.Lock())
+    async with lock:
+        if not os.path.exists(part_path):
+            return 0
+        offset = os.path.getsize(part_path)
+        if offset > total:
+            os.remove(part_path)
+            _append_locks.pop(part_path, None)
+            raise ValueError(f"Received more than the declared size of {total} bytes")
+        if offset == total:
+            os.replace(part_path, path)
+            _append_locks.pop(part_path, None)
+            logger.info(f"Completed resumable upload to {path}: {offset} bytes")
+    return offset
+
+
+def _file_sha256(path: str, chunk_size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """保存済みファイルのSHA-256（16進数）をチャンク単位で計算する"""
+    return await run_blocking(_file_sha256, path, chunk_size)
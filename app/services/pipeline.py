@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from app.core.executor import run_blocking
+from app.services.admission import MemoryBudget
+from app.services.renderer import (
+    EncodeOptions,
+    PdfSource,
+    RenderedPage,
+    RenderOptions,
+    get_render_pool,
+    render_encoded_page,
+    save_encoded_page,
+    shutdown_render_pool,
+)
+from app.services.uploader import upload_with_retry
+
+logger = logging.getLogger(__name__)
+
+# 各ステージの終了を後段へ伝えるための番兵
+_STAGE_DONE = None
+
+
+@dataclass
+class StageTimings:
+    """パイプライン各ステージの累積処理時間（秒）"""
+    rasterize: float = 0.0
+    encode: float = 0.0
+    upload: float = 0.0
+    wall: float = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds, 3) for name, seconds in asdict(self).items()}
+
+
+async def _run_stage(workers: int, worker: Callable[[], Awaitable[None]], next_queue: Optional[asyncio.Queue], next_workers: int) -> None:
+    """ステージのワーカーをすべて完了させた後、後段のワーカー数分の番兵を送る"""
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    if next_queue is not None:
+        for _ in range(next_workers):
+            await next_queue.put(_STAGE_DONE)
+
+
+async def run_page_pipeline(
+    pdf_path: PdfSource,
+    total_pages: int,
+    dpi: int,
+    format: str,
+    images_dir: str,
+    imagenum_start: int,
+    upload: Optional[Callable[[str, Union[str, bytes]], str]],
+    on_page_done: Callable[[int, str], None],
+    workers: int,
+    upload_workers: int,
+    queue_size: int,
+    in_memory: bool = False,
+    upload_retries: int = 0,
+    upload_retry_delay: float = 1.0,
+    on_upload_failed: Optional[Callable[[int, str, Exception], None]] = None,
+    options: RenderOptions = RenderOptions(),
+    page_costs: Optional[List[int]] = None,
+    budget: Optional[MemoryBudget] = None,
+    encoding: EncodeOptions = EncodeOptions(),
+) -> Tuple[List[Tuple[int, str]], StageTimings]:
+    """
+    rasterize/encode → hand-off → upload の3ステージでPDFを変換する
+
+    描画とエンコードは同じワーカープロセスで行い、親プロセスへはエンコード済みのデータだけを返す
+    （ラスタはプロセス間でコピーしない）。hand-off ステージはエンコード済みのデータをディスクに書き出して
+    （in_memory の場合はそのまま）アップロードへ渡す。
+    ステージ間は上限付きキューで接続されるため、ページN+1の描画とページNのアップロードが並行し、
+    後段が詰まった場合は前段が待機する（メモリ上のエンコード済みデータはキューサイズ分に抑えられる）
+
+    Args:
+        pdf_path: PDFファイルのパス、またはメモリ上のPDF
+        total_pages: 総ページ数
+        dpi: 出力画像のDPI
+        format: 出力画像のフォーマット
+        images_dir: 出力ディレクトリ
+        imagenum_start: 開始画像番号
+        upload: 画像のアップロード処理 (image_filename, 画像ファイルパスまたはエンコード済みデータ) -> 保存先。
+            Noneの場合はアップロードしない
+        on_page_done: ページ完了時のコールバック (page_num, 保存先)
+        workers: 描画・エンコードの並列数
+        upload_workers: アップロードの並列数
+        queue_size: ステージ間キューの上限
+        in_memory: Trueの場合はエンコード結果をディスクに書かず、メモリ上のデータをそのままアップロードする
+        upload_retries: 1ページのアップロードを再試行する最大回数
+        upload_retry_delay: 1回目の再試行までの待ち時間（秒）。以降は指数的に伸ばす
+        on_upload_failed: 再試行してもアップロードできなかったページのコールバック (page_num, image_filename, 例外)。
+            指定した場合は失敗したページを結果から除いて残りのページを続行し、Noneの場合はパイプライン全体を失敗させる
+        options: ページ描画の設定（画素数の上限など）
+        page_costs: 各ページのラスタのメモリ量の見積もり（budget を指定した場合に使う）
+        budget: 描画中のメモリ量の上限。各ページは見積もり量を確保できてから描画し、ワーカーがエンコード済みのデータを返した時点で返却する
+        encoding: 画像のエンコード設定（画質など）
+
+    Returns:
+        Tuple[List[Tuple[int, str]], StageTimings]: (ページ番号, 保存先) のリストとステージ別処理時間
+    """
+    pool = get_render_pool(workers)
+    loop = asyncio.get_running_loop()
+    timings = StageTimings()
+    started = time.perf_counter()
+    results: List[Tuple[int, str]] = []
+
+    handoff_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    upload_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    pages = iter(range(total_pages))
+    budget = budget or MemoryBudget(0)
+    # 確保中のメモリ量（ページ番号 -> 確保量）。失敗・キャンセル時にまとめて返却する
+    reserved: Dict[int, int] = {}
+
+    async def rasterizer() -> None:
+        for page_num in pages:
+            reserved[page_num] = await budget.acquire(page_costs[page_num] if page_costs else 0)
+            page: RenderedPage = await loop.run_in_executor(
+                pool, render_encoded_page, pdf_path, page_num, dpi, format, options, encoding
+            )
+            # ラスタはワーカー内で解放済み
+            budget.release(reserved.pop(page_num, 0))
+            timings.rasterize += page.render_seconds
+            timings.encode += page.encode_seconds
+            await handoff_queue.put(page)
+
+    async def handoff() -> None:
+        while True:
+            page = await handoff_queue.get()
+            if page is _STAGE_DONE:
+                return
+            image_filename = f"{imagenum_start + page.page_num:07d}.{format}"
+            payload: Union[str, bytes] = page.data
+            if not in_memory:
+                payload = os.path.join(images_dir, image_filename)
+                await run_blocking(save_encoded_page, page.data, payload)
+            await upload_queue.put((page.page_num, image_filename, payload))
+
+    async def uploader() -> None:
+        while True:
+            item = await upload_queue.get()
+            if item is _STAGE_DONE:
+                return
+            page_num, image_filename, payload = item
+            location = payload
+            if upload is not None:
+                upload_started = time.perf_counter()
+                try:
+                    location = await upload_with_retry(upload, image_filename, payload, upload_retries, upload_retry_delay)
+                except Exception as e:
+                    if on_upload_failed is None:
+                        raise
+                    # 1ページの失敗でジョブ全体を止めず、失敗を記録して次のページへ進む
+                    logger.error(f"Failed to upload {image_filename} after {upload_retries} retries: {str(e)}")
+                    on_upload_failed(page_num, image_filename, e)
+                    continue
+                finally:
+                    timings.upload += time.perf_counter() - upload_started
+            results.append((page_num, location))
+            on_page_done(page_num, location)
+
+    stages = [
+        asyncio.create_task(_run_stage(workers, rasterizer, handoff_queue, workers)),
+        asyncio.create_task(_run_stage(workers, handoff, upload_queue, upload_workers)),
+        asyncio.create_task(_run_stage(upload_workers, uploader, None, 0)),
+    ]
+    try:
+        await asyncio.gather(*stages)
+    except BaseException as exc:
+        # いずれかのステージが失敗した場合は残りのステージも止める
+        for stage in stages:
+            stage.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+        if isinstance(exc, BrokenProcessPool):
+            logger.error("Render process pool is broken, it will be recreated on next use")
+            shutdown_render_pool(wait=False)
+        raise
+    finally:
+        for acquired in reserved.values():
+            budget.release(acquired)
+        reserved.clear()
+
+    timings.wall = time.perf_counter() - started
+    logger.info(f"Pipeline finished for {pdf_path}: {timings.as_dict()}")
+    return sorted(results), timings
@@ -0,0 +1,119 @@
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from app.core.job_status import JobStatusManager, job_status_manager
+from app.models.schemas import JobStatus
+
+logger = logging.getLogger(__name__)
+
+# 総ページ数が確定するまでの進捗の上限（後から追加されるPDFがあるうちは完了と表示しない）
+_OPEN_TOTAL_MAX_PROGRESS = 99.0
+
+
+class ProgressReporter:
+    """
+    ページ単位の進捗更新を間引いてジョブのステータスへ反映する
+
+    前回の反映から min_interval 秒以上経過し、かつ進捗が min_delta ポイント以上進んだ場合のみ反映する。
+    2回目以降はJobStatusを新規生成せず、既存のステータスを直接更新する
+
+    複数のPDFをまとめて変換するジョブでは1つのReporterを共有し、各PDFのページ数が分かるたびに
+    add_total で総ページ数を増やす（total_known=False で作成し、すべて揃ったら finish_total を呼ぶ）。
+    総ページ数が増えても反映済みの進捗は後退させない
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        job_id: str,
+        total: int,
+        min_interval: float,
+        min_delta: float,
+        manager: JobStatusManager = job_status_manager,
+        clock: Callable[[], float] = time.monotonic,
+        total_known: bool = True,
+    ):
+        self.session_id = session_id
+        self.job_id = job_id
+        self.total = total
+        self.total_known = total_known
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self._manager = manager
+        self._clock = clock
+        self.completed = 0
+        self._last_progress: Optional[float] = None
+        self._last_completed = 0
+        self._last_published_at = 0.0
+        # ベンチマーク用の統計
+        self.published = 0
+        self.skipped = 0
+
+    @property
+    def progress(self) -> float:
+        if self.total:
+            progress = self.completed / self.total * 100
+        else:
+            progress = 100.0 if self.total_known else 0.0
+        if not self.total_known:
+            progress = min(progress, _OPEN_TOTAL_MAX_PROGRESS)
+        if self._last_progress is not None:
+            progress = max(progress, self._last_progress)
+        return progress
+
+    def add_total(self, count: int) -> None:
+        """総ページ数を増やす（ページ数が分かったPDFを追加する）"""
+        self.total += count
+
+    def finish_total(self) -> None:
+        """総ページ数を確定する（以降は完了ページ数が総ページ数に達すると100%になる）"""
+        self.total_known = True
+
+    def advance(self, count: int = 1) -> bool:
+        """
+        完了ページ数を進める
+
+        Returns:
+            bool: ステータスへ反映した場合はTrue
+        """
+        self.completed += count
+        now = self._clock()
+        if (self.completed < self.total or not self.total_known) and self._last_progress is not None:
+            if now - self._last_published_at < self.min_interval or self.progress - self._last_progress < self.min_delta:
+                self.skipped += 1
+                return False
+        self._publish(now)
+        return True
+
+    def flush(self) -> None:
+        """未反映の進捗があれば反映する"""
+        if self._last_progress is None or self._last_completed != self.completed or self._last_progress != self.progress:
+            self._publish(self._clock())
+
+    def _publish(self, now: float) -> None:
+        progress = self.progress
+        message = f"ページ変換完了: {self.completed}/{self.total}"
+        status = self._manager.get_status(self.job_id)
+        if status is None or status.status != "processing":
+            # 初回（または状態が変わった場合）のみステータスを生成する
+            self._manager.update_status(
+                self.job_id,
+                JobStatus(
+                    session_id=self.session_id,
+                    job_id=self.job_id,
+                    status="processing",
+                    message=message,
+                    progress=progress,
+                    created_at=datetime.now(),
+                    stage_timings=status.stage_timings if status else None,
+                    failed_uploads=status.failed_uploads if status else None,
+                ),
+            )
+        else:
+            self._manager.update_progress(self.job_id, progress, message)
+        self._last_progress = progress
+        self._last_completed = self.completed
+        self._last_published_at = now
+        self.published += 1
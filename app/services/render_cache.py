@@ -0,0 +1,244 @@
+"""
+変換済み画像のキャッシュ（PDFの内容とレンダリング設定をキーとする）
+
+同じPDFを同じ設定で再度変換する場合は、描画せずにキャッシュの画像をセッションの画像番号で配置する。
+ローカルディスク層（容量上限付きのLRU）と、GCS_BUCKET_WORKS 上のGCS層（任意）を持つ
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.core.executor import run_blocking
+from app.services.gcs import get_storage_client
+from app.services.renderer import PdfBuffer, PdfSource
+
+logger = logging.getLogger(__name__)
+
+# エントリのページ数などを記録するファイル（最後に書き出すため、存在すればエントリは完全）
+_MANIFEST = "manifest.json"
+
+
+def pdf_sha256(source: PdfSource, chunk_size: int = 1024 * 1024) -> str:
+    """PDFの内容のSHA-256を計算する（ブロッキング）"""
+    if isinstance(source, PdfBuffer):
+        return hashlib.sha256(source.data).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_cache_key(pdf_hash: str, dpi: int, format: str, encoder: Optional[Dict] = None) -> str:
+    """
+    キャッシュのキーを生成する
+
+    Args:
+        pdf_hash: PDFの内容のSHA-256
+        dpi: 出力画像のDPI
+        format: 出力画像のフォーマット
+        encoder: エンコーダーの設定（出力画像が変わる設定はすべて含める）
+    """
+    params = json.dumps({"pdf": pdf_hash, "dpi": dpi, "format": format, "encoder": encoder or {}}, sort_keys=True)
+    return hashlib.sha256(params.encode("utf-8")).hexdigest()
+
+
+def _page_filename(page_num: int, format: str) -> str:
+    # 数字だけの名前にしない（出力画像番号の走査で出力画像として数えられないように）
+    return f"page-{page_num:06d}.{format}"
+
+
+def place_file(src: str, dest: str) -> None:
+    """
+    src を dest に配置する（ハードリンク、別ファイルシステムの場合はコピー）
+
+    一時ファイル（ドット始まり）を経由してリネームするため、dest に書き込み途中のファイルは現れない
+    """
+    directory, filename = os.path.split(dest)
+    temp_path = os.path.join(directory, f".{filename}.{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(src, temp_path)
+    except OSError:
+        shutil.copyfile(src, temp_path)
+    os.replace(temp_path, dest)
+
+
+class LocalRenderCache:
+    """
+    ローカルディスク上のキャッシュ（合計サイズが max_bytes を超えた場合は最も長く使われていないエントリから削除）
+
+    エントリは root/キーの先頭2文字/キー/ に格納し、各ページの画像と manifest.json を置く。
+    使用順はプロセス内で管理し、起動時はマニフェストの更新日時（最後に使われた日時）から復元する
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Optional["OrderedDict[str, int]"] = None  # キー -> サイズ（古い順）
+        self._total = 0
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        """ディスク上のエントリから使用順を復元する（ロック内で呼ぶ）"""
+        if self._entries is not None:
+            return self._entries
+        found = []
+        if os.path.isdir(self.root):
+            for prefix in os.scandir(self.root):
+                if not prefix.is_dir() or prefix.name.startswith("."):
+                    continue
+                for entry in os.scandir(prefix.path):
+                    manifest_path = os.path.join(entry.path, _MANIFEST)
+                    try:
+                        with open(manifest_path) as f:
+                            size = json.load(f)["bytes"]
+                        found.append((os.stat(manifest_path).st_mtime, entry.name, size))
+                    except (OSError, ValueError, KeyError):
+                        # 書き込み途中で終了したエントリ
+                        shutil.rmtree(entry.path, ignore_errors=True)
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+        self._total = sum(self._entries.values())
+        return self._entries
+
+    def get(self, key: str, page_count: int, format: str) -> Optional[List[str]]:
+        """
+        キャッシュ済みの画像をページ順に取得する（ブロッキング）
+
+        Returns:
+            Optional[List[str]]: 各ページの画像パス。キャッシュにない場合はNone
+        """
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, _MANIFEST)
+        with self._lock:
+            entries = self._load_index()
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                if key in entries:
+                    self._remove(key)
+                return None
+            if manifest.get("pages") != page_count:
+                return None
+            if key not in entries:
+                # 他のプロセスが登録したエントリ
+                entries[key] = manifest.get("bytes", 0)
+                self._total += entries[key]
+            entries.move_to_end(key)
+            os.utime(manifest_path)
+        return [os.path.join(entry_dir, _page_filename(page_num, format)) for page_num in range(page_count)]
+
+    def put(self, key: str, image_paths: List[str], format: str) -> None:
+        """
+        変換した画像をキャッシュに登録する（ブロッキング、画像はページ順に渡す）
+
+        エントリは一時ディレクトリに作成してからリネームするため、読み出し側に作成途中のエントリは見えない
+        """
+        size = sum(os.path.getsize(path) for path in image_paths)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        temp_dir = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(temp_dir)
+        try:
+            for page_num, image_path in enumerate(image_paths):
+                place_file(image_path, os.path.join(temp_dir, _page_filename(page_num, format)))
+            with open(os.path.join(temp_dir, _MANIFEST), "w") as f:
+                json.dump({"pages": len(image_paths), "bytes": size}, f)
+            with self._lock:
+                entries = self._load_index()
+                if key in entries:
+                    return
+                try:
+                    os.rename(temp_dir, entry_dir)
+                except OSError:
+                    # 他のプロセスが登録済み
+                    return
+                entries[key] = size
+                self._total += size
+                self._evict()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        logger.info(f"Cached {len(image_paths)} rendered pages ({size} bytes): {key}")
+
+    def _evict(self) -> None:
+        """合計サイズが上限以下になるまで古いエントリを削除する（ロック内で呼ぶ）"""
+        while self.max_bytes and self._total > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            logger.info(f"Evicted render cache entry: {key}")
+
+    def _remove(self, key: str) -> None:
+        self._total -= self._entries.pop(key, 0)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+
+class GcsRenderCache:
+    """
+    GCS上のキャッシュ（インスタンス間で共有する）
+
+    エントリは bucket/prefix/キー/ に格納する。画像の登録・取り出しはサーバー側のコピーで行うため、
+    インスタンスを経由したデータ転送は発生しない。容量の上限はバケットのライフサイクルルールで管理する
+    """
+
+    def __init__(self, bucket_name: str, prefix: str):
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip("/")
+
+    def _name(self, key: str, filename: str) -> str:
+        return f"{self.prefix}/{key}/{filename}"
+
+    def _read_manifest(self, key: str) -> Optional[dict]:
+        blob = get_storage_client().bucket(self.bucket_name).get_blob(self._name(key, _MANIFEST))
+        return json.loads(blob.download_as_text()) if blob is not None else None
+
+    def _write_manifest(self, key: str, page_count: int) -> None:
+        blob = get_storage_client().bucket(self.bucket_name).blob(self._name(key, _MANIFEST))
+        blob.upload_from_string(json.dumps({"pages": page_count}), content_type="application/json")
+
+    @staticmethod
+    def _copy(source_bucket_name: str, source_name: str, dest_bucket_name: str, dest_name: str) -> None:
+        client = get_storage_client()
+        source_bucket = client.bucket(source_bucket_name)
+        source_bucket.copy_blob(source_bucket.blob(source_name), client.bucket(dest_bucket_name), dest_name)
+
+    async def get(self, key: str, page_count: int, format: str) -> Optional[List[str]]:
+        """
+        キャッシュ済みの画像のオブジェクト名をページ順に取得する
+
+        Returns:
+            Optional[List[str]]: 各ページのオブジェクト名。キャッシュにない場合はNone
+        """
+        manifest = await run_blocking(self._read_manifest, key)
+        if manifest is None or manifest.get("pages") != page_count:
+            return None
+        return [self._name(key, _page_filename(page_num, format)) for page_num in range(page_count)]
+
+    async def put(self, key: str, source_bucket_name: str, image_names: List[str], format: str) -> None:
+        """別のバケットにある変換済み画像をキャッシュへコピーする（画像はページ順に渡す）"""
+        await asyncio.gather(*(
+            run_blocking(self._copy, source_bucket_name, image_name, self.bucket_name, self._name(key, _page_filename(page_num, format)))
+            for page_num, image_name in enumerate(image_names)
+        ))
+        # マニフェストは最後に書き出す（存在すればすべてのページが揃っている）
+        await run_blocking(self._write_manifest, key, len(image_names))
+        logger.info(f"Cached {len(image_names)} rendered pages in gs://{self.bucket_name}/{self.prefix}: {key}")
+
+    async def restore(self, cached_names: List[str], bucket_name: str, image_names: List[str]) -> None:
+        """キャッシュの画像を別のバケットへコピーする"""
+        await asyncio.gather(*(
+            run_blocking(self._copy, self.bucket_name, cached_name, bucket_name, image_name)
+            for cached_name, image_name in zip(cached_names, image_names)
+        ))
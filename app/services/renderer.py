@@ -0,0 +1,436 @@
+import asyncio
+import io
+import logging
+import math
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+import fitz
+
+try:  # Pillow is optional (WebP output and JPEG subsampling/progressive)
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+from app.services.admission import MemoryBudget
+
+# NOTE: このモジュールはワーカープロセス側でもimportされるため、
+# 設定読込やGCSクライアント初期化などの重い処理をトップレベルで行わないこと
+
+logger = logging.getLogger(__name__)
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_workers: int = 0
+
+# ワーカープロセス内で開いたPDFのキャッシュ（ページ単位のタスクで毎回開き直さないため）
+_WORKER_DOCUMENT_CACHE_SIZE = 2
+_worker_documents: "OrderedDict[tuple, fitz.Document]" = OrderedDict()
+
+
+@dataclass(repr=False)
+class PdfBuffer:
+    """
+    ディスクに書き出さずメモリ上に保持したPDF
+
+    ワーカープロセスへはタスクごとにバイト列ごと渡される（ワーカー側では token 単位で開いたDocumentを再利用する）
+    """
+    name: str
+    data: bytes
+    token: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def __repr__(self) -> str:
+        return f"<memory:{self.name} ({len(self.data)} bytes)>"
+
+    def release(self) -> None:
+        """変換が終わったPDFのデータを解放する"""
+        self.data = b""
+
+
+# PDFの入力: ファイルパス、またはメモリ上のPDF
+PdfSource = Union[str, PdfBuffer]
+
+
+@dataclass(frozen=True)
+class RenderOptions:
+    """
+    ページ描画の設定（ワーカープロセスへタスクごとに渡す）
+
+    max_pixels を超えるページは、画素数が上限に収まるよう倍率を下げて描画する（1ページのラスタは常に上限以下）
+
+    auto_grayscale を有効にすると、低解像度の試し描画で無彩色と判定したページをグレースケール（1チャンネル）で描画する
+    """
+    max_pixels: int = 0  # 1ページの最大画素数（0で無制限）
+    auto_grayscale: bool = False
+    gray_tolerance: int = 12  # 無彩色とみなすRGBの差の最大値（スキャン画像の色ノイズを許容する）
+
+
+# 出力できる画像フォーマット
+IMAGE_FORMATS = ("jpeg", "jpg", "png", "webp")
+_JPEG_FORMATS = ("jpeg", "jpg")
+_SUBSAMPLINGS = ("4:4:4", "4:2:2", "4:2:0")
+
+
+@dataclass(frozen=True)
+class EncodeOptions:
+    """
+    画像のエンコード設定（ワーカープロセスへタスクごとに渡す）
+
+    quality はJPEG・WebPの画質（1-100）、subsampling と progressive はJPEGのみに適用する。
+    MuPDFのJPEGエンコーダーは画質のみ指定できるため、4:2:0以外のサブサンプリング・プログレッシブJPEG・WebPは
+    Pillowでエンコードする（Pillowがインストールされていない場合は validate() でエラーにする）
+    """
+    quality: int = 95
+    subsampling: str = "4:2:0"
+    progressive: bool = False
+
+    def requires_pillow(self, format: str) -> bool:
+        format = format.lower()
+        if format == "webp":
+            return True
+        return format in _JPEG_FORMATS and (self.subsampling != "4:2:0" or self.progressive)
+
+    def validate(self, format: str) -> None:
+        """フォーマットと設定の組み合わせを検証する（変換を始める前に呼ぶ）"""
+        if format.lower() not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {format} (supported: {', '.join(IMAGE_FORMATS)})")
+        if not 1 <= self.quality <= 100:
+            raise ValueError(f"Image quality must be between 1 and 100: {self.quality}")
+        if self.subsampling not in _SUBSAMPLINGS:
+            raise ValueError(f"Unsupported chroma subsampling: {self.subsampling} (supported: {', '.join(_SUBSAMPLINGS)})")
+        if Image is None and self.requires_pillow(format):
+            raise ValueError(f"Pillow is required for {format} output with subsampling={self.subsampling}, progressive={self.progressive}")
+
+
+def encode_pixmap(pix: fitz.Pixmap, format: str, encoding: EncodeOptions) -> bytes:
+    """Pixmapを format の画像データにエンコードする"""
+    format = format.lower()
+    if encoding.requires_pillow(format):
+        # samples_mv はPixmapのメモリを直接参照する（bytesへの複製を作らない）
+        image = Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples_mv)
+        buffer = io.BytesIO()
+        if format == "webp":
+            image.save(buffer, "WEBP", quality=encoding.quality)
+        else:
+            image.save(buffer, "JPEG", quality=encoding.quality, subsampling=encoding.subsampling, progressive=encoding.progressive)
+        return buffer.getvalue()
+    if format in _JPEG_FORMATS:
+        return pix.tobytes("jpeg", jpg_quality=encoding.quality)
+    return pix.tobytes(format)
+
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    """ファイルパスまたはメモリ上のPDFを開く"""
+    if isinstance(source, PdfBuffer):
+        return fitz.open(stream=source.data, filetype="pdf")
+    return fitz.open(source)
+
+
+def pdf_source_name(source: PdfSource) -> str:
+    """ログ・画像名に使うPDFのファイル名を取得"""
+    if isinstance(source, PdfBuffer):
+        return source.name
+    return os.path.basename(source)
+
+
+@dataclass
+class RenderedPage:
+    """
+    ワーカーで描画・エンコードしたページ
+
+    ラスタ（ピクセル列）はワーカー内で破棄し、プロセス間ではエンコード済みのデータだけを受け渡す
+    """
+    page_num: int
+    data: bytes
+    render_seconds: float
+    encode_seconds: float
+
+
+def resolve_worker_count(configured: int) -> int:
+    """設定値から描画ワーカー数を決定する（0以下の場合はCPUコア数）"""
+    if configured and configured > 0:
+        return configured
+    return os.cpu_count() or 1
+
+
+def get_render_pool(max_workers: int) -> ProcessPoolExecutor:
+    """ページ描画用のプロセスプールを取得（未作成の場合は作成）"""
+    global _render_pool, _render_pool_workers
+    if _render_pool is None:
+        # uvicornのスレッドを引き継がないようspawnでワーカーを起動する
+        _render_pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        _render_pool_workers = max_workers
+        logger.info(f"Render process pool started with {max_workers} workers")
+    return _render_pool
+
+
+def shutdown_render_pool(wait: bool = True) -> None:
+    """ページ描画用のプロセスプールを停止する"""
+    global _render_pool, _render_pool_workers
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=wait, cancel_futures=True)
+        _render_pool = None
+        _render_pool_workers = 0
+        logger.info("Render process pool stopped")
+
+
+def plan_page_ranges(total_pages: int, pages_per_task: int, workers: int) -> List[Tuple[int, int]]:
+    """
+    ページ範囲をワーカーに割り当てる単位へ分割する
+
+    ページ数が少ないPDFでも全ワーカーに行き渡るよう、
+    1タスクあたりのページ数は pages_per_task と total_pages / workers の小さい方とする
+
+    Returns:
+        List[Tuple[int, int]]: (開始ページ, 終了ページ(含まない)) のリスト
+    """
+    if total_pages <= 0:
+        return []
+    per_task = max(1, min(pages_per_task, math.ceil(total_pages / max(1, workers))))
+    return [(start, min(start + per_task, total_pages)) for start in range(0, total_pages, per_task)]
+
+
+def plan_page_zoom(width: float, height: float, dpi: int, options: RenderOptions) -> float:
+    """ページサイズ（ポイント）から描画倍率を決める（画素数が上限を超える場合は上限に収まる倍率）"""
+    zoom = dpi / 72
+    pixels = math.ceil(width * zoom) * math.ceil(height * zoom)
+    if options.max_pixels <= 0 or pixels <= options.max_pixels:
+        return zoom
+    # 切り上げで上限を超えないよう、倍率は少し小さめに丸める
+    scale = math.sqrt(options.max_pixels / pixels) * 0.999
+    while math.ceil(width * zoom * scale) * math.ceil(height * zoom * scale) > options.max_pixels:
+        scale *= 0.99
+    return zoom * scale
+
+
+# 無彩色の判定に使う試し描画の最大画素数
+_GRAY_PROBE_PIXELS = 256 * 1024
+
+
+def is_grayscale_page(page: fitz.Page, tolerance: int) -> bool:
+    """
+    ページが無彩色（白黒・グレースケール）かを低解像度の試し描画で判定する
+
+    試し描画に含まれる色の種類ごとに、RGBの差が tolerance 以下かを確かめる（有彩色が見つかった時点で打ち切る）
+    """
+    area = page.rect.width * page.rect.height
+    if area <= 0:
+        return True
+    zoom = min(1.0, math.sqrt(_GRAY_PROBE_PIXELS / area))
+    probe = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    for color in probe.color_count(colors=True):
+        r, g, b = color[0], color[1], color[2]
+        if max(r, g, b) - min(r, g, b) > tolerance:
+            return False
+    return True
+
+
+def estimate_raster_bytes(
+    width: float,
+    height: float,
+    dpi: int,
+    options: RenderOptions,
+    format: str = "jpeg",
+    encoding: EncodeOptions = EncodeOptions(),
+) -> int:
+    """
+    ページを描画・エンコードする間のラスタのメモリ量を見積もる（RGB）
+
+    グレースケールで描画するかは描画時の試し描画で決まるため、見積もりは常にRGBの量（上限）とする。
+    Pillowでエンコードする場合はPillowの画像としてもう1枚複製されるため、その分を含める
+
+    Args:
+        width: ページの幅（ポイント）
+        height: ページの高さ（ポイント）
+        dpi: 出力画像のDPI
+        options: ページ描画の設定
+        format: 出力画像のフォーマット
+        encoding: 画像のエンコード設定
+    """
+    zoom = plan_page_zoom(width, height, dpi, options)
+    copies = 2 if encoding.requires_pillow(format) else 1
+    return math.ceil(width * zoom) * math.ceil(height * zoom) * 3 * copies
+
+
+def render_page(page: fitz.Page, dpi: int, options: RenderOptions) -> fitz.Pixmap:
+    """1ページを描画する（画素数の上限を超える場合は上限に収まるDPIに下げる）"""
+    zoom = plan_page_zoom(page.rect.width, page.rect.height, dpi, options)
+    if zoom != dpi / 72:
+        logger.warning(f"Page {page.number + 1} exceeds {options.max_pixels} pixels, rendering at {zoom * 72:.0f} dpi instead of {dpi}")
+    colorspace = fitz.csRGB
+    if options.auto_grayscale and is_grayscale_page(page, options.gray_tolerance):
+        colorspace = fitz.csGRAY
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace)
+
+
+def _save_pixmap(pix: fitz.Pixmap, image_path: str, encoding: EncodeOptions) -> None:
+    """画像の拡張子のフォーマットでエンコードして保存する"""
+    save_encoded_page(encode_pixmap(pix, os.path.splitext(image_path)[1].lstrip("."), encoding), image_path)
+
+
+def _render_page_range(
+    pdf_path: PdfSource,
+    start_page: int,
+    end_page: int,
+    dpi: int,
+    format: str,
+    images_dir: str,
+    imagenum_start: int,
+    options: RenderOptions = RenderOptions(),
+    encoding: EncodeOptions = EncodeOptions(),
+) -> List[Tuple[int, str]]:
+    """
+    ワーカープロセスで指定範囲のページを描画して保存する
+
+    各ワーカーは自身でfitz.Documentを開く（Documentはプロセス間で共有できないため）
+
+    Returns:
+        List[Tuple[int, str]]: (ページ番号, 画像ファイルパス) のリスト
+    """
+    results = []
+    pdf_document = open_pdf(pdf_path)
+    try:
+        for page_num in range(start_page, end_page):
+            pix = render_page(pdf_document[page_num], dpi, options)
+            image_filename = f"{imagenum_start + page_num:07d}.{format}"
+            image_path = os.path.join(images_dir, image_filename)
+            _save_pixmap(pix, image_path, encoding)
+            results.append((page_num, image_path))
+    finally:
+        pdf_document.close()
+    return results
+
+
+def _open_cached_document(pdf_path: PdfSource) -> fitz.Document:
+    """ワーカープロセス内でPDFを開く（同一ファイルは開いたDocumentを再利用）"""
+    if isinstance(pdf_path, PdfBuffer):
+        key = ("memory", pdf_path.token)
+    else:
+        stat = os.stat(pdf_path)
+        key = (pdf_path, stat.st_mtime, stat.st_size)
+    pdf_document = _worker_documents.get(key)
+    if pdf_document is not None:
+        _worker_documents.move_to_end(key)
+        return pdf_document
+    pdf_document = open_pdf(pdf_path)
+    _worker_documents[key] = pdf_document
+    while len(_worker_documents) > _WORKER_DOCUMENT_CACHE_SIZE:
+        _, old_document = _worker_documents.popitem(last=False)
+        old_document.close()
+    return pdf_document
+
+
+def render_encoded_page(
+    pdf_path: PdfSource,
+    page_num: int,
+    dpi: int,
+    format: str,
+    options: RenderOptions = RenderOptions(),
+    encoding: EncodeOptions = EncodeOptions(),
+) -> RenderedPage:
+    """
+    ワーカープロセスで1ページを描画し、同じワーカーで format にエンコードして返す
+
+    ラスタをプロセス間でコピーしない（ピクセル列の取り出し・pickle・復元でページ全体のコピーが
+    何度も作られるのを避ける）ため、親プロセスへはエンコード済みのデータだけを返す
+    """
+    started = time.perf_counter()
+    pdf_document = _open_cached_document(pdf_path)
+    pix = render_page(pdf_document[page_num], dpi, options)
+    rendered = time.perf_counter()
+    data = encode_pixmap(pix, format, encoding)
+    return RenderedPage(
+        page_num=page_num,
+        data=data,
+        render_seconds=rendered - started,
+        encode_seconds=time.perf_counter() - rendered,
+    )
+
+
+def save_encoded_page(data: bytes, image_path: str) -> None:
+    """
+    エンコード済みの画像を一時ファイル（ドット始まり）に書き出してからリネームする
+
+    生成中のセッションの画像一覧（ZIPダウンロードなど）に書き込み途中のファイルが現れないようにする
+    """
+    directory, filename = os.path.split(image_path)
+    temp_path = os.path.join(directory, f".{filename}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, image_path)
+
+
+async def iter_rendered_pages(
+    pdf_path: PdfSource,
+    total_pages: int,
+    dpi: int,
+    format: str,
+    images_dir: str,
+    imagenum_start: int,
+    workers: int,
+    pages_per_task: int,
+    options: RenderOptions = RenderOptions(),
+    page_costs: Optional[List[int]] = None,
+    budget: Optional[MemoryBudget] = None,
+    encoding: EncodeOptions = EncodeOptions(),
+) -> AsyncIterator[List[Tuple[int, str]]]:
+    """
+    PDFのページをプロセスプールで並列に描画し、完了したページ範囲ごとに結果を返す
+
+    画像ファイル名は従来通り imagenum_start + page_num で決まるため、
+    完了順序に関わらず連番は変わらない
+
+    Args:
+        page_costs: 各ページの描画に必要なメモリ量の見積もり（budget を指定した場合に使う）
+        budget: 描画中のメモリ量の上限。各ページ範囲は見積もり量を確保できてからワーカーへ渡す
+            （ワーカーは範囲内のページを1枚ずつ描画するため、範囲の見積もりは最も大きいページの分）
+        encoding: 画像のエンコード設定
+
+    Yields:
+        List[Tuple[int, str]]: 完了したページ範囲の (ページ番号, 画像ファイルパス) のリスト
+    """
+    pool = get_render_pool(workers)
+    loop = asyncio.get_running_loop()
+    budget = budget or MemoryBudget(0)
+
+    async def render_range(start_page: int, end_page: int) -> List[Tuple[int, str]]:
+        cost = max(page_costs[start_page:end_page]) if page_costs else 0
+        async with budget.reserve(cost):
+            return await loop.run_in_executor(
+                pool,
+                _render_page_range,
+                pdf_path,
+                start_page,
+                end_page,
+                dpi,
+                format,
+                images_dir,
+                imagenum_start,
+                options,
+                encoding,
+            )
+
+    futures = [
+        asyncio.ensure_future(render_range(start_page, end_page))
+        for start_page, end_page in plan_page_ranges(total_pages, pages_per_task, _render_pool_workers or workers)
+    ]
+    try:
+        for future in asyncio.as_completed(futures):
+            yield await future
+    except BrokenProcessPool:
+        # ワーカーが異常終了した場合（OOMなど）は次回の変換で作り直す
+        logger.error("Render process pool is broken, it will be recreated on next use")
+        shutdown_render_pool(wait=False)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
@@ -5,34 +5,20 @@ import shutil
 import uuid
 from typing import Optional
 
-try:  # google-cloud-storage is optional in local mode
-    from google.cloud import storage
-except ImportError:  # pragma: no cover - optional dependency
-    storage = None
-import json
+from app.services.gcs import get_storage_client
+from app.services.image_index import GCSImageNumberIndex, ImageNumberIndex, get_local_image_index
+from app.services.renderer import IMAGE_FORMATS
 
 settings = get_settings()
 
 logger = logging.getLogger(__name__)
 
+# 変換画像の拡張子（出力形式はリクエストごとに異なる）
+_IMAGE_EXTENSIONS = tuple(f".{format}" for format in IMAGE_FORMATS)
+
 # ローカルストレージの初期化
 if settings.gcp_region == "local":
     os.makedirs(settings.workspace_path, exist_ok=True)
-    client = None
-else:
-    if storage is None:
-        raise RuntimeError("google-cloud-storage package is required for cloud mode")
-    try:
-        with open(settings.gcp_keypath, "r") as f:
-            credentials_info = json.load(f)
-        client = storage.Client.from_service_account_info(credentials_info)
-        logging.info(f"GCS client initialized for project: {client.project}")
-    except FileNotFoundError as exc:
-        logging.error(f"GCP key file not found: {settings.gcp_keypath}")
-        raise FileNotFoundError(f"GCP key file not found: {settings.gcp_keypath}") from exc
-    except Exception as e:
-        logging.error(f"Failed to initialize GCS client: {str(e)}")
-        raise RuntimeError(f"Failed to initialize GCS client: {str(e)}")
 
 def generate_session_url() -> tuple[str, str]:
     session_id = str(uuid.uuid4())
@@ -43,8 +29,32 @@ def generate_session_url() -> tuple[str, str]:
     else:
         return f"/upload/{session_id}", session_id
 
-def generate_upload_url(filename: str, session_id: str, content_type: str = "") -> tuple[str, str]:
-    """署名付きアップロードURLを生成（ローカルモードでは一時的なアップロードパスを返す）"""
+def generate_upload_url(
+    filename: str,
+    session_id: str,
+    content_type: str = "",
+    resumable: bool = False,
+    size: Optional[int] = None,
+    origin: Optional[str] = None,
+) -> tuple[str, str]:
+    """
+    署名付きアップロードURLを生成（ローカルモードでは一時的なアップロードパスを返す）
+
+    resumable=True の場合は再開可能アップロードのURLを返す。クラウドモードではGCSの再開可能アップロードセッション、
+    ローカルモードでは同じプロトコル（Content-Range付きのPUTでチャンクを送り、未完了の間は308と受信済みのRangeを返す）の
+    エンドポイントとなるため、クライアントは途中で切断されても不足分のみを再送できる
+
+    Args:
+        filename: アップロードするファイル名
+        session_id: セッションID
+        content_type: ファイルのContent-Type
+        resumable: 再開可能アップロードのURLを発行するか
+        size: ファイルの総サイズ（再開可能アップロードのみ、不明の場合はNone）
+        origin: ブラウザのOrigin（再開可能アップロードのCORS用）
+
+    Returns:
+        tuple[str, str]: アップロードURLとジョブID
+    """
     job_id = str(uuid.uuid4())
 
     # sanitize filename to prevent path traversal
@@ -59,27 +69,30 @@ def generate_upload_url(filename: str, session_id: str, content_type: str = "")
         encoded_filename = quote(safe_filename)
         upload_path = os.path.join(settings.get_storage_path(session_id, job_id), safe_filename)
         os.makedirs(os.path.dirname(upload_path), exist_ok=True)
+        if resumable:
+            return f"/local-upload/resumable/{session_id}/{job_id}/{encoded_filename}", job_id
         return f"/local-upload/{session_id}/{job_id}/{encoded_filename}", job_id
     else:
         # クラウドモード: 署名付きURLを生成
         if not content_type:
             content_type = "application/pdf"  # デフォルトのcontent_type
         
-        if client is None:
-            logger.error("GCS client is None, cannot generate upload URL")
-            raise RuntimeError("GCS client is None, cannot generate upload URL")
-            
         try:
-            bucket = client.bucket(settings.gcs_bucket_works)
+            bucket = get_storage_client().bucket(settings.gcs_bucket_works)
             blob = bucket.blob(f"{session_id}/{job_id}/{safe_filename}")
             
-            url = blob.generate_signed_url(
-                version="v4",
-                expiration=settings.sign_url_exp,
-                method="PUT",
-                content_type=content_type
-            )
-            logger.info(f"Generated signed URL for upload: {session_id}/{job_id}/{safe_filename}")
+            if resumable:
+                # セッションURL自体が認証情報を兼ねるため署名は不要（有効期間はGCS側で1週間）
+                url = blob.create_resumable_upload_session(content_type=content_type, size=size, origin=origin)
+                logger.info(f"Created resumable upload session: {session_id}/{job_id}/{safe_filename}")
+            else:
+                url = blob.generate_signed_url(
+                    version="v4",
+                    expiration=settings.sign_url_exp,
+                    method="PUT",
+                    content_type=content_type
+                )
+                logger.info(f"Generated signed URL for upload: {session_id}/{job_id}/{safe_filename}")
         except Exception as e:
             logger.error(f"Failed to generate signed URL: {str(e)}")
             raise
@@ -96,12 +109,20 @@ def cleanup_job(session_id: str, job_id: str) -> None:
         # クラウドモードのクリーンアップはCloud Storageのライフサイクルポリシーに任せる
         pass
 
-def _max_number_in_path(path: str) -> int:
-    """Return the maximum numeric filename in the given directory tree."""
+def _max_number_in_path(path: str, exclude: Optional[str] = None) -> int:
+    """Return the maximum numeric filename in the given directory tree.
+
+    Args:
+        path: directory to scan
+        exclude: directory inside path to skip (e.g. the render cache)
+    """
     max_number = 0
-    for _, _, files in os.walk(path):
+    excluded = os.path.realpath(exclude) if exclude else None
+    for root, dirs, files in os.walk(path):
+        if excluded is not None:
+            dirs[:] = [d for d in dirs if os.path.realpath(os.path.join(root, d)) != excluded]
         for filename in files:
-            if filename.lower().endswith((".jpeg", ".jpg")):
+            if filename.lower().endswith(_IMAGE_EXTENSIONS):
                 name, _ = os.path.splitext(filename)
                 if name.isdigit():
                     num = int(name)
@@ -109,9 +130,60 @@ def _max_number_in_path(path: str) -> int:
                         max_number = num
     return max_number
 
+def _scan_max_image_number(path: Optional[str] = None) -> int:
+    """Scan all stored images and return the maximum image number (slow)."""
+    if settings.gcp_region != "local":
+        bucket = get_storage_client().bucket(settings.gcs_bucket_image)
+        max_number = 0
+        for blob in bucket.list_blobs():
+            base = os.path.basename(blob.name)
+            if base.lower().endswith(_IMAGE_EXTENSIONS):
+                name, _ = os.path.splitext(base)
+                if name.isdigit():
+                    num = int(name)
+                    if num > max_number:
+                        max_number = num
+        return max_number
+
+    local_path = path or settings.workspace_path
+    # 変換画像キャッシュ内の画像は出力画像ではない
+    render_cache_dir = settings.render_cache_dir or os.path.join(settings.workspace_path, "render_cache")
+    return _max_number_in_path(local_path, exclude=render_cache_dir)
+
+def get_image_index(path: Optional[str] = None) -> ImageNumberIndex:
+    """Return the persistent high-water-mark index of committed image numbers."""
+    if settings.gcp_region != "local":
+        return GCSImageNumberIndex(get_storage_client(), settings.gcs_bucket_works, settings.image_index_blob)
+    local_path = path or settings.workspace_path
+    return get_local_image_index(os.path.join(local_path, "image_index.sqlite3"))
+
+def commit_image_number(image_num: int) -> None:
+    """Record that images up to image_num have been written."""
+    try:
+        get_image_index().commit(image_num)
+    except Exception as exc:
+        logger.error("Failed to update image index: %s", exc)
+
+def rebuild_image_index(path: Optional[str] = None) -> int:
+    """Rebuild the image index with a full scan (repair command).
+
+    Returns:
+        int: maximum image number found
+    """
+    max_number = _scan_max_image_number(path)
+    get_image_index(path).reset(max_number)
+    logger.info("Image index rebuilt: max image number %07d", max_number)
+    return max_number
+
 def get_next_image_number(path: Optional[str] = None) -> int:
     """Calculate the next available image number.
 
+    Reads the high-water mark from the image index. A full scan is only
+    performed when the index does not exist yet, and its result seeds the index.
+    If the index cannot be read, the number is taken from a full scan instead;
+    if that also fails the error is raised, since guessing a start number would
+    overwrite existing images.
+
     Args:
         path: Optional path for local mode. Defaults to workspace path.
 
@@ -119,24 +191,13 @@ def get_next_image_number(path: Optional[str] = None) -> int:
         int: next available number (current max + 1)
     """
     try:
-        if settings.gcp_region != "local":
-            if client is None:
-                logger.warning("GCS client is None, defaulting to 1")
-                return 1
-            bucket = client.bucket(settings.gcs_bucket_image)
-            max_number = 0
-            for blob in bucket.list_blobs():
-                base = os.path.basename(blob.name)
-                if base.lower().endswith((".jpeg", ".jpg")):
-                    name, _ = os.path.splitext(base)
-                    if name.isdigit():
-                        num = int(name)
-                        if num > max_number:
-                            max_number = num
-            return max_number + 1
-
-        local_path = path or settings.workspace_path
-        return _max_number_in_path(local_path) + 1
+        index = get_image_index(path)
+        max_number = index.get()
     except Exception as exc:
-        logger.error("Failed to get next image number: %s", exc)
-        return 1
+        logger.error("Failed to read image index, falling back to a full scan: %s", exc)
+        return _scan_max_image_number(path) + 1
+    if max_number is None:
+        logger.warning("Image index not found, rebuilding it with a full scan")
+        max_number = _scan_max_image_number(path)
+        index.commit(max_number)
+    return max_number + 1
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import random
+from typing import Callable, Union
+
+from app.core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+
+async def upload_with_retry(
+    upload: Callable[[str, Union[str, bytes]], str],
+    image_filename: str,
+    payload: Union[str, bytes],
+    max_retries: int,
+    retry_delay: float,
+) -> str:
+    """
+    画像を1枚アップロードする（失敗した場合は指数バックオフで再試行）
+
+    再試行の待ち時間には揺らぎを加え、同時に失敗したページが一斉に再送しないようにする
+
+    Args:
+        upload: アップロード処理 (image_filename, 画像ファイルパスまたはエンコード済みデータ) -> 保存先
+        image_filename: 画像ファイル名
+        payload: 画像ファイルのパス、またはエンコード済みの画像データ
+        max_retries: 再試行の最大回数
+        retry_delay: 1回目の再試行までの待ち時間（秒）
+
+    Returns:
+        str: 画像の保存先
+
+    Raises:
+        Exception: 最大回数まで再試行しても失敗した場合は最後の例外
+    """
+    attempt = 0
+    while True:
+        try:
+            return await run_blocking(upload, image_filename, payload)
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            delay = retry_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logger.warning(f"Upload failed: {image_filename}: {str(e)} - retrying in {delay:.1f}s ({attempt}/{max_retries})")
+            await asyncio.sleep(delay)
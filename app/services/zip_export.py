@@ -0,0 +1,313 @@
+"""
+変換済み画像を無圧縮（ZIP_STORED）のZIPとしてストリーミングする
+
+各エントリはデータ記述子（CRC・サイズをデータの後ろに置く形式）で書き出すため、CRCを事前に計算しなくても
+先頭から送信を始められる。無圧縮なのでZIP全体のバイト配置は各画像のサイズだけで決まり、
+アーカイブを作らずに総サイズ（Content-Length）と任意の範囲（Rangeリクエスト）を返せる
+"""
+
+import hashlib
+import logging
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Hashable, List, Optional, Tuple
+
+from app.core.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# これ以上の値はZIP64の拡張フィールドに格納し、本来のフィールドには目印（0xFFFF...）を入れる
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+_ZIP64_MARKER = 0xFFFFFFFF
+_ZIP64_COUNT_MARKER = 0xFFFF
+# bit 3: CRC・サイズをデータ記述子に置く / bit 11: ファイル名はUTF-8
+_FLAGS = 0x0008 | 0x0800
+_VERSION = 20
+_VERSION_ZIP64 = 45
+# 作成元: UNIX（外部属性にパーミッションを入れる）
+_MADE_BY = (3 << 8) | _VERSION_ZIP64
+_EXTERNAL_ATTR = (0o100644 & 0xFFFF) << 16
+
+# 送信済みエントリのCRC（途中から再開した場合に、送信済みの画像を読み直さないため）
+_CRC_CACHE_SIZE = 100_000
+_crc_cache: "OrderedDict[Hashable, int]" = OrderedDict()
+
+
+@dataclass
+class ZipEntry:
+    """ZIPに格納する1ファイル"""
+    name: str
+    size: int
+    mtime: float
+    key: Hashable  # 内容を識別するキー（パス・更新日時など、CRCのキャッシュに使う）
+    read: Callable[[int, int], bytes]  # (開始位置, 終了位置(含まない)) -> データ（ブロッキング）
+
+
+def _dos_datetime(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _is_zip64(entry: ZipEntry) -> bool:
+    return entry.size >= _ZIP64_LIMIT
+
+
+def _local_header(entry: ZipEntry) -> bytes:
+    name = entry.name.encode("utf-8")
+    dos_time, dos_date = _dos_datetime(entry.mtime)
+    if _is_zip64(entry):
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+        version, size_field = _VERSION_ZIP64, _ZIP64_MARKER
+    else:
+        extra = b""
+        version, size_field = _VERSION, 0
+    header = struct.pack(
+        "<IHHHHHIIIHH",
+        0x04034B50, version, _FLAGS, 0, dos_time, dos_date,
+        0, size_field, size_field, len(name), len(extra),
+    )
+    return header + name + extra
+
+
+def _data_descriptor(entry: ZipEntry, crc: int) -> bytes:
+    if _is_zip64(entry):
+        return struct.pack("<IIQQ", 0x08074B50, crc, entry.size, entry.size)
+    return struct.pack("<IIII", 0x08074B50, crc, entry.size, entry.size)
+
+
+def _descriptor_size(entry: ZipEntry) -> int:
+    return 24 if _is_zip64(entry) else 16
+
+
+def _central_header(entry: ZipEntry, crc: int, header_offset: int) -> bytes:
+    name = entry.name.encode("utf-8")
+    dos_time, dos_date = _dos_datetime(entry.mtime)
+    zip64_fields = []
+    size_field = entry.size
+    if _is_zip64(entry):
+        zip64_fields += [entry.size, entry.size]
+        size_field = _ZIP64_MARKER
+    offset_field = header_offset
+    if header_offset >= _ZIP64_LIMIT:
+        zip64_fields.append(header_offset)
+        offset_field = _ZIP64_MARKER
+    extra = b""
+    if zip64_fields:
+        extra = struct.pack(f"<HH{len(zip64_fields)}Q", 0x0001, 8 * len(zip64_fields), *zip64_fields)
+    version = _VERSION_ZIP64 if zip64_fields else _VERSION
+    header = struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50, _MADE_BY, version, _FLAGS, 0, dos_time, dos_date,
+        crc, size_field, size_field, len(name), len(extra), 0, 0, 0, _EXTERNAL_ATTR, offset_field,
+    )
+    return header + name + extra
+
+
+def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+    records = b""
+    if count >= _ZIP64_COUNT_LIMIT or cd_offset >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+        zip64_end_offset = cd_offset + cd_size
+        records += struct.pack(
+            "<IQHHIIQQQQ",
+            0x06064B50, 44, _VERSION_ZIP64, _VERSION_ZIP64, 0, 0, count, count, cd_size, cd_offset,
+        )
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_end_offset, 1)
+    count_field = count if count < _ZIP64_COUNT_LIMIT else _ZIP64_COUNT_MARKER
+    records += struct.pack(
+        "<IHHHHIIH",
+        0x06054B50, 0, 0, count_field, count_field,
+        cd_size if cd_size < _ZIP64_LIMIT else _ZIP64_MARKER,
+        cd_offset if cd_offset < _ZIP64_LIMIT else _ZIP64_MARKER,
+        0,
+    )
+    return records
+
+
+def _clip(data: bytes, position: int, start: int, end: int) -> bytes:
+    """position から始まる data のうち、[start, end) に含まれる部分を返す"""
+    lo = max(start - position, 0)
+    hi = min(end - position, len(data))
+    return data[lo:hi] if lo < hi else b""
+
+
+def _cache_crc(entry: ZipEntry, crc: int) -> None:
+    _crc_cache[entry.key] = crc
+    _crc_cache.move_to_end(entry.key)
+    while len(_crc_cache) > _CRC_CACHE_SIZE:
+        _crc_cache.popitem(last=False)
+
+
+def _compute_crc(entry: ZipEntry, chunk_size: int) -> int:
+    crc = 0
+    for position in range(0, entry.size, chunk_size):
+        crc = zlib.crc32(entry.read(position, min(position + chunk_size, entry.size)), crc)
+    return crc
+
+
+async def _entry_crc(entry: ZipEntry, chunk_size: int) -> int:
+    """エントリのCRCを取得する（未送信の場合は内容を読んで計算する）"""
+    crc = _crc_cache.get(entry.key)
+    if crc is None:
+        crc = await run_blocking(_compute_crc, entry, chunk_size)
+        _cache_crc(entry, crc)
+    return crc
+
+
+async def _read_entry(entry: ZipEntry, start: int, end: int, chunk_size: int) -> AsyncIterator[bytes]:
+    """エントリの [start, end) を chunk_size ごとに読み出す"""
+    for position in range(start, end, chunk_size):
+        expected = min(position + chunk_size, end) - position
+        data = await run_blocking(entry.read, position, position + expected)
+        if len(data) != expected:
+            # 一覧取得後に内容が変わった場合（配置が崩れるため続行しない）
+            raise IOError(f"{entry.name} changed while streaming")
+        yield data
+
+
+class ZipLayout:
+    """
+    エントリのサイズから決まるZIP全体のバイト配置
+
+    データを読まずに総サイズと各エントリの位置が分かるため、任意の範囲だけを生成できる
+    """
+
+    def __init__(self, entries: List[ZipEntry]):
+        self.entries = entries
+        self._offsets: List[Tuple[int, int, int, int]] = []
+        offset = 0
+        for entry in entries:
+            data_offset = offset + len(_local_header(entry))
+            descriptor_offset = data_offset + entry.size
+            end = descriptor_offset + _descriptor_size(entry)
+            self._offsets.append((offset, data_offset, descriptor_offset, end))
+            offset = end
+        self.cd_offset = offset
+        self.cd_size = sum(
+            len(_central_header(entry, 0, header_offset))
+            for entry, (header_offset, _, _, _) in zip(entries, self._offsets)
+        )
+        self.size = self.cd_offset + self.cd_size + len(_end_records(len(entries), self.cd_offset, self.cd_size))
+
+    @property
+    def etag(self) -> str:
+        """エントリの構成から決まるETag（内容が変わらない限り同じ値になり、If-Rangeでの再開に使う）"""
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(f"{entry.name}\0{entry.size}\0{entry.key}\n".encode("utf-8"))
+        return f'"{digest.hexdigest()}"'
+
+    async def iter_range(self, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        """
+        ZIPの [start, end) の範囲を生成する
+
+        範囲外の画像は読まない。ただし範囲内のデータ記述子・セントラルディレクトリに必要なCRCのうち、
+        この範囲で送信しない画像の分は内容を読んで計算する（送信済みの画像はキャッシュを使う）
+
+        Args:
+            start: 開始位置
+            end: 終了位置（含まない、Noneの場合は末尾まで）
+            chunk_size: 画像を読み出す単位（バイト）
+        """
+        end = self.size if end is None else min(end, self.size)
+        for entry, (header_offset, data_offset, descriptor_offset, entry_end) in zip(self.entries, self._offsets):
+            if entry_end <= start:
+                continue
+            if header_offset >= end:
+                return
+            chunk = _clip(_local_header(entry), header_offset, start, end)
+            if chunk:
+                yield chunk
+            crc = None
+            if data_offset < end and descriptor_offset > start:
+                lo = max(start, data_offset) - data_offset
+                hi = min(end, descriptor_offset) - data_offset
+                whole = lo == 0 and hi == entry.size
+                if not whole and end > descriptor_offset:
+                    crc = await _entry_crc(entry, chunk_size)
+                running = 0
+                async for piece in _read_entry(entry, lo, hi, chunk_size):
+                    if whole:
+                        running = zlib.crc32(piece, running)
+                    yield piece
+                if whole:
+                    crc = running
+                    _cache_crc(entry, crc)
+            if end > descriptor_offset:
+                if crc is None:
+                    crc = await _entry_crc(entry, chunk_size)
+                chunk = _clip(_data_descriptor(entry, crc), descriptor_offset, start, end)
+                if chunk:
+                    yield chunk
+
+        if end <= self.cd_offset:
+            return
+        position = self.cd_offset
+        for entry, (header_offset, _, _, _) in zip(self.entries, self._offsets):
+            size = len(_central_header(entry, 0, header_offset))
+            if position + size > start and position < end:
+                crc = await _entry_crc(entry, chunk_size)
+                chunk = _clip(_central_header(entry, crc, header_offset), position, start, end)
+                if chunk:
+                    yield chunk
+            position += size
+        chunk = _clip(_end_records(len(self.entries), self.cd_offset, self.cd_size), position, start, end)
+        if chunk:
+            yield chunk
+
+
+async def iter_live_zip(
+    list_entries: Callable[[], Awaitable[List[ZipEntry]]],
+    wait_for_more: Callable[[], Awaitable[bool]],
+    chunk_size: int = 1024 * 1024,
+) -> AsyncIterator[bytes]:
+    """
+    生成中の画像を、できたものから順にZIPとして送信する
+
+    総サイズが決まらないため範囲指定には対応しない。画像の生成が終わった時点で
+    セントラルディレクトリを書き出してZIPを閉じる
+
+    Args:
+        list_entries: 現時点で格納できる画像の一覧を返す
+        wait_for_more: 画像が増えるまで待つ。生成が終わった（これ以上増えない）場合はFalseを返す
+        chunk_size: 画像を読み出す単位（バイト）
+    """
+    written: List[Tuple[ZipEntry, int, int]] = []
+    seen = set()
+    offset = 0
+    more = True
+    while True:
+        for entry in await list_entries():
+            if entry.name in seen:
+                continue
+            seen.add(entry.name)
+            header_offset = offset
+            header = _local_header(entry)
+            yield header
+            crc = 0
+            async for piece in _read_entry(entry, 0, entry.size, chunk_size):
+                crc = zlib.crc32(piece, crc)
+                yield piece
+            _cache_crc(entry, crc)
+            descriptor = _data_descriptor(entry, crc)
+            yield descriptor
+            offset += len(header) + entry.size + len(descriptor)
+            written.append((entry, crc, header_offset))
+        if not more:
+            break
+        more = await wait_for_more()
+
+    cd_size = 0
+    for entry, crc, header_offset in written:
+        header = _central_header(entry, crc, header_offset)
+        cd_size += len(header)
+        yield header
+    yield _end_records(len(written), offset, cd_size)
+    logger.info(f"Streamed ZIP with {len(written)} entries ({offset + cd_size} bytes)")
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+PDF変換処理のベンチマーク
+
+合成PDFを生成して convert_pdfs_to_images を実行し、ページ/秒・ピークRSS・ステージ別処理時間・出力サイズをJSONで出力します。
+出力形式・画質を複数指定すると、出力サイズと処理速度のトレードオフを比較できます。
+クラウドモードはGCSをローカルの代替実装（FakeStorageClient）に差し替えるため、オフラインで実行できます。
+ピークRSSを正しく測るため、シナリオごとに子プロセスで実行します。
+
+使い方:
+    python benchmarks/bench_convert.py --output bench.json
+    python benchmarks/bench_convert.py --pages 50 --dpis 150,300 --sizes a4,a3 --contents vector,raster --modes local,cloud
+    python benchmarks/bench_convert.py --modes local --dpis 300 --formats jpeg,webp,png --qualities 95,85,75
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# プロジェクトのパスを追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# アプリの設定はimport時に読み込まれるため、先にローカルモードを指定しておく
+os.environ.setdefault("GCP_REGION", "local")
+
+
+def _maxrss_mb(who: int) -> float:
+    """ピークRSS（MB）を取得（LinuxはKB、macOSはバイト単位で返るため換算する）"""
+    maxrss = resource.getrusage(who).ru_maxrss
+    if platform.system() == "Darwin":
+        return round(maxrss / 1024 / 1024, 1)
+    return round(maxrss / 1024, 1)
+
+
+def run_scenario(scenario: dict) -> dict:
+    """1シナリオを実行して計測結果を返す（子プロセスで実行される）"""
+    import logging
+
+    logging.basicConfig(level=getattr(logging, scenario["log_level"]))
+    workdir = scenario["workdir"]
+    os.chdir(workdir)
+
+    from app.core.config import get_settings
+    from app.core.executor import shutdown_io_executor
+    from app.core.job_status import job_status_manager
+    from app.core.session_status import session_status_manager
+    from app.models.schemas import SessionStatus
+    from app.services import converter
+    from app.services.fake_gcs import FakeStorageClient
+    from app.services.gcs import set_storage_client
+    from app.services.renderer import EncodeOptions, shutdown_render_pool
+
+    settings = get_settings()
+    settings.workspace_path = os.path.join(workdir, "workspace")
+    settings.render_workers = scenario["workers"]
+    settings.render_cache = False
+    fake_client = None
+    if scenario["mode"] == "cloud":
+        fake_client = FakeStorageClient(root_dir=os.path.join(workdir, "gcs"))
+        set_storage_client(fake_client)
+        settings.gcp_region = "benchmark"
+        settings.gcs_bucket_image = "bench-image"
+        settings.gcs_bucket_works = "bench-works"
+
+    session_id = "bench-session"
+    job_id = "bench-job"
+    session_status_manager.update_status(
+        session_id,
+        SessionStatus(
+            session_id=session_id,
+            status="processing",
+            message="benchmark",
+            progress=0,
+            pdf_num=1,
+            image_num=1,
+            created_at=datetime.now(),
+        ),
+    )
+
+    started = time.perf_counter()
+    _, image_paths = asyncio.run(
+        converter.convert_pdfs_to_images(
+            session_id,
+            job_id,
+            scenario["pdf_paths"],
+            dpi=scenario["dpi"],
+            format=scenario["format"],
+            encoding=EncodeOptions(
+                quality=scenario["quality"],
+                subsampling=scenario["subsampling"],
+                progressive=scenario["progressive"],
+            ),
+        )
+    )
+    wall = time.perf_counter() - started
+    job_status = job_status_manager.get_status(job_id)
+
+    # ワーカープロセスのピークRSSはプール停止後（wait後）に取得できる
+    shutdown_render_pool()
+    shutdown_io_executor()
+
+    pages = len(image_paths)
+    if fake_client is not None:
+        output_bytes = fake_client.uploaded_bytes
+    else:
+        output_bytes = sum(os.path.getsize(path) for path in image_paths)
+    return {
+        **{
+            key: scenario[key]
+            for key in ("mode", "pages", "page_size", "content", "dpi", "format", "quality", "subsampling", "progressive", "workers")
+        },
+        "images": pages,
+        "wall_seconds": round(wall, 3),
+        "pages_per_second": round(pages / wall, 2) if wall else None,
+        "peak_rss_mb": _maxrss_mb(resource.RUSAGE_SELF),
+        "peak_rss_workers_mb": _maxrss_mb(resource.RUSAGE_CHILDREN),
+        "stage_timings": job_status.stage_timings if job_status else None,
+        "uploaded_bytes": fake_client.uploaded_bytes if fake_client else None,
+        "output_bytes": output_bytes,
+        "bytes_per_page": round(output_bytes / pages) if pages else None,
+        "status": job_status.status if job_status else None,
+    }
+
+
+def bench_progress_reporter(pages: int = 2000) -> dict:
+    """ページ進捗の反映コストを、毎ページJobStatusを生成していた方式と比較する"""
+    from app.core.job_status import JobStatusManager
+    from app.models.schemas import JobStatus
+    from app.services.progress import ProgressReporter
+
+    manager = JobStatusManager()
+    started = time.perf_counter()
+    for page_num in range(pages):
+        manager.update_status(
+            "naive",
+            JobStatus(
+                session_id="s",
+                job_id="naive",
+                status="processing",
+                message=f"ページ変換完了: {page_num + 1}/{pages}",
+                progress=(page_num + 1) / pages * 100,
+                created_at=datetime.now(),
+            ),
+        )
+    naive = time.perf_counter() - started
+
+    reporter = ProgressReporter("s", "coalesced", pages, min_interval=0.5, min_delta=1.0, manager=manager)
+    started = time.perf_counter()
+    for _ in range(pages):
+        reporter.advance()
+    reporter.flush()
+    coalesced = time.perf_counter() - started
+
+    return {
+        "pages": pages,
+        "per_page_status_us": round(naive / pages * 1e6, 2),
+        "progress_reporter_us": round(coalesced / pages * 1e6, 2),
+        "progress_reporter_published": reporter.published,
+    }
+
+
+def _csv(value: str, cast=str) -> list:
+    return [cast(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF変換処理のベンチマーク")
+    parser.add_argument("--pages", default="20", help="PDFのページ数（カンマ区切り）")
+    parser.add_argument("--dpis", default="150,300", help="出力DPI（カンマ区切り）")
+    parser.add_argument("--sizes", default="a4", help="ページサイズ a4/a3/letter（カンマ区切り）")
+    parser.add_argument("--contents", default="vector,raster", help="内容 vector/raster/mixed（カンマ区切り）")
+    parser.add_argument("--modes", default="local,cloud", help="local/cloud（cloudはGCSをローカル代替に差し替え）")
+    parser.add_argument("--formats", default="jpeg", help="出力形式 jpeg/png/webp（カンマ区切り、webpはPillowが必要）")
+    parser.add_argument("--qualities", default="95", help="JPEG・WebPの画質（カンマ区切り、pngには適用しない）")
+    parser.add_argument("--subsampling", default="4:2:0", help="JPEGの色差サブサンプリング 4:4:4/4:2:2/4:2:0（4:2:0以外はPillowが必要）")
+    parser.add_argument("--progressive", action="store_true", help="プログレッシブJPEGで出力する（Pillowが必要）")
+    parser.add_argument("--workers", type=int, default=0, help="描画ワーカー数（0の場合はCPUコア数）")
+    parser.add_argument("--seed", type=int, default=0, help="合成PDFの乱数シード")
+    parser.add_argument("--log-level", default="WARNING", help="変換処理のログレベル")
+    parser.add_argument("--output", help="結果JSONの出力先（未指定の場合は標準出力）")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(json.loads(args.run_scenario))))
+        return
+
+    from benchmarks.synthetic_pdf import generate_pdf
+
+    import fitz
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="pdf-bench-") as tmpdir:
+        pdf_cache = {}
+        # 画質を指定できないpngは、画質ごとに同じシナリオを繰り返さない
+        encodings = list(dict.fromkeys(
+            (format, None if format == "png" else quality)
+            for format, quality in itertools.product(_csv(args.formats), _csv(args.qualities, int))
+        ))
+        matrix = itertools.product(
+            _csv(args.modes), _csv(args.pages, int), _csv(args.sizes), _csv(args.contents), _csv(args.dpis, int), encodings
+        )
+        for mode, pages, page_size, content, dpi, (format, quality) in matrix:
+            key = (pages, page_size, content)
+            if key not in pdf_cache:
+                pdf_cache[key] = generate_pdf(
+                    os.path.join(tmpdir, f"{pages}-{page_size}-{content}.pdf"), pages, page_size, content, args.seed
+                )
+            scenario = {
+                "mode": mode,
+                "pages": pages,
+                "page_size": page_size,
+                "content": content,
+                "dpi": dpi,
+                "format": format,
+                "quality": quality or 95,
+                "subsampling": args.subsampling,
+                "progressive": args.progressive,
+                "workers": args.workers,
+                "log_level": args.log_level.upper(),
+                "pdf_paths": [pdf_cache[key]],
+                "workdir": tempfile.mkdtemp(dir=tmpdir),
+            }
+            print(
+                f"running: {mode} pages={pages} size={page_size} content={content} dpi={dpi} format={format} quality={quality}",
+                file=sys.stderr,
+            )
+            completed = subprocess.run(
+                [sys.executable, __file__, "--run-scenario", json.dumps(scenario)],
+                capture_output=True,
+                text=True,
+            )
+            if completed.returncode != 0:
+                print(completed.stderr, file=sys.stderr)
+                raise SystemExit(f"scenario failed: {scenario}")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(
+                f"  -> {result['pages_per_second']} pages/s, {result['bytes_per_page']} bytes/page, peak RSS {result['peak_rss_mb']} MB",
+                file=sys.stderr,
+            )
+            results.append(result)
+
+        report = {
+            "meta": {
+                "created_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "pymupdf": fitz.VersionBind,
+                "seed": args.seed,
+            },
+            "scenarios": results,
+            "micro": {"progress_reporter": bench_progress_reporter()},
+        }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
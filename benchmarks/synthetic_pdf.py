@@ -0,0 +1,89 @@
+"""
+ベンチマーク用の合成PDFを生成する
+
+同じ引数からは常に同じPDFが生成されるよう、乱数はシード固定で使用する
+"""
+
+import random
+
+import fitz
+
+# ページサイズ（ポイント）
+PAGE_SIZES = {
+    "a4": (595, 842),
+    "a3": (842, 1191),
+    "letter": (612, 792),
+}
+
+CONTENT_TYPES = ("vector", "raster", "mixed")
+
+
+def _draw_vector(page: fitz.Page, rng: random.Random) -> None:
+    """テキスト・罫線・図形でページを埋める（ベクター主体のPDFを想定）"""
+    width, height = page.rect.width, page.rect.height
+    y = 40
+    while y < height - 40:
+        page.insert_text((40, y), "PDF Bulk Converter benchmark " * 3, fontsize=8)
+        y += 12
+    shape = page.new_shape()
+    for _ in range(200):
+        x0, y0 = rng.uniform(0, width), rng.uniform(0, height)
+        shape.draw_line((x0, y0), (x0 + rng.uniform(-80, 80), y0 + rng.uniform(-80, 80)))
+    for _ in range(50):
+        x0, y0 = rng.uniform(0, width - 60), rng.uniform(0, height - 60)
+        shape.draw_rect(fitz.Rect(x0, y0, x0 + rng.uniform(10, 60), y0 + rng.uniform(10, 60)))
+    shape.finish(color=(0, 0, 0), fill=(0.8, 0.8, 0.9), width=0.5)
+    shape.commit()
+
+
+def _draw_raster(page: fitz.Page, rng: random.Random, image_dpi: int = 150) -> None:
+    """ページ全面に画像を貼り付ける（スキャンPDFを想定）"""
+    width = int(page.rect.width / 72 * image_dpi)
+    height = int(page.rect.height / 72 * image_dpi)
+    # 完全なノイズは非現実的に圧縮しにくいため、ブロック単位の濃淡にする
+    block = 16
+    row_blocks = [rng.randbytes((width + block - 1) // block * 3) for _ in range((height + block - 1) // block)]
+    samples = bytearray()
+    for y in range(height):
+        blocks = row_blocks[y // block]
+        row = bytearray()
+        for x in range(0, width, block):
+            pixel = blocks[(x // block) * 3:(x // block) * 3 + 3]
+            row += pixel * min(block, width - x)
+        samples += row
+    pix = fitz.Pixmap(fitz.csRGB, width, height, bytes(samples), 0)
+    page.insert_image(page.rect, pixmap=pix)
+
+
+def generate_pdf(path: str, pages: int, page_size: str = "a4", content: str = "vector", seed: int = 0) -> str:
+    """
+    合成PDFを生成する
+
+    Args:
+        path: 出力先のパス
+        pages: ページ数
+        page_size: ページサイズ（PAGE_SIZESのキー）
+        content: "vector"（テキスト・図形）/ "raster"（全面画像）/ "mixed"（交互）
+        seed: 乱数シード
+
+    Returns:
+        str: 出力先のパス
+    """
+    if page_size not in PAGE_SIZES:
+        raise ValueError(f"Unknown page size: {page_size}")
+    if content not in CONTENT_TYPES:
+        raise ValueError(f"Unknown content type: {content}")
+    rng = random.Random(seed)
+    width, height = PAGE_SIZES[page_size]
+    doc = fitz.open()
+    try:
+        for page_num in range(pages):
+            page = doc.new_page(width=width, height=height)
+            if content == "vector" or (content == "mixed" and page_num % 2 == 0):
+                _draw_vector(page, rng)
+            else:
+                _draw_raster(page, rng)
+        doc.save(path, garbage=3, deflate=True)
+    finally:
+        doc.close()
+    return path
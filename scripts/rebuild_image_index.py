@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+画像番号インデックスの再構築スクリプト
+
+保存済みの画像（ローカルモードでは作業スペース、クラウドモードではGCS_BUCKET_IMAGE）を全件走査し、
+セッション作成時に参照する最大画像番号のインデックスを作り直します。
+インデックスが壊れた場合や、画像を手動で追加・削除した場合に実行してください。
+
+使い方:
+    python scripts/rebuild_image_index.py
+"""
+
+import sys
+from pathlib import Path
+
+# プロジェクトのパスを追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.storage import rebuild_image_index
+
+
+def main():
+    max_number = rebuild_image_index()
+    print(f"画像番号インデックスを再構築しました: 最大番号 {max_number:07d} (次の開始番号 {max_number + 1:07d})")
+
+
+if __name__ == "__main__":
+    main()
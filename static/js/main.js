@@ -17,6 +17,13 @@ document.addEventListener('DOMContentLoaded', () => {
     let eventSource = null;
     let selectedFiles = [];
 
+    // 再開可能アップロードの設定
+    // これ以上のサイズのファイルはチャンクに分けて送り、切断されても不足分のみを再送する
+    const RESUMABLE_THRESHOLD = 8 * 1024 * 1024;
+    // GCSの再開可能アップロードではチャンクサイズを256KiBの倍数にする必要がある
+    const RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024;
+    const RESUMABLE_MAX_RETRIES = 5;
+
     // ドラッグ&ドロップ機能
     dropZone.addEventListener('click', () => {
         fileInput.click();
@@ -179,9 +186,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 eventSource.close();
             }
             eventSource = new EventSource(`/api/session-status/${currentSessionId}`);
+            // サーバーは変化した項目のみを送信するため、受信した差分を現在の状態にマージする
+            let sessionState = {};
             eventSource.onmessage = (event) => {
-                const data = JSON.parse(event.data);
-                updateProgress(data);
+                sessionState = { ...sessionState, ...JSON.parse(event.data) };
+                updateProgress(sessionState);
             };
             eventSource.onerror = () => {
                 eventSource.close();
@@ -189,6 +198,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             // すべてのファイルをアップロード
             jobIds = []; // リセット
+            const fileNotifications = []; // ファイルごとのアップロード完了通知
             for (let i = 0; i < selectedFiles.length; i++) {
                 const file = selectedFiles[i];
                 progressText.textContent = `ファイル ${i + 1}/${selectedFiles.length} をアップロード中...`;
@@ -208,7 +218,9 @@ document.addEventListener('DOMContentLoaded', () => {
                         content_type: file.type,
                         dpi: parseInt(dpi),
                         format: "jpeg",
-                        start_number: parseInt(startNumber)
+                        start_number: parseInt(startNumber),
+                        resumable: file.size >= RESUMABLE_THRESHOLD,
+                        size: file.size
                     })
                 });
                 if (!res_upload_job.ok) {
@@ -222,20 +234,39 @@ document.addEventListener('DOMContentLoaded', () => {
                 const fullUrl = uploadUrl.startsWith('/') ? 
                     window.location.origin + uploadUrl : uploadUrl;
 
-                const uploadResponse = await fetch(fullUrl, {
-                    method: 'PUT',
-                    headers: {
-                        'Content-Type': file.type
-                    },
-                    body: file
-                });
+                if (urlData.resumable) {
+                    await uploadResumable(fullUrl, file, (fraction) => {
+                        const progress = 10.0 + 80.0 * ((i + fraction) / selectedFiles.length);
+                        progressBar.style.width = `${progress}%`;
+                        progressPercent.textContent = `${Math.round(progress)}%`;
+                    });
+                } else {
+                    const uploadResponse = await fetch(fullUrl, {
+                        method: 'PUT',
+                        headers: {
+                            'Content-Type': file.type
+                        },
+                        body: file
+                    });
+
+                    if (!uploadResponse.ok) {
+                        throw new Error(`アップロードに失敗しました: ${uploadResponse.status}`);
+                    }
+                }
 
-                if (!uploadResponse.ok) {
-                    throw new Error(`アップロードに失敗しました: ${uploadResponse.status}`);
+                // クラウドモードでは届いたファイルから変換を始めるよう1ファイルずつ通知する
+                // （ローカルモードはサーバーが受信した時点で変換を始める）。次のファイルのアップロードは待たせない
+                if (!uploadUrl.startsWith('/')) {
+                    fileNotifications.push(
+                        fetch(`/api/notify-file-uploaded/${currentSessionId}/${urlData.job_id}`, { method: 'POST' })
+                            .catch((error) => console.warn('File upload notification failed:', error))
+                    );
                 }
             }
 
-            // アップロード完了をバックエンドに通知
+            await Promise.allSettled(fileNotifications);
+
+            // アップロード完了をバックエンドに通知（届いていないファイルがあればここで変換を始める）
             const notifyResponse = await fetch(`/api/notify-upload-complete/${currentSessionId}`, {
                 method: 'POST',
                 headers: {
@@ -264,6 +295,78 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // 308応答のRangeヘッダー（bytes=0-N）から受信済みのバイト数を求める
+    function receivedBytes(response) {
+        const range = response.headers.get('Range');
+        if (!range) {
+            return 0;
+        }
+        return parseInt(range.split('-')[1]) + 1;
+    }
+
+    // 受信済みのバイト数を問い合わせる（完了済みの場合はnull）
+    async function queryReceivedBytes(url, size) {
+        const response = await fetch(url, {
+            method: 'PUT',
+            headers: { 'Content-Range': `bytes */${size}` }
+        });
+        if (response.ok) {
+            return null;
+        }
+        if (response.status !== 308) {
+            throw new Error(`アップロード状況の取得に失敗しました: ${response.status}`);
+        }
+        return receivedBytes(response);
+    }
+
+    // 再開可能アップロード: チャンクごとに送信し、失敗した場合は受信済みの位置を問い合わせて続きから再送する
+    async function uploadResumable(url, file, onProgress) {
+        let offset = 0;
+        let failures = 0;
+        while (offset < file.size) {
+            const end = Math.min(offset + RESUMABLE_CHUNK_SIZE, file.size);
+            let response = null;
+            try {
+                response = await fetch(url, {
+                    method: 'PUT',
+                    headers: { 'Content-Range': `bytes ${offset}-${end - 1}/${file.size}` },
+                    body: file.slice(offset, end)
+                });
+            } catch (error) {
+                console.warn('Chunk upload failed:', error);
+            }
+            if (response && response.ok) {
+                onProgress(1);
+                return;
+            }
+            if (response && response.status === 308) {
+                offset = receivedBytes(response);
+                failures = 0;
+                onProgress(offset / file.size);
+                continue;
+            }
+            // 4xx（429を除く）は再送しても成功しないため中断する
+            if (response && response.status < 500 && response.status !== 429) {
+                throw new Error(`アップロードに失敗しました: ${response.status}`);
+            }
+            failures++;
+            if (failures > RESUMABLE_MAX_RETRIES) {
+                throw new Error('アップロードに失敗しました: 再試行回数の上限に達しました');
+            }
+            await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** (failures - 1)));
+            try {
+                const received = await queryReceivedBytes(url, file.size);
+                if (received === null) {
+                    onProgress(1);
+                    return;
+                }
+                offset = received;
+            } catch (error) {
+                console.warn('Failed to query upload status:', error);
+            }
+        }
+    }
+
     function updateProgress(data) {
         const { status, progress, message } = data;
         
@@ -276,6 +379,7 @@ document.addEventListener('DOMContentLoaded', () => {
             progressDiv.classList.add('hidden');
             resultDiv.classList.remove('hidden');
             document.querySelector('#result p').textContent = '変換が完了しました。画像はGCS_BUCKET_IMAGEに保存されました。';
+            document.getElementById('downloadLink').href = `/api/download/${currentSessionId}`;
             resetUI();
         } else if (status === 'error') {
             eventSource.close();
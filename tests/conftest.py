@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import fitz
+import pytest
+
+from app.core.config import get_settings
+from app.core.session_status import session_status_manager
+from app.models.schemas import SessionStatus
+from app.services import converter
+
+
+@pytest.fixture(autouse=True)
+def isolated_workspace(tmp_path, monkeypatch):
+    """作業スペースと変換画像キャッシュをテストごとの一時ディレクトリに置く（リポジトリ直下に残さない）"""
+    settings = get_settings()
+    monkeypatch.setattr(settings, "workspace_path", str(tmp_path / "workspace"), raising=False)
+    monkeypatch.setattr(settings, "render_cache_dir", str(tmp_path / "render_cache"), raising=False)
+    monkeypatch.setattr(converter, "_local_render_cache", None)
+
+
+@pytest.fixture
+def make_pdf():
+    """指定ページ数のPDFを作成する関数"""
+
+    def make(path, pages):
+        doc = fitz.open()
+        for i in range(pages):
+            page = doc.new_page(width=200, height=300)
+            page.insert_text((20, 40), f"page {i + 1}")
+        doc.save(str(path))
+        doc.close()
+
+    return make
+
+
+@pytest.fixture
+def start_session():
+    """開始画像番号を指定して変換中のセッションを作成する関数"""
+
+    def start(session_id, image_num):
+        session_status_manager.update_status(
+            session_id,
+            SessionStatus(
+                session_id=session_id,
+                status="processing",
+                message="test",
+                progress=0,
+                pdf_num=1,
+                image_num=image_num,
+                created_at=datetime.now(),
+            ),
+        )
+
+    return start
@@ -0,0 +1,51 @@
+import asyncio
+
+from app.services.admission import MemoryBudget
+from app.services.renderer import RenderOptions, estimate_raster_bytes
+
+
+def test_budget_admits_in_arrival_order():
+    async def scenario():
+        budget = MemoryBudget(100)
+        order = []
+        first = await budget.acquire(60)
+
+        async def render(name, nbytes):
+            async with budget.reserve(nbytes):
+                order.append(name)
+
+        # 大きいページが待っている間は、後から来た小さいページも追い越さない
+        large = asyncio.ensure_future(render("large", 80))
+        small = asyncio.ensure_future(render("small", 10))
+        await asyncio.sleep(0)
+        assert order == []
+        budget.release(first)
+        await asyncio.gather(large, small)
+        return order, budget.in_flight
+
+    order, in_flight = asyncio.run(scenario())
+    assert order == ["large", "small"]
+    assert in_flight == 0
+
+
+def test_oversized_page_runs_alone_and_cancelled_waiter_is_removed():
+    async def scenario():
+        budget = MemoryBudget(100)
+        held = await budget.acquire(30)
+        oversized = asyncio.ensure_future(budget.acquire(1000))
+        cancelled = asyncio.ensure_future(budget.acquire(10))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        budget.release(held)
+        acquired = await oversized
+        return acquired, budget.in_flight, len(budget._waiters)
+
+    assert asyncio.run(scenario()) == (100, 100, 0)
+
+
+def test_estimate_follows_downscale_policy():
+    options = RenderOptions(max_pixels=1_000_000)
+    # A4 を300dpiで描画すると約870万画素のため、上限の画素数まで縮小される
+    assert estimate_raster_bytes(595, 842, 300, options) <= 1_000_000 * 3 + 3 * 2000
+    assert estimate_raster_bytes(595, 842, 72, RenderOptions()) == 595 * 842 * 3
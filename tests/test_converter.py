@@ -0,0 +1,418 @@
+import asyncio
+import math
+import os
+
+import fitz
+import pytest
+
+from app.core.session_status import session_status_manager
+from app.services.converter import convert_1pdf_to_images
+from app.services.renderer import EncodeOptions, RenderOptions, plan_page_ranges, plan_page_zoom, render_encoded_page
+
+
+def test_plan_page_ranges():
+    assert plan_page_ranges(0, 8, 2) == []
+    assert plan_page_ranges(5, 8, 2) == [(0, 3), (3, 5)]
+    assert plan_page_ranges(20, 8, 2) == [(0, 8), (8, 16), (16, 20)]
+
+
+def test_plan_page_zoom_keeps_pages_within_pixel_budget():
+    # A0 (2384x3370pt) を300dpiで描画すると約2.8億画素
+    options = RenderOptions(max_pixels=50_000_000)
+    zoom = plan_page_zoom(2384, 3370, 300, options)
+    assert zoom < 300 / 72
+    assert math.ceil(2384 * zoom) * math.ceil(3370 * zoom) <= 50_000_000
+    assert plan_page_zoom(595, 842, 300, options) == 300 / 72
+
+
+def test_auto_grayscale_renders_monochrome_pages_with_one_channel(tmp_path):
+    pdf_path = tmp_path / "mixed.pdf"
+    doc = fitz.open()
+    doc.new_page(width=200, height=300).insert_text((20, 40), "black text")
+    doc.new_page(width=200, height=300).draw_rect(fitz.Rect(50, 50, 60, 60), color=(1, 0, 0), fill=(1, 0, 0))
+    doc.save(str(pdf_path))
+    doc.close()
+    options = RenderOptions(auto_grayscale=True)
+
+    gray = fitz.Pixmap(render_encoded_page(str(pdf_path), 0, 72, "png", options).data)
+    color = fitz.Pixmap(render_encoded_page(str(pdf_path), 1, 72, "png", options).data)
+
+    assert (gray.n, gray.width, gray.height) == (1, 200, 300)
+    assert color.n == 3
+    assert fitz.Pixmap(render_encoded_page(str(pdf_path), 0, 72, "png", RenderOptions()).data).n == 3
+
+
+def test_convert_1pdf_keeps_numbering(tmp_path, monkeypatch, make_pdf, start_session):
+    monkeypatch.setattr("app.services.converter.settings.render_workers", 2, raising=False)
+    monkeypatch.setattr("app.services.converter.settings.render_pages_per_task", 2, raising=False)
+    pdf_path = tmp_path / "doc.pdf"
+    make_pdf(pdf_path, 5)
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    start_session("test-converter", 10)
+
+    _, image_paths = asyncio.run(
+        convert_1pdf_to_images("test-converter", "job", str(pdf_path), 36, "jpeg", str(images_dir))
+    )
+
+    assert [os.path.basename(p) for p in image_paths] == [f"{n:07d}.jpeg" for n in range(10, 15)]
+    assert all(os.path.exists(p) for p in image_paths)
+    assert session_status_manager.get_imagenum("test-converter") == 15
+
+
+def test_convert_1pdf_error_keeps_failures_recorded_by_earlier_pdfs(tmp_path):
+    from datetime import datetime
+
+    from app.core.job_status import job_status_manager
+    from app.models.schemas import JobStatus
+
+    job_status_manager.update_status(
+        "job-error",
+        JobStatus(
+            session_id="s",
+            job_id="job-error",
+            status="processing",
+            message="",
+            progress=50,
+            created_at=datetime.now(),
+            stage_timings={"rasterize": 1.0},
+            failed_uploads=["0000001.jpeg"],
+        ),
+    )
+
+    asyncio.run(convert_1pdf_to_images("s", "job-error", str(tmp_path / "missing.pdf"), 36, "jpeg", str(tmp_path)))
+
+    status = job_status_manager.get_status("job-error")
+    assert status.status == "error"
+    assert status.failed_uploads == ["0000001.jpeg"] and status.stage_timings == {"rasterize": 1.0}
+
+
+def test_page_pipeline_uploads_every_page(tmp_path, make_pdf):
+    from app.services.pipeline import run_page_pipeline
+
+    pdf_path = tmp_path / "doc.pdf"
+    make_pdf(pdf_path, 4)
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    uploaded = []
+    done = []
+
+    rendered, timings = asyncio.run(
+        run_page_pipeline(
+            str(pdf_path),
+            4,
+            36,
+            "jpeg",
+            str(images_dir),
+            1,
+            upload=lambda name, path: uploaded.append(name) or path,
+            on_page_done=lambda page_num, path: done.append(page_num),
+            workers=2,
+            upload_workers=2,
+            queue_size=1,
+        )
+    )
+
+    assert [page_num for page_num, _ in rendered] == [0, 1, 2, 3]
+    assert sorted(uploaded) == [f"{n:07d}.jpeg" for n in range(1, 5)]
+    assert sorted(done) == [0, 1, 2, 3]
+    assert timings.rasterize > 0 and timings.encode > 0 and timings.wall > 0
+
+
+def test_page_pipeline_in_memory_skips_disk(tmp_path, make_pdf):
+    from app.services.pipeline import run_page_pipeline
+
+    pdf_path = tmp_path / "doc.pdf"
+    make_pdf(pdf_path, 2)
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    payloads = {}
+
+    def upload(name, payload):
+        payloads[name] = payload
+        return f"gs://bucket/{name}"
+
+    rendered, _ = asyncio.run(
+        run_page_pipeline(
+            str(pdf_path),
+            2,
+            36,
+            "jpeg",
+            str(images_dir),
+            1,
+            upload=upload,
+            on_page_done=lambda page_num, location: None,
+            workers=1,
+            upload_workers=1,
+            queue_size=1,
+            in_memory=True,
+        )
+    )
+
+    assert rendered == [(0, "gs://bucket/0000001.jpeg"), (1, "gs://bucket/0000002.jpeg")]
+    assert all(isinstance(data, bytes) and data[:2] == b"\xff\xd8" for data in payloads.values())
+    assert list(images_dir.iterdir()) == []
+
+
+def test_page_pipeline_retries_and_reports_failed_uploads(tmp_path, make_pdf):
+    from app.services.pipeline import run_page_pipeline
+
+    pdf_path = tmp_path / "doc.pdf"
+    make_pdf(pdf_path, 3)
+    attempts = {}
+    failed = []
+
+    def flaky_upload(name, payload):
+        attempts[name] = attempts.get(name, 0) + 1
+        # 1枚目は1回目だけ失敗、2枚目は常に失敗
+        if name == "0000002.jpeg" or (name == "0000001.jpeg" and attempts[name] == 1):
+            raise ConnectionError("reset by peer")
+        return f"gs://bucket/{name}"
+
+    rendered, _ = asyncio.run(
+        run_page_pipeline(
+            str(pdf_path),
+            3,
+            36,
+            "jpeg",
+            str(tmp_path),
+            1,
+            upload=flaky_upload,
+            on_page_done=lambda page_num, location: None,
+            workers=1,
+            upload_workers=2,
+            queue_size=1,
+            in_memory=True,
+            upload_retries=2,
+            upload_retry_delay=0.01,
+            on_upload_failed=lambda page_num, name, error: failed.append(name),
+        )
+    )
+
+    assert rendered == [(0, "gs://bucket/0000001.jpeg"), (2, "gs://bucket/0000003.jpeg")]
+    assert failed == ["0000002.jpeg"]
+    assert attempts == {"0000001.jpeg": 2, "0000002.jpeg": 3, "0000003.jpeg": 1}
+
+
+def test_convert_pdfs_honours_format_and_quality(tmp_path, monkeypatch, make_pdf, start_session):
+    from app.services.converter import convert_pdfs_to_images
+
+    monkeypatch.setattr("app.services.converter.settings.workspace_path", str(tmp_path), raising=False)
+    monkeypatch.setattr("app.services.converter.settings.render_cache", False, raising=False)
+    pdf_path = tmp_path / "doc.pdf"
+    make_pdf(pdf_path, 1)
+    outputs = {}
+    for session_id, format, quality in [("test-png", "png", 95), ("test-q95", "jpeg", 95), ("test-q30", "jpeg", 30)]:
+        start_session(session_id, 1)
+        _, image_paths = asyncio.run(
+            convert_pdfs_to_images(session_id, "job", [str(pdf_path)], dpi=72, format=format, encoding=EncodeOptions(quality=quality))
+        )
+        outputs[session_id] = image_paths[0]
+
+    assert outputs["test-png"].endswith("0000001.png")
+    assert open(outputs["test-png"], "rb").read(8) == b"\x89PNG\r\n\x1a\n"
+    assert os.path.getsize(outputs["test-q30"]) < os.path.getsize(outputs["test-q95"])
+
+
+def test_encode_options_reject_unsupported_settings():
+    for format, options in [("tiff", EncodeOptions()), ("jpeg", EncodeOptions(quality=0)), ("jpeg", EncodeOptions(subsampling="4:1:1"))]:
+        with pytest.raises(ValueError):
+            options.validate(format)
+
+
+def test_convert_pdfs_assigns_contiguous_ranges(tmp_path, monkeypatch, make_pdf, start_session):
+    from app.services.converter import convert_pdfs_to_images
+
+    monkeypatch.setattr("app.services.converter.settings.workspace_path", str(tmp_path), raising=False)
+    monkeypatch.setattr("app.services.converter.settings.pdf_concurrency", 3, raising=False)
+    pdf_paths = []
+    for name, pages in [("a", 3), ("b", 1), ("c", 2)]:
+        pdf_path = tmp_path / f"{name}.pdf"
+        make_pdf(pdf_path, pages)
+        pdf_paths.append(str(pdf_path))
+    start_session("test-multi", 100)
+
+    _, image_paths = asyncio.run(convert_pdfs_to_images("test-multi", "job-multi", pdf_paths, dpi=36))
+
+    assert [os.path.basename(p) for p in image_paths] == [f"{n:07d}.jpeg" for n in range(100, 106)]
+    assert session_status_manager.get_imagenum("test-multi") == 106
+
+
+def test_reserved_range_is_committed_before_conversion(start_session):
+    from app.services.converter import _reserve_image_ranges
+    from app.services.storage import get_next_image_number
+
+    start_session("test-reserve", 50)
+
+    assert asyncio.run(_reserve_image_ranges("test-reserve", [3, 2])) == [50, 53]
+    # 変換前でも、新しいセッションは予約済みの範囲の後ろから始まる
+    assert get_next_image_number() == 55
+
+
+def test_convert_pdfs_numbers_in_input_order_when_arriving_out_of_order(tmp_path, monkeypatch, make_pdf, start_session):
+    from app.services.converter import convert_pdfs_to_images
+
+    monkeypatch.setattr("app.services.converter.settings.workspace_path", str(tmp_path), raising=False)
+    pdf_paths = []
+    for name, pages in [("a", 2), ("b", 3)]:
+        pdf_path = tmp_path / f"{name}.pdf"
+        make_pdf(pdf_path, pages)
+        pdf_paths.append(str(pdf_path))
+    start_session("test-arrival", 1)
+
+    async def arrive(pdf_path, delay):
+        await asyncio.sleep(delay)
+        return pdf_path
+
+    async def run():
+        # 2番目のPDFが先に届いても、番号は入力順に割り当てられる
+        sources = [asyncio.ensure_future(arrive(pdf_paths[0], 0.2)), asyncio.ensure_future(arrive(pdf_paths[1], 0))]
+        return await convert_pdfs_to_images("test-arrival", "job-arrival", sources, dpi=36)
+
+    _, image_paths = asyncio.run(run())
+
+    assert [os.path.basename(p) for p in image_paths] == [f"{n:07d}.jpeg" for n in range(1, 6)]
+    assert session_status_manager.get_imagenum("test-arrival") == 6
+
+
+def test_convert_pdfs_from_memory_releases_each_pdf(tmp_path, monkeypatch, make_pdf, start_session):
+    from app.services.converter import convert_pdfs_to_images
+    from app.services.renderer import PdfBuffer
+
+    monkeypatch.setattr("app.services.converter.settings.workspace_path", str(tmp_path), raising=False)
+    buffers = []
+    for name, pages in [("a", 2), ("b", 1)]:
+        pdf_path = tmp_path / f"{name}.pdf"
+        make_pdf(pdf_path, pages)
+        buffers.append(PdfBuffer(name=f"{name}.pdf", data=pdf_path.read_bytes()))
+    start_session("test-memory", 1)
+    released = []
+
+    _, image_paths = asyncio.run(
+        convert_pdfs_to_images("test-memory", "job-memory", buffers, dpi=36, on_pdf_done=released.append)
+    )
+
+    assert [os.path.basename(p) for p in image_paths] == [f"{n:07d}.jpeg" for n in range(1, 4)]
+    assert sorted(buffer.name for buffer in released) == ["a.pdf", "b.pdf"]
+
+
+def test_incremental_ingest_numbers_in_upload_order(tmp_path, monkeypatch, make_pdf, start_session):
+    from app.services.converter import convert_pdfs_to_images
+    from app.services.ingest import SessionIngest
+
+    monkeypatch.setattr("app.services.converter.settings.workspace_path", str(tmp_path), raising=False)
+    pdf_paths = []
+    for name, pages in [("a", 2), ("b", 1), ("c", 3)]:
+        pdf_path = tmp_path / f"{name}.pdf"
+        make_pdf(pdf_path, pages)
+        pdf_paths.append(str(pdf_path))
+    start_session("test-ingest", 1)
+    released = []
+
+    async def run():
+        ingest = SessionIngest("test-ingest", idle_timeout=10, on_pdf_done=released.append)
+        conversion = asyncio.create_task(
+            convert_pdfs_to_images("test-ingest", "job-ingest", ingest, dpi=36, on_pdf_done=ingest.release)
+        )
+        ingest.register("job-a")
+        ingest.register("job-b")
+        # 変換はアップロード中に始まり、後から確保した枠のファイルが先に届いても番号はアップロード順
+        ingest.arrived("job-b", pdf_paths[1])
+        await asyncio.sleep(0.1)
+        ingest.register("job-c")
+        ingest.arrived("job-c", pdf_paths[2])
+        ingest.arrived("job-a", pdf_paths[0])
+        ingest.close()
+        return await conversion
+
+    _, image_paths = asyncio.run(run())
+
+    assert [os.path.basename(p) for p in image_paths] == [f"{n:07d}.jpeg" for n in range(1, 7)]
+    assert session_status_manager.get_imagenum("test-ingest") == 7
+    assert sorted(released) == sorted(pdf_paths)
+
+
+def test_incremental_downloads_do_not_deadlock_when_arriving_out_of_order(tmp_path, monkeypatch, make_pdf, start_session):
+    from app.services.converter import convert_pdfs_to_images
+    from app.services.downloader import ParallelDownloader
+    from app.services.fake_gcs import FakeStorageClient
+    from app.services.ingest import SessionIngest
+
+    monkeypatch.setattr("app.services.converter.settings.workspace_path", str(tmp_path), raising=False)
+    bucket = FakeStorageClient().bucket("works")
+    for i in range(4):
+        make_pdf(tmp_path / f"{i}.pdf", 1)
+        bucket.blob(f"s/j{i}/{i}.pdf").upload_from_string((tmp_path / f"{i}.pdf").read_bytes())
+    blobs = {f"j{i}": bucket.get_blob(f"s/j{i}/{i}.pdf") for i in range(4)}
+    start_session("test-ingest-order", 1)
+
+    async def run():
+        downloader = ParallelDownloader(workers=2, chunk_size=1 << 20, memory_threshold=1 << 20, max_pending=2)
+        ingest = SessionIngest("test-ingest-order", idle_timeout=10, on_pdf_done=downloader.release, arrival_timeout=10)
+        conversion = asyncio.create_task(
+            convert_pdfs_to_images("test-ingest-order", "job-order", ingest, dpi=36, on_pdf_done=ingest.release)
+        )
+        for job_id in blobs:
+            ingest.register(job_id)
+        # 後ろの枠が先に届いても、保持枠を埋めて先頭の枠のダウンロードを止めない
+        for job_id in ["j1", "j2", "j3"]:
+            blob = blobs[job_id]
+            ingest.arrived(job_id, lambda blob=blob: downloader.start([blob], [str(tmp_path / blob.name.replace("/", "_"))])[0])
+        await asyncio.sleep(0.2)
+        blob = blobs["j0"]
+        ingest.arrived("j0", lambda: downloader.start([blob], [str(tmp_path / blob.name.replace("/", "_"))])[0])
+        ingest.close()
+        return await asyncio.wait_for(conversion, 30)
+
+    _, image_paths = asyncio.run(run())
+
+    assert [os.path.basename(p) for p in image_paths] == [f"{n:07d}.jpeg" for n in range(1, 5)]
+
+
+def test_convert_pdfs_streams_zip_members_in_archive_order(tmp_path, monkeypatch, make_pdf, start_session):
+    import zipfile
+
+    from app.services.archive import ZipArchive
+    from app.services.converter import convert_pdfs_to_images
+
+    monkeypatch.setattr("app.services.converter.settings.workspace_path", str(tmp_path), raising=False)
+    monkeypatch.setattr("app.services.converter.settings.pdf_concurrency", 1, raising=False)
+    monkeypatch.setattr("app.services.converter.settings.download_ahead", 0, raising=False)
+    archive_path = tmp_path / "docs.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        for name, pages in [("b/second.pdf", 2), ("a/first.pdf", 1), ("notes.txt", 0)]:
+            if pages:
+                make_pdf(tmp_path / "member.pdf", pages)
+                archive.write(tmp_path / "member.pdf", name)
+            else:
+                archive.writestr(name, "not a pdf")
+    plain_path = tmp_path / "plain.pdf"
+    make_pdf(plain_path, 3)
+    start_session("test-zip", 1)
+    released = []
+    starts = {}
+    original = convert_pdfs_to_images.__globals__["convert_1pdf_to_images"]
+
+    async def record_start(session_id, job_id, pdf_path, *args, imagenum_start=None, **kwargs):
+        starts[os.path.basename(pdf_path).split("-", 1)[-1]] = imagenum_start
+        return await original(session_id, job_id, pdf_path, *args, imagenum_start=imagenum_start, **kwargs)
+
+    monkeypatch.setattr("app.services.converter.convert_1pdf_to_images", record_start)
+
+    _, image_paths = asyncio.run(
+        convert_pdfs_to_images(
+            "test-zip",
+            "job-zip",
+            [ZipArchive(str(archive_path), "docs.zip", on_done=released.append), str(plain_path)],
+            dpi=36,
+        )
+    )
+
+    # アーカイブ内のPDFは格納順、その後に続くファイルはアーカイブの後ろの番号
+    assert [os.path.basename(p) for p in image_paths] == [f"{n:07d}.jpeg" for n in range(1, 7)]
+    assert starts == {"second.pdf": 1, "first.pdf": 3, "plain.pdf": 4}
+    assert session_status_manager.get_imagenum("test-zip") == 7
+    assert released == [str(archive_path)]
+    # 展開したPDFは変換後に削除される
+    archives_dir = tmp_path / "test-zip" / "archives"
+    assert not archives_dir.exists() or list(archives_dir.iterdir()) == []
@@ -0,0 +1,57 @@
+import asyncio
+import os
+
+from app.services.downloader import ParallelDownloader, plan_byte_ranges
+from app.services.fake_gcs import FakeStorageClient
+
+
+def test_plan_byte_ranges():
+    assert plan_byte_ranges(0, 4) == []
+    assert plan_byte_ranges(10, 4) == [(0, 3), (4, 7), (8, 9)]
+    assert plan_byte_ranges(8, 4) == [(0, 3), (4, 7)]
+
+
+def test_parallel_download_with_ranged_chunks(tmp_path):
+    bucket = FakeStorageClient().bucket("works")
+    contents = {"s/j/small.pdf": b"%PDF-small", "s/j/large.pdf": bytes(range(256)) * 40}
+    for name, data in contents.items():
+        bucket.blob(name).upload_from_string(data)
+    blobs = list(bucket.list_blobs(prefix="s/"))
+    local_paths = [str(tmp_path / os.path.basename(blob.name)) for blob in blobs]
+
+    async def run():
+        downloader = ParallelDownloader(workers=3, chunk_size=1000)
+        return await asyncio.gather(*downloader.start(blobs, local_paths))
+
+    assert asyncio.run(run()) == local_paths
+    for blob, local_path in zip(blobs, local_paths):
+        with open(local_path, "rb") as f:
+            assert f.read() == contents[blob.name]
+    assert not any(name.endswith(".part") for name in os.listdir(tmp_path))
+
+
+def test_small_pdfs_stay_in_memory_and_window_is_bounded(tmp_path):
+    from app.services.renderer import PdfBuffer
+
+    bucket = FakeStorageClient().bucket("works")
+    for i in range(4):
+        bucket.blob(f"s/j/{i}.pdf").upload_from_string(b"x" * (10 if i % 2 == 0 else 100))
+    blobs = list(bucket.list_blobs(prefix="s/"))
+    local_paths = [str(tmp_path / os.path.basename(blob.name)) for blob in blobs]
+
+    async def run():
+        downloader = ParallelDownloader(workers=4, chunk_size=1000, memory_threshold=50, max_pending=2)
+        tasks = downloader.start(blobs, local_paths)
+        await asyncio.sleep(0.2)
+        # 解放されるまで3つ目以降はダウンロードされない
+        assert [task.done() for task in tasks] == [True, True, False, False]
+        first, second = tasks[0].result(), tasks[1].result()
+        assert isinstance(first, PdfBuffer) and first.data == b"x" * 10
+        assert second == local_paths[1] and os.path.exists(second)
+        downloader.release(first)
+        downloader.release(second)
+        assert first.data == b"" and not os.path.exists(second)
+        return await asyncio.gather(*tasks[2:])
+
+    third, fourth = asyncio.run(run())
+    assert isinstance(third, PdfBuffer) and fourth == local_paths[3]
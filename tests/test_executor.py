@@ -0,0 +1,29 @@
+import asyncio
+import threading
+import time
+
+from app.core.executor import run_blocking
+
+
+def test_run_blocking_does_not_block_event_loop():
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        thread_name = await run_blocking(lambda: (time.sleep(0.2), threading.current_thread().name)[1])
+        task.cancel()
+        return ticks, thread_name
+
+    ticks, thread_name = asyncio.run(main())
+    assert ticks > 5
+    assert thread_name.startswith("blocking-io")
+
+
+def test_run_blocking_passes_arguments():
+    assert asyncio.run(run_blocking(int, "ff", base=16)) == 255
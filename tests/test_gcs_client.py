@@ -0,0 +1,28 @@
+from app.services import gcs
+from app.services.fake_gcs import FakeStorageClient
+
+
+def test_storage_client_is_shared(monkeypatch):
+    monkeypatch.setattr("app.services.gcs.get_settings", lambda: _settings(gcs_backend="fake"))
+    gcs.reset_storage_client()
+    try:
+        client = gcs.get_storage_client()
+        assert isinstance(client, FakeStorageClient)
+        assert gcs.get_storage_client() is client
+
+        client.bucket("works").blob("a/b.pdf").upload_from_string(b"%PDF")
+        assert gcs.get_storage_client().bucket("works").get_blob("a/b.pdf").size == 4
+    finally:
+        gcs.reset_storage_client()
+
+
+def test_resolve_pool_size(monkeypatch):
+    monkeypatch.setattr("app.services.gcs.get_settings", lambda: _settings(io_workers=8, upload_workers=4))
+    assert gcs.resolve_pool_size(0) == 12
+    assert gcs.resolve_pool_size(32) == 32
+
+
+def _settings(**overrides):
+    from app.core.config import get_settings
+
+    return get_settings().model_copy(update=overrides)
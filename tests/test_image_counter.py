@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app.core.image_counter import InMemoryImageCounter, SQLiteImageCounter
+from app.core.session_status import SessionStatusManager
+from app.models.schemas import SessionStatus
+
+
+def _reserve_many(counters, session_id, per_worker):
+    def worker(counter):
+        return [counter.reserve(session_id, 3) for _ in range(per_worker)]
+
+    with ThreadPoolExecutor(max_workers=len(counters)) as executor:
+        return [r for ranges in executor.map(worker, counters) for r in ranges]
+
+
+def _assert_disjoint(ranges, start, total):
+    numbers = sorted(n for s, e in ranges for n in range(s, e))
+    assert numbers == list(range(start, start + total))
+
+
+def test_in_memory_reserve_is_atomic():
+    counter = InMemoryImageCounter()
+    counter.initialize("s", 1)
+    ranges = _reserve_many([counter] * 8, "s", 50)
+    _assert_disjoint(ranges, 1, 8 * 50 * 3)
+    assert counter.get("s") == 1 + 8 * 50 * 3
+
+
+def test_sqlite_reserve_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "counter.sqlite3")
+    counters = [SQLiteImageCounter(path) for _ in range(4)]
+    counters[0].initialize("s", 10)
+    counters[1].initialize("s", 999)  # 既存のカウンタは上書きされない
+    ranges = _reserve_many(counters, "s", 20)
+    _assert_disjoint(ranges, 10, 4 * 20 * 3)
+    assert SQLiteImageCounter(path).get("s") == 10 + 4 * 20 * 3
+
+
+def test_session_manager_reserve_range():
+    manager = SessionStatusManager(counter=InMemoryImageCounter())
+    manager.update_status(
+        "s",
+        SessionStatus(
+            session_id="s",
+            status="uploading",
+            message="",
+            progress=0,
+            pdf_num=1,
+            image_num=5,
+            created_at=datetime.now(),
+        ),
+    )
+    assert manager.reserve_range("s", 4) == (5, 9)
+    assert manager.reserve_range("s", 2) == (9, 11)
+    assert manager.get_status("s").image_num == 11
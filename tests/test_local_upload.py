@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from app.services.local_upload import (
+    UploadOffsetMismatchError,
+    UploadTooLargeError,
+    append_stream,
+    complete_upload,
+    file_sha256,
+    parse_content_range,
+    received_bytes,
+    save_stream,
+)
+
+
+async def _chunks(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_save_stream_writes_in_chunks(tmp_path):
+    data = bytes(range(256)) * 100
+    path = tmp_path / "doc.pdf"
+
+    size, sha256 = asyncio.run(save_stream(_chunks(data, 1000), str(path), max_bytes=len(data), chunk_size=4096))
+
+    assert size == len(data)
+    assert sha256 == hashlib.sha256(data).hexdigest()
+    assert path.read_bytes() == data
+    assert not (tmp_path / "doc.pdf.part").exists()
+
+
+def test_save_stream_rejects_oversized_upload(tmp_path):
+    path = tmp_path / "doc.pdf"
+
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_stream(_chunks(b"x" * 5000, 1000), str(path), max_bytes=4000))
+
+    assert list(tmp_path.iterdir()) == []
+
+
+async def _interrupted(data, size, fail_after):
+    sent = 0
+    for start in range(0, len(data), size):
+        if sent >= fail_after:
+            raise ConnectionResetError("client disconnected")
+        yield data[start:start + size]
+        sent += size
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 0-99/1000") == (0, 99, 1000)
+    assert parse_content_range("bytes 100-199/*") == (100, 199, None)
+    assert parse_content_range("bytes */1000") == (None, None, 1000)
+    with pytest.raises(ValueError):
+        parse_content_range("bytes 100-99/1000")
+    with pytest.raises(ValueError):
+        parse_content_range("bytes 0-1000/1000")
+    with pytest.raises(ValueError):
+        parse_content_range("bytes */*")
+
+
+def test_append_stream_resumes_after_disconnect(tmp_path):
+    data = bytes(range(256)) * 40
+    path = str(tmp_path / "doc.pdf")
+
+    async def scenario():
+        # 1回目のチャンクが途中で切断されても受信済みの分は残る
+        with pytest.raises(ConnectionResetError):
+            await append_stream(_interrupted(data[:6000], 1000, 3000), path, 0, len(data), chunk_size=4096)
+        assert received_bytes(path) == 3000
+
+        # 受信済みの位置より後ろからは再開できない
+        with pytest.raises(UploadOffsetMismatchError) as exc:
+            await append_stream(_chunks(data[4000:], 1000), path, 4000, len(data))
+        assert exc.value.offset == 3000
+
+        # 受信済みの範囲と重なる再送は読み捨てて続きから追記する
+        offset = await append_stream(_chunks(data[2500:7000], 700), path, 2500, len(data))
+        assert offset == 7000
+        assert not (tmp_path / "doc.pdf").exists()
+
+        offset = await append_stream(_chunks(data[7000:], 1000), path, 7000, len(data))
+        assert offset == len(data)
+        return await file_sha256(path)
+
+    sha256 = asyncio.run(scenario())
+
+    assert (tmp_path / "doc.pdf").read_bytes() == data
+    assert not (tmp_path / "doc.pdf.part").exists()
+    assert sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_upload_sent_with_unknown_total_completes_on_query(tmp_path):
+    data = bytes(range(256)) * 10
+    path = str(tmp_path / "doc.pdf")
+
+    async def scenario():
+        # 総サイズ不明のチャンクだけでは完了しない
+        assert await append_stream(_chunks(data[:1000], 500), path, 0, None) == 1000
+        assert await append_stream(_chunks(data[1000:], 500), path, 1000, None) == len(data)
+        assert not (tmp_path / "doc.pdf").exists()
+        # 総サイズ付きの問い合わせで、受信済みのデータが揃っていれば完了する
+        assert await complete_upload(path, len(data) + 1) == len(data)
+        assert not (tmp_path / "doc.pdf").exists()
+        assert await complete_upload(path, len(data)) == len(data)
+
+    asyncio.run(scenario())
+
+    assert (tmp_path / "doc.pdf").read_bytes() == data
+    assert not (tmp_path / "doc.pdf.part").exists()
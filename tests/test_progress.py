@@ -0,0 +1,60 @@
+from app.core.job_status import JobStatusManager
+from app.services.progress import ProgressReporter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_reporter_coalesces_updates():
+    manager = JobStatusManager()
+    clock = FakeClock()
+    reporter = ProgressReporter("s", "j", 1000, min_interval=1.0, min_delta=5.0, manager=manager, clock=clock)
+
+    assert reporter.advance() is True  # 初回は必ず反映
+    status = manager.get_status("j")
+    for _ in range(98):
+        clock.now += 0.01
+        assert reporter.advance() is False
+    clock.now = 2.0
+    assert reporter.advance() is True  # 10%進んで1秒経過
+
+    # 2回目以降は同じJobStatusを更新する（状態ストアからは毎回新しいオブジェクトとして読み出される）
+    updated = manager.get_status("j")
+    assert updated.created_at == status.created_at
+    assert updated.progress == 10.0
+    assert updated.message == "ページ変換完了: 100/1000"
+    assert reporter.published == 2 and reporter.skipped == 98
+
+
+def test_reporter_always_publishes_last_page():
+    manager = JobStatusManager()
+    clock = FakeClock()
+    reporter = ProgressReporter("s", "j", 3, min_interval=100.0, min_delta=100.0, manager=manager, clock=clock)
+    reporter.advance()
+    reporter.advance()
+    reporter.advance()
+    assert manager.get_status("j").progress == 100.0
+    reporter.flush()
+    assert reporter.published == 2
+
+
+def test_reporter_with_growing_total_never_moves_backwards():
+    manager = JobStatusManager()
+    clock = FakeClock()
+    reporter = ProgressReporter("s", "j", 0, min_interval=0.0, min_delta=0.0, manager=manager, clock=clock, total_known=False)
+    reporter.add_total(2)
+    reporter.advance(2)
+    # 後続のPDFがあり得るうちは完了と表示しない
+    assert manager.get_status("j").progress == 99.0
+    reporter.add_total(8)
+    reporter.advance()
+    assert manager.get_status("j").progress == 99.0
+    assert manager.get_status("j").message == "ページ変換完了: 3/10"
+    reporter.finish_total()
+    reporter.advance(7)
+    assert manager.get_status("j").progress == 100.0
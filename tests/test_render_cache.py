@@ -0,0 +1,60 @@
+import asyncio
+import os
+
+from app.services import converter
+from app.services.converter import convert_1pdf_to_images
+from app.services.render_cache import LocalRenderCache, render_cache_key
+
+
+def _write_images(directory, count, size):
+    directory.mkdir()
+    paths = []
+    for i in range(count):
+        path = directory / f"{i:07d}.jpeg"
+        path.write_bytes(bytes([i]) * size)
+        paths.append(str(path))
+    return paths
+
+
+def test_cache_key_changes_with_render_settings():
+    base = render_cache_key("abc", 300, "jpeg")
+    assert base == render_cache_key("abc", 300, "jpeg", {})
+    assert base != render_cache_key("abc", 200, "jpeg")
+    assert base != render_cache_key("abc", 300, "jpeg", {"quality": 80})
+
+
+def test_local_cache_evicts_least_recently_used(tmp_path):
+    cache = LocalRenderCache(str(tmp_path / "cache"), max_bytes=2500)
+    cache.put("a" * 64, _write_images(tmp_path / "a", 2, 500), "jpeg")
+    cache.put("b" * 64, _write_images(tmp_path / "b", 2, 500), "jpeg")
+    assert cache.get("a" * 64, 2, "jpeg") is not None  # a を使用済みにする
+
+    cache.put("c" * 64, _write_images(tmp_path / "c", 2, 500), "jpeg")
+
+    assert cache.get("b" * 64, 2, "jpeg") is None
+    cached = cache.get("a" * 64, 2, "jpeg")
+    assert [open(p, "rb").read() for p in cached] == [bytes([0]) * 500, bytes([1]) * 500]
+    # 再起動後もディスク上のエントリから使用順を復元する
+    assert LocalRenderCache(str(tmp_path / "cache"), max_bytes=2500).get("c" * 64, 2, "jpeg") is not None
+
+
+def test_convert_restores_resubmitted_pdf_without_rendering(tmp_path, monkeypatch, make_pdf, start_session):
+    pdf_path = tmp_path / "doc.pdf"
+    make_pdf(pdf_path, 3)
+    first_dir = tmp_path / "first"
+    first_dir.mkdir()
+    start_session("test-cache-first", 1)
+    _, first = asyncio.run(convert_1pdf_to_images("test-cache-first", "job", str(pdf_path), 36, "jpeg", str(first_dir)))
+
+    async def no_render(*args, **kwargs):
+        raise AssertionError("cached PDF must not be rendered")
+        yield
+
+    monkeypatch.setattr(converter, "iter_rendered_pages", no_render)
+    second_dir = tmp_path / "second"
+    second_dir.mkdir()
+    start_session("test-cache-second", 50)
+    _, second = asyncio.run(convert_1pdf_to_images("test-cache-second", "job", str(pdf_path), 36, "jpeg", str(second_dir)))
+
+    assert [os.path.basename(p) for p in second] == ["0000050.jpeg", "0000051.jpeg", "0000052.jpeg"]
+    assert [open(p, "rb").read() for p in second] == [open(p, "rb").read() for p in first]
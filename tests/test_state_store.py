@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime
+
+from app.core.image_counter import SQLiteImageCounter
+from app.core.job_status import JobStatusManager
+from app.core.session_status import SessionStatusManager
+from app.core.state_store import InMemoryStateStore, SQLiteStateStore
+from app.models.schemas import JobStatus, SessionStatus
+
+
+def _job_status(progress):
+    return JobStatus(
+        session_id="s",
+        job_id="j",
+        status="processing",
+        message="",
+        progress=progress,
+        created_at=datetime.now(),
+    )
+
+
+def test_in_memory_delete_is_claimed_once():
+    store = InMemoryStateStore()
+    store.put("pending", "j", "[]")
+    assert store.put_if_absent("pending", "j", "[1]") is False
+    assert store.delete("pending", "j") is True
+    assert store.delete("pending", "j") is False
+    assert store.get("pending", "j") is None
+
+
+def test_sqlite_status_is_shared_between_stores(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    writer = JobStatusManager(store=SQLiteStateStore(path))
+    reader = JobStatusManager(store=SQLiteStateStore(path))
+
+    writer.update_status("j", _job_status(10))
+    writer.update_progress("j", 55.0, "half")
+
+    status = reader.get_status("j")
+    assert status.progress == 55.0
+    assert status.message == "half"
+    writer.delete_status("j")
+    assert reader.get_status("j") is None
+
+
+def test_sqlite_wait_wakes_on_update_from_other_store(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    writer = SQLiteStateStore(path)
+    reader = SQLiteStateStore(path, poll_interval=0.01)
+
+    async def scenario():
+        version = reader.version("job", "j")
+        waiter = asyncio.create_task(reader.wait("job", "j", version, timeout=5))
+        await asyncio.sleep(0.05)
+        writer.put("job", "j", "{}")
+        return version, await asyncio.wait_for(waiter, 2)
+
+    try:
+        version, new_version = asyncio.run(scenario())
+    finally:
+        reader.close()
+    assert new_version != version
+
+
+def test_session_image_range_is_shared_between_stores(tmp_path):
+    counter_path = str(tmp_path / "counter.sqlite3")
+    state_path = str(tmp_path / "state.sqlite3")
+    first = SessionStatusManager(counter=SQLiteImageCounter(counter_path), store=SQLiteStateStore(state_path))
+    second = SessionStatusManager(counter=SQLiteImageCounter(counter_path), store=SQLiteStateStore(state_path))
+    first.update_status(
+        "s",
+        SessionStatus(
+            session_id="s",
+            status="uploading",
+            message="",
+            progress=0,
+            pdf_num=1,
+            image_num=5,
+            created_at=datetime.now(),
+        ),
+    )
+
+    assert second.reserve_range("s", 4) == (5, 9)
+    assert first.get_status("s").image_num == 9
+    assert first.get_image_range("s") == (5, 9)
+
+
+def test_sqlite_update_does_not_lose_concurrent_changes(tmp_path):
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+
+    path = str(tmp_path / "state.sqlite3")
+    stores = [SQLiteStateStore(path) for _ in range(4)]
+
+    def append(args):
+        store, n = args
+        store.update("pending", "j", lambda value: json.dumps((json.loads(value) if value else []) + [n]))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(append, [(stores[n % 4], n) for n in range(40)]))
+
+    assert sorted(json.loads(stores[0].get("pending", "j"))) == list(range(40))
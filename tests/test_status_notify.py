@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime
+
+from app.api.upload import _job_status_to_dict, _status_event_stream
+from app.core.job_status import JobStatusManager
+from app.models.schemas import JobStatus
+
+
+def _job_status(status, progress, message="m"):
+    return JobStatus(
+        session_id="s",
+        job_id="j",
+        status=status,
+        progress=progress,
+        message=message,
+        created_at=datetime(2024, 1, 1),
+    )
+
+
+def test_wait_for_change_wakes_on_update():
+    manager = JobStatusManager()
+
+    async def main():
+        version = manager.get_version("j")
+        waiter = asyncio.create_task(manager.wait_for_change("j", version, timeout=5))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        manager.update_status("j", _job_status("processing", 10))
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(main()) == 1
+
+
+def test_wait_for_change_times_out():
+    manager = JobStatusManager()
+    assert asyncio.run(manager.wait_for_change("j", 0, timeout=0.01)) == 0
+
+
+def test_event_stream_sends_deltas_only(monkeypatch):
+    monkeypatch.setattr("app.api.upload.settings.sse_heartbeat_interval", 0.01, raising=False)
+    manager = JobStatusManager()
+    manager.update_status("j", _job_status("processing", 10))
+
+    async def main():
+        events = []
+        stream = _status_event_stream(manager, "j", _job_status_to_dict)
+        events.append(await stream.__anext__())
+        events.append(await stream.__anext__())  # 変化がないためハートビート
+        manager.update_status("j", _job_status("processing", 50))
+        events.append(await stream.__anext__())
+        manager.update_status("j", _job_status("completed", 100, "done"))
+        events.extend([event async for event in stream])
+        return events
+
+    events = asyncio.run(main())
+    assert events[0].startswith("data: ") and '"status": "processing"' in events[0]
+    assert events[1] == ": heartbeat\n\n"
+    assert events[2] == 'data: {"progress": 50.0}\n\n'
+    assert events[3] == 'data: {"status": "completed", "message": "done", "progress": 100.0}\n\n'
+    assert len(events) == 4
+
+
+def test_update_progress_notifies_without_rewriting_status():
+    manager = JobStatusManager()
+    manager.update_status("j", _job_status("processing", 10))
+    version = manager.get_version("j")
+    status = manager.get_status("j")
+    status.progress = 99  # 取得したステータスを変更しても保持している値は変わらない
+
+    manager.update_progress("j", 20, "m2")
+
+    assert manager.get_version("j") == version + 1
+    assert (manager.get_status("j").progress, manager.get_status("j").message) == (20, "m2")
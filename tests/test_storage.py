@@ -11,6 +11,19 @@ def test_max_number_in_path(tmp_path):
     assert _max_number_in_path(str(tmp_path)) == 5
 
 
+def test_scan_skips_render_cache(tmp_path, monkeypatch):
+    from app.services.storage import _scan_max_image_number
+
+    (tmp_path / "0000007.jpeg").write_text("a")
+    cache_entry = tmp_path / "render_cache" / "key"
+    cache_entry.mkdir(parents=True)
+    (cache_entry / "000500.jpeg").write_text("a")
+    monkeypatch.setattr("app.services.storage.settings.workspace_path", str(tmp_path), raising=False)
+    monkeypatch.setattr("app.services.storage.settings.render_cache_dir", "", raising=False)
+    monkeypatch.setattr("app.services.storage.settings.gcp_region", "local", raising=False)
+    assert _scan_max_image_number() == 7
+
+
 def test_get_next_image_number_local(tmp_path, monkeypatch):
     (tmp_path / "0000007.jpeg").write_text("a")
     monkeypatch.setattr(
@@ -18,3 +31,76 @@ def test_get_next_image_number_local(tmp_path, monkeypatch):
     )
     monkeypatch.setattr("app.services.storage.settings.gcp_region", "local", raising=False)
     assert get_next_image_number() == 8
+
+
+def test_get_next_image_number_uses_index(tmp_path, monkeypatch):
+    from app.services.storage import commit_image_number, rebuild_image_index
+
+    (tmp_path / "0000007.jpeg").write_text("a")
+    monkeypatch.setattr(
+        "app.services.storage.settings.workspace_path", str(tmp_path), raising=False
+    )
+    monkeypatch.setattr("app.services.storage.settings.gcp_region", "local", raising=False)
+    assert get_next_image_number() == 8
+
+    # インデックス作成後は走査せずにインデックスの値を使う
+    (tmp_path / "0000020.jpeg").write_text("a")
+    assert get_next_image_number() == 8
+    commit_image_number(12)
+    assert get_next_image_number() == 13
+    commit_image_number(9)
+    assert get_next_image_number() == 13
+
+    assert rebuild_image_index() == 20
+    assert get_next_image_number() == 21
+
+
+def test_gcs_image_index_with_fake_client(tmp_path):
+    from app.services.fake_gcs import FakeStorageClient
+    from app.services.image_index import GCSImageNumberIndex
+
+    for client in (FakeStorageClient(), FakeStorageClient(root_dir=str(tmp_path))):
+        index = GCSImageNumberIndex(client, "works", "_index/image_high_water_mark")
+        assert index.get() is None
+        index.commit(10)
+        index.commit(4)
+        assert index.get() == 10
+        index.reset(3)
+        assert index.get() == 3
+
+
+def test_get_next_image_number_scans_when_index_fails(tmp_path, monkeypatch):
+    class BrokenIndex:
+        def get(self):
+            raise RuntimeError("index unavailable")
+
+    (tmp_path / "0000007.jpeg").write_text("a")
+    monkeypatch.setattr("app.services.storage.settings.workspace_path", str(tmp_path), raising=False)
+    monkeypatch.setattr("app.services.storage.settings.gcp_region", "local", raising=False)
+    monkeypatch.setattr("app.services.storage.get_image_index", lambda path=None: BrokenIndex())
+    # 1から振り直さず、保存済みの画像の続きから始める
+    assert get_next_image_number() == 8
+
+
+def test_gcs_image_index_reads_value_committed_after_lookup():
+    from types import SimpleNamespace
+
+    from app.services.fake_gcs import FakeStorageClient
+    from app.services.image_index import GCSImageNumberIndex
+
+    client = FakeStorageClient()
+    index = GCSImageNumberIndex(client, "works", "_index/image_high_water_mark")
+    index.commit(10)
+    bucket = client.bucket("works")
+    get_blob = bucket.get_blob
+
+    def get_blob_then_commit(name, **kwargs):
+        # 参照した直後に他のインスタンスが更新する（GCSのBlobと同じく世代は取得時点の値）
+        blob = get_blob(name, **kwargs)
+        snapshot = SimpleNamespace(generation=blob.generation, download_as_text=blob.download_as_text)
+        GCSImageNumberIndex(client, "works", name).commit(20)
+        return snapshot
+
+    bucket.get_blob = get_blob_then_commit
+    index._bucket = lambda: bucket
+    assert index.get() == 20
@@ -0,0 +1,66 @@
+import asyncio
+import io
+import zipfile
+
+from app.services.zip_export import ZipEntry, ZipLayout, iter_live_zip
+
+
+def _entry(name, data):
+    return ZipEntry(
+        name=name,
+        size=len(data),
+        mtime=1700000000,
+        key=(name, len(data)),
+        read=lambda start, end: data[start:end],
+    )
+
+
+def _images():
+    return {f"{i:07d}.jpg": bytes([i]) * (1000 + 37 * i) for i in range(5)}
+
+
+async def _collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+def test_layout_builds_stored_zip_of_declared_size():
+    images = _images()
+    layout = ZipLayout([_entry(name, data) for name, data in images.items()])
+
+    archive = asyncio.run(_collect(layout.iter_range(chunk_size=256)))
+
+    assert len(archive) == layout.size
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.namelist() == list(images)
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+        assert zf.testzip() is None
+        for name, data in images.items():
+            assert zf.read(name) == data
+
+
+def test_layout_range_matches_slice_of_full_archive():
+    images = _images()
+    layout = ZipLayout([_entry(name, data) for name, data in images.items()])
+    archive = asyncio.run(_collect(layout.iter_range()))
+
+    for start, end in [(0, 10), (25, 1500), (1100, layout.cd_offset + 7), (layout.cd_offset - 3, layout.size), (layout.size - 1, layout.size)]:
+        assert asyncio.run(_collect(layout.iter_range(start, end, chunk_size=100))) == archive[start:end]
+
+
+def test_live_zip_matches_layout_once_finished():
+    images = _images()
+    entries = [_entry(name, data) for name, data in images.items()]
+    available = []
+
+    async def list_entries():
+        return list(available)
+
+    async def wait_for_more():
+        if len(available) == len(entries):
+            return False
+        available.append(entries[len(available)])
+        return True
+
+    live = asyncio.run(_collect(iter_live_zip(list_entries, wait_for_more)))
+
+    assert live == asyncio.run(_collect(ZipLayout(entries).iter_range()))